@@ -21,10 +21,31 @@ def create_app(mdict_dir="content"):
 
     app = Flask(__name__, template_folder=None, static_folder=None)
     app.config["MDICT_DIR"] = mdict_dir
+    # set True to cache resources in MDICT_RESOURCE_CACHE_SIZE bytes
+    # and scoped css beside the index dbs
     app.config["MDICT_CACHE"] = False
+    app.config["MDICT_RESOURCE_CACHE_SIZE"] = 16 * 1024 * 1024
     app.config["SECRET_KEY"] = "21ffjfdlsafj2ofjaslfjdsaf"
     app.config["APP_DB"] = os.path.join(mdict_dir, "flask_mdict.db")
     app.config["INDEX_DIR"] = None
+    app.config["MDICT_POOL_SIZE"] = 4
+    app.config["MDICT_POOL_TIMEOUT"] = 10
+    # build out of date index dbs in parallel, e.g. os.cpu_count()
+    app.config["MDICT_INDEX_WORKERS"] = 1
+    app.config["MDICT_LAZY_INIT"] = False
+    app.config["MDICT_KEY_FOLD"] = "case"
+    app.config["MDICT_PRERENDER"] = False
+    app.config["MDICT_SUGGEST_INDEX"] = True
+    app.config["MDICT_SUGGEST_LIMIT"] = 100
+    app.config["MDICT_BATCH_LIMIT"] = 200
+    app.config["MDICT_QUERY_WORKERS"] = 0
+    app.config["MDICT_QUERY_TIMEOUT"] = 10
+    app.config["MDICT_RESOURCE_MAX_AGE"] = 24 * 3600
+    app.config["MDICT_BLOCK_CACHE_SIZE"] = 32 * 1024 * 1024
+    # share decompressed blocks between gunicorn workers, e.g. /dev/shm/flask_mdict
+    app.config["MDICT_BLOCK_CACHE_DIR"] = None
+    app.config["MDICT_PAGE_CACHE_SIZE"] = 16 * 1024 * 1024
+    app.config["MDICT_PAGE_CACHE_DIR"] = None
     app.config["APP_NAME"] = "Flask Mdict"
     app.config["PREFERRED_URL_SCHEME"] = "http" if app.debug else "https"
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
@@ -0,0 +1,45 @@
+"""
+time fast_decrypt against the byte loop it replaced
+
+    python benchmarks/bench_decrypt.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask_mdict.word_query.crypto import fast_decrypt  # noqa: E402
+
+
+def loop_decrypt(data, key):
+    b = bytearray(data)
+    key = bytearray(key)
+    previous = 0x36
+    for i in range(len(b)):
+        t = (b[i] >> 4 | b[i] << 4) & 0xff
+        t = t ^ previous ^ (i & 0xff) ^ key[i % len(key)]
+        previous = b[i]
+        b[i] = t
+    return bytes(b)
+
+
+def best(func, number):
+    return min(timeit.repeat(func, number=number, repeat=5)) / number
+
+
+def main():
+    key = os.urandom(16)
+    for size in (1024, 64 * 1024, 1024 * 1024):
+        data = os.urandom(size)
+        number = max(1, 1024 * 1024 // size)
+        old = best(lambda: loop_decrypt(data, key), number)
+        new = best(lambda: fast_decrypt(data, key), number * 10)
+        print(
+            "%8d bytes: loop %8.3f ms  fast_decrypt %8.4f ms  x%.0f"
+            % (size, old * 1e3, new * 1e3, old / new)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+time fix_html on long multi-sense entries against the previous version,
+which removed matched tags from lists one at a time
+
+    python benchmarks/bench_fix_html.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask_mdict.utils import fix_html, regex_opened_tag, regex_closed_tag  # noqa
+
+
+def list_fix_html(html_data):
+    opened_tags = regex_opened_tag.findall(html_data)
+    closed_tags = regex_closed_tag.findall(html_data)
+    opened_tags = [tag.lower() for tag in opened_tags]
+    closed_tags = [tag.lower() for tag in closed_tags]
+    for tag in ["img", "link", "input", "br", "hr", "p", "meta"]:
+        while tag in opened_tags:
+            opened_tags.remove(tag)
+        while tag in closed_tags:
+            closed_tags.remove(tag)
+    if len(opened_tags) == len(closed_tags):
+        return html_data
+    for tag in opened_tags[::-1]:
+        if tag in closed_tags:
+            closed_tags.remove(tag)
+        else:
+            html_data += "</%s>" % tag
+    for tag in closed_tags:
+        html_data = "<%s>" % tag + html_data
+    return html_data
+
+
+sense = (
+    '<div class="sense"><span class="num">%d</span><b>def</b> <i>ex</i><br>'
+    '<p>text<div class="ex"><span>e</span></div></div>'
+)
+
+
+def best(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    for senses in (50, 500, 2000):
+        html_data = "</i></span>" + "".join(sense % i for i in range(senses))
+        html_data += "<div><span><b>"
+        assert fix_html(html_data) == list_fix_html(html_data)
+        number = max(1, 1000 // senses)
+        old = best(lambda: list_fix_html(html_data), number)
+        new = best(lambda: fix_html(html_data), number * 10)
+        print(
+            "%5d senses %7d chars: previous %8.3f ms  fix_html %7.3f ms"
+            % (senses, len(html_data), old * 1e3, new * 1e3)
+        )
+
+
+if __name__ == "__main__":
+    main()
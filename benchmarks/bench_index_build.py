@@ -0,0 +1,69 @@
+"""
+time the index db build of an mdx file. keys are read from the mdx once
+beforehand, so only the db side of the build is timed. every build is run
+through IndexBuilder._bulk_load and, as a baseline, through a plain sqlite
+connection to the db file with default pragmas.
+
+    python benchmarks/bench_index_build.py dict.mdx [runs]
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask_mdict.mdict_query2 import IndexBuilder2  # noqa: E402
+from flask_mdict.word_query import readmdict  # noqa: E402
+
+
+@contextmanager
+def plain_load(self, db_name):
+    """cursor of db_name written in place, journal, sync and cache as default"""
+    conn = sqlite3.connect(db_name)
+    try:
+        yield conn.cursor()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def build_times(mdx_file, runs):
+    """(seconds of each build, db size)"""
+    times = []
+    for _ in range(runs):
+        index_dir = tempfile.mkdtemp()
+        try:
+            builder = IndexBuilder2(mdx_file, index_dir=index_dir, build=False)
+            start = time.perf_counter()
+            builder.build_index(mdx_file)
+            times.append(time.perf_counter() - start)
+            db_name = builder.get_index_db(mdx_file, index_dir)
+            size = os.path.getsize(db_name)
+            builder.close()
+        finally:
+            shutil.rmtree(index_dir)
+    return times, size
+
+
+def main():
+    mdx_file = sys.argv[1]
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    rows = list(readmdict.MDX(mdx_file).iter_index())
+    readmdict.MDX.iter_index = lambda self: iter(rows)
+    bulk_load = IndexBuilder2._bulk_load
+    for name, load in [("bulk load", bulk_load), ("baseline", plain_load)]:
+        IndexBuilder2._bulk_load = load
+        times, size = build_times(mdx_file, runs)
+        print(
+            "%s, %d keys: best %.2fs of %d runs, db %.1f MB"
+            % (name, len(rows), min(times), runs, size / 1e6)
+        )
+    IndexBuilder2._bulk_load = bulk_load
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+time MDict._split_key_block on a synthetic key block against the previous
+loop, which compared one byte or one utf-16 pair at a time
+
+    python benchmarks/bench_key_block.py [keys]
+"""
+import os
+import sys
+import time
+from struct import pack, unpack
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask_mdict.word_query.readmdict import MDict  # noqa: E402
+
+
+def loop_split_key_block(self, key_block):
+    key_list = []
+    key_start_index = 0
+    while key_start_index < len(key_block):
+        key_id = unpack(self._number_format, key_block[key_start_index:key_start_index+self._number_width])[0]
+        if self._encoding == 'UTF-16':
+            delimiter = b'\x00\x00'
+            width = 2
+        else:
+            delimiter = b'\x00'
+            width = 1
+        i = key_start_index + self._number_width
+        while i < len(key_block):
+            if key_block[i:i+width] == delimiter:
+                key_end_index = i
+                break
+            i += width
+        key_text = key_block[key_start_index+self._number_width:key_end_index]\
+            .decode(self._encoding, errors='ignore').encode('utf-8').strip()
+        key_start_index = key_end_index + width
+        key_list += [(key_id, key_text)]
+    return key_list
+
+
+def key_reader(encoding):
+    # only the attributes used to split key blocks, no file is read
+    mdict = MDict.__new__(MDict)
+    mdict._encoding = encoding
+    mdict._number_width = 8
+    mdict._number_format = '>Q'
+    return mdict
+
+
+def key_block(encoding, keys):
+    if encoding == 'UTF-16':
+        codec, delimiter = 'utf-16-le', b'\x00\x00'
+    else:
+        codec, delimiter = encoding, b'\x00'
+    return b''.join(
+        pack('>Q', i * 100) + key.encode(codec) + delimiter
+        for i, key in enumerate(keys)
+    )
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    keys = ['headword%07d' % i for i in range(count)]
+    for encoding in ('UTF-8', 'UTF-16', 'GB18030'):
+        mdict = key_reader(encoding)
+        block = key_block(encoding, keys)
+        old, old_seconds = timed(loop_split_key_block, mdict, block)
+        new, new_seconds = timed(mdict._split_key_block, block)
+        assert old == new
+        print(
+            '%-8s %d keys: previous %.2fs  _split_key_block %.2fs'
+            % (encoding, count, old_seconds, new_seconds)
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+time LZO decompression of 64 KiB blocks of dictionary-like html with each
+backend of word_query.compression. the blocks are compressed with
+lzallright or python-lzo, one of them has to be installed.
+
+    python benchmarks/bench_lzo.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask_mdict.word_query import compression  # noqa: E402
+
+block_size = 64 * 1024
+
+
+def compressor():
+    if compression._lzallright is not None:
+        return compression._lzallright().compress
+    if compression._clzo is not None:
+        # python-lzo output without its 5 byte header, as in mdict blocks
+        return lambda data: compression._clzo.compress(data, 1, False)
+    sys.exit("lzallright or python-lzo is needed to compress the blocks")
+
+
+def html_blocks(count):
+    words = [b"w%05d" % i for i in range(count * 250)]
+    records = b"".join(
+        b'<div class="entry"><h3>%s</h3><span class="pos">noun</span>'
+        b'<p>definition of %s, see <a href="entry://%s">%s</a></p></div>\x00'
+        % (w, w, w, w)
+        for w in words
+    )
+    return [
+        records[i : i + block_size]
+        for i in range(0, block_size * count, block_size)
+    ]
+
+
+def main():
+    compress = compressor()
+    blocks = html_blocks(8)
+    compressed = [compress(block) for block in blocks]
+    ratio = sum(map(len, compressed)) / sum(map(len, blocks))
+    print("%d blocks of %d bytes, ratio %.2f" % (len(blocks), block_size, ratio))
+    backends = [("python", compression._pure_lzo)]
+    if compression._lzallright is not None:
+        backends.append(("lzallright", compression._lzallright_lzo))
+    if compression._clzo is not None:
+        backends.append(("python-lzo", compression._python_lzo))
+    for name, decompress in backends:
+        for block, data in zip(blocks, compressed):
+            assert decompress(data, len(block)) == block
+
+        def run():
+            for block, data in zip(blocks, compressed):
+                decompress(data, len(block))
+
+        number = 1 if name == "python" else 100
+        seconds = min(timeit.repeat(run, number=number, repeat=3)) / number
+        per_block = seconds / len(blocks)
+        print(
+            "%-12s %8.3f ms/block %8.1f MB/s"
+            % (name, per_block * 1e3, block_size / per_block / 1e6)
+        )
+
+
+if __name__ == "__main__":
+    main()
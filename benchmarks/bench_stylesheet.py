@@ -0,0 +1,55 @@
+"""
+time IndexBuilder._replace_stylesheet against the previous version, which
+concatenated bytes once per style tag
+
+    python benchmarks/bench_stylesheet.py
+"""
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask_mdict.word_query.mdict_query import IndexBuilder  # noqa: E402
+
+
+def concat_replace_stylesheet(stylesheet, txt):
+    txt_list = re.split(b'`\\d+`', txt)
+    txt_tag = re.findall(b'`\\d+`', txt)
+    txt_styled = txt_list[0]
+    for j, p in enumerate(txt_list[1:]):
+        style = stylesheet[txt_tag[j][1:-1]]
+        txt_styled = txt_styled + style[0] + p + style[1]
+    return txt_styled
+
+
+def best(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    stylesheet = {
+        str(i).encode(): (b'<span class="s%d">' % i, b'</span>') for i in range(1, 31)
+    }
+    idx = IndexBuilder.__new__(IndexBuilder)
+    idx._stylesheet = stylesheet
+    rng = random.Random(2)
+    for tags in (10, 100, 1000, 5000):
+        txt = b''.join(
+            b'`%d`sense %d definition text with some words\n' % (rng.randint(1, 30), i)
+            for i in range(tags)
+        )
+        assert idx._replace_stylesheet(txt) == concat_replace_stylesheet(stylesheet, txt)
+        number = max(1, 2000 // tags)
+        old = best(lambda: concat_replace_stylesheet(stylesheet, txt), number)
+        new = best(lambda: idx._replace_stylesheet(txt), number * 10)
+        print(
+            '%5d tags %7d bytes: previous %8.3f ms  _replace_stylesheet %7.3f ms'
+            % (tags, len(txt), old * 1e3, new * 1e3)
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+app of the load test of /query, see load_query.py
+
+page and block caches are off. every record block read sleeps DELAY
+seconds to stand in for cold storage. settings come from the environment:
+
+    MDICT_DIR  dictionary folder, default content
+    DELAY      seconds added to each record block read, default 0.02
+    WORKERS    MDICT_QUERY_WORKERS, default 0
+    POOL       MDICT_POOL_SIZE, default 4
+
+    gunicorn -w 4 --chdir benchmarks load_app:app
+    WORKERS=4 POOL=16 gunicorn -w 2 --threads 8 --chdir benchmarks load_app:app
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import Flask  # noqa: E402
+
+from flask_mdict import init_app  # noqa: E402
+from flask_mdict.mdict_query2 import IndexBuilder2  # noqa: E402
+
+
+delay = float(os.environ.get("DELAY", "0.02"))
+get_record_block = IndexBuilder2.get_record_block
+
+
+def slow_record_block(self, fmdx, index):
+    time.sleep(delay)
+    return get_record_block(self, fmdx, index)
+
+
+IndexBuilder2.get_record_block = slow_record_block
+
+mdict_dir = os.path.realpath(os.environ.get("MDICT_DIR", "content"))
+app = Flask(__name__, template_folder=None, static_folder=None)
+app.config.update(
+    MDICT_DIR=mdict_dir,
+    MDICT_CACHE=False,
+    SECRET_KEY="load test",
+    APP_DB=os.path.join(mdict_dir, "flask_mdict.db"),
+    INDEX_DIR=None,
+    MDICT_PAGE_CACHE_SIZE=0,
+    MDICT_BLOCK_CACHE_SIZE=0,
+    MDICT_QUERY_WORKERS=int(os.environ.get("WORKERS", "0")),
+    MDICT_POOL_SIZE=int(os.environ.get("POOL", "4")),
+)
+init_app(app, url_prefix="/")
@@ -0,0 +1,89 @@
+"""
+load test of /query: concurrent clients, each opening a new connection per
+request, for a number of seconds. prints requests per second, median and
+99th percentile latency and non-200 responses.
+
+    python benchmarks/load_query.py [-p port] [-c concurrency] [-t seconds] \\
+        [word ...]
+"""
+import argparse
+import asyncio
+import time
+import urllib.parse
+
+
+async def get(host, port, path):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = "GET %s HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n"
+        writer.write((request % (path, host)).encode())
+        await writer.drain()
+        head = await reader.readuntil(b"\r\n\r\n")
+        status = int(head.split()[1])
+        headers = head.lower()
+        if b"transfer-encoding: chunked" in headers:
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+                await reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            await reader.read()
+        return status
+    finally:
+        writer.close()
+
+
+async def client(args, paths, start, latencies, errors):
+    n = start
+    end = time.perf_counter() + args.seconds
+    while time.perf_counter() < end:
+        path = paths[n % len(paths)]
+        n += 1
+        begin = time.perf_counter()
+        status = await get(args.host, args.port, path)
+        latencies.append(time.perf_counter() - begin)
+        if status != 200:
+            errors.append(status)
+
+
+async def run(args):
+    paths = ["/query?word=%s" % urllib.parse.quote(word) for word in args.words]
+    latencies = []
+    errors = []
+    await asyncio.gather(
+        *[
+            client(args, paths, i, latencies, errors)
+            for i in range(args.concurrency)
+        ]
+    )
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test of /query")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("-p", "--port", type=int, default=5000)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-t", "--seconds", type=float, default=5)
+    parser.add_argument("words", nargs="*", default=["apple", "banana", "e mail"])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    latencies, errors = asyncio.run(run(args))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(
+        "concurrency %d: %.0f req/s, p50 %.0fms, p99 %.0fms, errors %d"
+        % (
+            args.concurrency,
+            len(latencies) / elapsed,
+            latencies[len(latencies) // 2] * 1e3,
+            latencies[int(len(latencies) * 0.99)] * 1e3,
+            len(errors),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
-import sqlite3
+import atexit
 import os.path
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import Blueprint, g
 
 from .utils import singleton
+from .cache import LRUCache, DiskCache
 
 
 __version__ = "1.3.10"
@@ -25,11 +27,74 @@ def init_app(app, url_prefix=None):
         database = getattr(g, "_database", None)
         if not database:
             return
-        for conn in database.values():
-            conn.close()
+        for pool, conn in database.values():
+            pool.release(conn)
 
     Config.MDICT_DIR = app.config.get("MDICT_DIR")
+    # cache resources and scoped css, off unless MDICT_CACHE is set
     Config.MDICT_CACHE = app.config.get("MDICT_CACHE")
+    # sqlite connections kept open for each dictionary index db
+    Config.MDICT_POOL_SIZE = app.config.get("MDICT_POOL_SIZE", 4)
+    # seconds to wait for a free connection before answering 503
+    Config.MDICT_POOL_TIMEOUT = app.config.get("MDICT_POOL_TIMEOUT", 10)
+    # processes to build out of date index dbs at startup
+    Config.MDICT_INDEX_WORKERS = app.config.get("MDICT_INDEX_WORKERS", 1)
+    # serve at once and build out of date index dbs in a background thread
+    Config.MDICT_LAZY_INIT = app.config.get("MDICT_LAZY_INIT", False)
+    # case insensitive lookup: "case", or "accent" to also ignore accents
+    Config.MDICT_KEY_FOLD = app.config.get("MDICT_KEY_FOLD", "case")
+    # store records rendered to balanced utf-8 html in the index db,
+    # more disk for less work per lookup. changing it rebuilds mdx index dbs
+    Config.MDICT_PRERENDER = app.config.get("MDICT_PRERENDER", False)
+    # keep sorted keys in memory for /search, and its default page size
+    Config.MDICT_SUGGEST_INDEX = app.config.get("MDICT_SUGGEST_INDEX", True)
+    Config.MDICT_SUGGEST_LIMIT = app.config.get("MDICT_SUGGEST_LIMIT", 100)
+    # most words in one POST /query
+    Config.MDICT_BATCH_LIMIT = app.config.get("MDICT_BATCH_LIMIT", 200)
+    # threads to look up dictionaries of one query concurrently, 0 for none,
+    # and seconds to wait for a dictionary before leaving it out
+    query_workers = app.config.get("MDICT_QUERY_WORKERS", 0)
+    Config.MDICT_QUERY_TIMEOUT = app.config.get("MDICT_QUERY_TIMEOUT", 10)
+    if query_workers > 0:
+        Config.QUERY_EXECUTOR = ThreadPoolExecutor(
+            max_workers=query_workers, thread_name_prefix="mdict-query"
+        )
+    else:
+        Config.QUERY_EXECUTOR = None
+    # seconds browsers and proxies may keep resources without asking again
+    Config.MDICT_RESOURCE_MAX_AGE = app.config.get("MDICT_RESOURCE_MAX_AGE", 86400)
+    # resources of all dictionaries, css after scoping, and not found ones
+    Config.RESOURCE_CACHE = LRUCache(
+        app.config.get("MDICT_RESOURCE_CACHE_SIZE", 16 * 1024 * 1024)
+        if Config.MDICT_CACHE
+        else 0
+    )
+    # decompressed record blocks, shared by all dictionaries
+    block_cache_dir = app.config.get("MDICT_BLOCK_CACHE_DIR")
+    if block_cache_dir:
+        block_cache_disk = DiskCache(
+            block_cache_dir,
+            app.config.get("MDICT_BLOCK_CACHE_DIR_SIZE", 256 * 1024 * 1024),
+        )
+    else:
+        block_cache_disk = None
+    Config.BLOCK_CACHE = LRUCache(
+        app.config.get("MDICT_BLOCK_CACHE_SIZE", 32 * 1024 * 1024),
+        disk=block_cache_disk,
+    )
+    # rendered /query pages
+    page_cache_dir = app.config.get("MDICT_PAGE_CACHE_DIR")
+    if page_cache_dir:
+        page_cache_disk = DiskCache(
+            page_cache_dir,
+            app.config.get("MDICT_PAGE_CACHE_DIR_SIZE", 256 * 1024 * 1024),
+        )
+    else:
+        page_cache_disk = None
+    Config.PAGE_CACHE = LRUCache(
+        app.config.get("MDICT_PAGE_CACHE_SIZE", 16 * 1024 * 1024),
+        disk=page_cache_disk,
+    )
     if not Config.MDICT_DIR:
         raise ValueError('Please set "MDICT_DIR" in app.config')
 
@@ -42,7 +107,10 @@ def init_app(app, url_prefix=None):
     helper.init_flask_mdict()
 
     mdicts, db_names = helper.init_mdict(Config.MDICT_DIR, Config.INDEX_DIR)
+    # dictionaries of an earlier init_app
+    helper.close_mdict(getattr(Config, "MDICT", None) or {})
     Config.MDICT = mdicts
+    atexit.register(helper.close_mdict, mdicts)
     Config.DB_NAMES.update(db_names)
 
     app.register_blueprint(mdict, url_prefix=url_prefix)
@@ -53,19 +121,31 @@ def get_mdict():
 
 
 def get_db(uuid):
+    """lease a connection from the dictionary pool for this app context"""
     database = getattr(g, "_database", None)
-    if not database:
+    if database is None:
         database = g._database = {}
-    db = database.get(uuid)
-    if db is None:
-        db_name = Config.DB_NAMES.get(uuid)
-        if db_name:
-            if not os.path.exists(db_name):
-                return
-            db = sqlite3.connect(db_name)
-            db.row_factory = sqlite3.Row
-            database[uuid] = db
-    return db
+    lease = database.get(uuid)
+    if lease is None:
+        item = Config.MDICT.get(uuid)
+        get_pool = item and getattr(item["query"], "get_pool", None)
+        if not get_pool:
+            return
+        pool = get_pool()
+        if pool is None or not os.path.exists(pool.db_name):
+            return
+        lease = database[uuid] = (pool, pool.acquire())
+    return lease[1]
+
+
+def detach_db(uuid):
+    """
+    take the lease of uuid out of the app context, so it is not released
+    at teardown. return (pool, conn) or None, the caller releases it.
+    """
+    database = getattr(g, "_database", None)
+    if database:
+        return database.pop(uuid, None)
 
 
 # must import at bottom
@@ -0,0 +1,161 @@
+import os
+import hashlib
+import threading
+import tempfile
+from collections import OrderedDict
+
+
+class DiskCache(object):
+    """
+    cache of bytes values stored as files in one directory
+
+    several processes, e.g. gunicorn workers, may share the same directory.
+    put it on tmpfs (/dev/shm) to share through memory instead of disk.
+    """
+
+    prune_interval = 64
+
+    def __init__(self, path, max_bytes=0):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._writes = 0
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+
+    def _fname(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self._path, digest)
+
+    def get(self, key):
+        try:
+            with open(self._fname(key), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, value):
+        fd, tmp_name = tempfile.mkstemp(dir=self._path, prefix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp_name, self._fname(key))
+        except OSError:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            return
+        self._writes += 1
+        if self._max_bytes and self._writes % self.prune_interval == 0:
+            self.prune()
+
+    def prune(self):
+        """remove the oldest files until the directory fits into max_bytes"""
+        entries = []
+        total = 0
+        for entry in os.scandir(self._path):
+            if entry.name.startswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class LRUCache(object):
+    """
+    thread-safe LRU cache bounded by the total size of its values
+
+    values are bytes or str, ``max_bytes`` of 0 disables the cache.
+    ``set`` may count a value as ``size`` bytes instead of its length.
+    an optional DiskCache is used as a second tier shared by processes.
+    """
+
+    def __init__(self, max_bytes, disk=None):
+        self._max_bytes = max_bytes
+        self._disk = disk
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    @property
+    def enabled(self):
+        return bool(self._max_bytes or self._disk)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            self.misses += 1
+        if self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                self.disk_hits += 1
+                self._put(key, value)
+                return value
+        return default
+
+    def set(self, key, value, size=None):
+        self._put(key, value, size)
+        if self._disk is not None:
+            self._disk.set(key, value)
+
+    def _put(self, key, value, size=None):
+        if size is None:
+            size = len(value)
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (_, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is not None:
+                self._bytes -= item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        return {
+            "items": len(self._data),
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+        }
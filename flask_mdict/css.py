@@ -0,0 +1,120 @@
+"""
+scope dictionary css to its own part of the /query page
+
+selectors of style rules get a prefix, e.g. "#class_<uuid> .mdict a". rules
+inside @media, @supports and other conditional at-rules are scoped too, the
+blocks of @font-face, @keyframes, @page and the like are kept as they are.
+comments are dropped, strings and brackets are kept whole.
+"""
+import re
+
+
+# changes of the output invalidate scoped css kept on disk
+scope_version = 1
+
+# comment, string, block or bracket, other text
+regex_token = re.compile(
+    r"/\*.*?(?:\*/|\Z)"
+    r'|"(?:\\.|[^"\\])*(?:"|\Z)'
+    r"|'(?:\\.|[^'\\])*(?:'|\Z)"
+    r"|[{};,()\[\]]"
+    r"|[^/\"'{};,()\[\]]+"
+    r"|/",
+    re.DOTALL,
+)
+regex_at_name = re.compile(r"@(-[a-z]+-)?([a-z-]+)", re.IGNORECASE)
+
+# at-rules holding style rules, without vendor prefix
+nested_at_rules = {"media", "supports", "document", "layer", "container", "scope"}
+opening_brackets = {"(": ")", "[": "]"}
+
+
+def tokens(css_data):
+    for token in regex_token.findall(css_data):
+        if not token.startswith("/*"):
+            yield token
+
+
+def _prelude(it):
+    """tokens up to the next {, ; or } outside brackets, and that token"""
+    prelude = []
+    closing = []
+    for token in it:
+        if closing:
+            if token == closing[-1]:
+                closing.pop()
+            elif token in opening_brackets:
+                closing.append(opening_brackets[token])
+        elif token in opening_brackets:
+            closing.append(opening_brackets[token])
+        elif token in ("{", "}", ";"):
+            return prelude, token
+        prelude.append(token)
+    return prelude, None
+
+
+def _block(it, out):
+    """copy tokens up to the } closing the current block"""
+    depth = 1
+    for token in it:
+        out.append(token)
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if not depth:
+                return
+
+
+def _selectors(prelude, prefix_id):
+    """selector list with each selector scoped, commas in brackets kept"""
+    selectors = []
+    selector = []
+    depth = 0
+    for token in prelude:
+        if token in opening_brackets:
+            depth += 1
+        elif token in ")]":
+            depth -= 1
+        elif token == "," and depth <= 0:
+            selectors.append("".join(selector).strip())
+            selector = []
+            continue
+        selector.append(token)
+    selectors.append("".join(selector).strip())
+    return ",".join(f"{prefix_id} .mdict {selector}" for selector in selectors)
+
+
+def _rules(it, prefix_id, out, nested=False):
+    while True:
+        prelude, end = _prelude(it)
+        text = "".join(prelude)
+        if end != "{":
+            out.append(text)
+            if end is None or (end == "}" and nested):
+                if end:
+                    out.append(end)
+                return
+            out.append(end)
+            continue
+        selector = text.strip()
+        if selector.startswith("@"):
+            out.append(text + "{")
+            mo = regex_at_name.match(selector)
+            if mo and mo.group(2).lower() in nested_at_rules:
+                _rules(it, prefix_id, out, nested=True)
+            else:
+                _block(it, out)
+        elif not selector:
+            out.append(text + "{")
+            _block(it, out)
+        else:
+            out.append("\n%s {" % _selectors(prelude, prefix_id))
+            _block(it, out)
+
+
+def scope_css(prefix_id, css_data):
+    """css_data with every style rule limited to prefix_id .mdict"""
+    out = []
+    _rules(tokens(css_data), prefix_id, out)
+    return "".join(out)
@@ -0,0 +1,100 @@
+import queue
+import sqlite3
+import threading
+import urllib.parse
+from contextlib import contextmanager
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """no connection of the pool was released in time"""
+
+
+class ConnectionPool(object):
+    """
+    a bounded pool of read-only sqlite connections for one database file
+
+    connections are opened lazily, up to ``size``, and handed out to one
+    thread at a time. sqlite3 keeps a per-connection statement cache, so
+    reusing connections also reuses the prepared statements. a thread waits
+    ``timeout`` seconds at most for a leased connection, None waits forever.
+    """
+
+    def __init__(self, db_name, size=4, immutable=False, timeout=10):
+        self._db_name = db_name
+        self._size = max(1, size)
+        self._immutable = immutable
+        self._timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    @property
+    def db_name(self):
+        return self._db_name
+
+    def _uri(self):
+        path = urllib.parse.quote(self._db_name.replace("\\", "/"))
+        uri = "file:%s?mode=ro" % path
+        if self._immutable:
+            uri += "&immutable=1"
+        return uri
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self._uri(),
+            uri=True,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def acquire(self):
+        """lease a connection, opening a new one while under the bound"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("pool of %s is closed" % self._db_name)
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self._size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self._timeout)
+        except queue.Empty:
+            raise PoolTimeout("no free connection for %s" % self._db_name)
+
+    def release(self, conn):
+        if self._closed:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        """close idle connections, leased ones are closed on release"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
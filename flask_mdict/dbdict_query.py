@@ -3,6 +3,9 @@ import os.path
 import sqlite3
 import zlib
 
+from .db_pool import ConnectionPool
+from .word_query.mdict_query import fold_key
+
 
 class DBDict(object):
     """
@@ -10,9 +13,17 @@ class DBDict(object):
     """
     _db_name = None
     _meta = None
-    is_mdd = False
+    _pool = None
+    # key_fold mode of the entry_fold columns, None if they could not be migrated
+    _key_fold = None
+    # key_fold mode asked for, also used to fold keys in python when _key_fold is None
+    _fold_mode = 'case'
+    # host parameters of one IN (...), the limit of sqlite before 3.32
+    _max_variables = 999
+    _is_mdd = False
 
-    def __init__(self, db_name):
+    def __init__(self, db_name, pool_size=4, key_fold='case', pool_timeout=10):
+        self._fold_mode = key_fold
         if not os.path.exists(db_name):
             return
         sql = 'SELECT name FROM sqlite_master WHERE type="table" AND name=?'
@@ -35,6 +46,43 @@ class DBDict(object):
             for row in cursor.fetchall():
                 self._meta[row[0].lower()] = row[1]
 
+            tables = ['mdx', 'mdd'] if mdd_row else ['mdx']
+            if all(self._migrate(conn, table, key_fold) for table in tables):
+                self._key_fold = key_fold
+                if self._meta.get('key_fold') != key_fold:
+                    conn.execute('DELETE FROM meta WHERE key = "key_fold"')
+                    conn.execute('INSERT INTO meta VALUES (?,?)', ('key_fold', key_fold))
+                    self._meta['key_fold'] = key_fold
+        self._pool = ConnectionPool(db_name, pool_size, timeout=pool_timeout)
+
+    def _migrate(self, conn, table, key_fold):
+        """fill indexed entry_fold column, False if db is not writable"""
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(%s)' % table)]
+        if 'entry_fold' not in columns or self._meta.get('key_fold') != key_fold:
+            sql = 'UPDATE %s SET entry_fold = fold_key(entry)' % table
+        else:
+            # entries added by other tools after last migration
+            row = conn.execute(
+                'SELECT 1 FROM %s WHERE entry_fold IS NULL LIMIT 1' % table
+            ).fetchone()
+            if not row:
+                return True
+            sql = 'UPDATE %s SET entry_fold = fold_key(entry) WHERE entry_fold IS NULL' % table
+        try:
+            conn.create_function('fold_key', 1, lambda text: fold_key(text, key_fold))
+            if 'entry_fold' not in columns:
+                conn.execute('ALTER TABLE %s ADD COLUMN entry_fold text' % table)
+            conn.execute(sql)
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS %s_entry_fold ON %s (entry_fold)' % (table, table)
+            )
+            conn.commit()
+        except sqlite3.OperationalError:
+            # read only, lookup with lower(entry)
+            conn.rollback()
+            return False
+        return True
+
     def is_ok(self):
         """check if it is mdict db"""
         return bool(self._db_name)
@@ -42,12 +90,25 @@ class DBDict(object):
     def is_mdd(self):
         return self._is_mdd
 
+    def fold_word(self, word):
+        """key an ignorecase lookup of word looks for in the mdx table"""
+        if self._key_fold:
+            return fold_key(word, self._key_fold)
+        return word.lower()
+
+    def get_pool(self):
+        return self._pool
+
+    def close(self):
+        if self._pool:
+            self._pool.close()
+
     def title(self):
         return self._meta.get('title')
 
     def about(self):
         abouts = []
-        with sqlite3.connect(self._db_name) as conn:
+        with self._pool.connection() as conn:
             sql = 'SELECT count(*) FROM mdx'
             cursor = conn.execute(sql)
             row = cursor.fetchone()
@@ -71,15 +132,31 @@ class DBDict(object):
         cursor = conn.execute(sql, ('%s%%' % part.replace('*', '%'), ))
         return [row['entry'] for row in cursor.fetchall()]
 
+    def get_sorted_keys(self):
+        """(key_fold, key_text) of all mdx entries, for suggestion"""
+        with self._pool.connection() as conn:
+            if self._key_fold:
+                sql = 'SELECT entry_fold, entry FROM mdx ORDER BY entry_fold, entry'
+                for row in conn.execute(sql):
+                    yield row[0], row[1]
+            else:
+                rows = conn.execute('SELECT entry FROM mdx')
+                fold_mode = self._fold_mode
+                for row in sorted((fold_key(row[0], fold_mode), row[0]) for row in rows):
+                    yield row
+
     def get_mdd_keys(self, conn, part):
         sql = 'SELECT entry FROM mdd WHERE entry like ?'
         cursor = conn.execute(sql, ('%s%%' % part.replace('*', '%'), ))
         return [row['entry'] for row in cursor.fetchall()]
 
     def mdx_lookup(self, conn, word, ignorecase=True):
-        if ignorecase:
+        if ignorecase and self._key_fold:
+            sql = 'SELECT paraphrase FROM mdx WHERE entry_fold = ?'
+            cursor = conn.execute(sql, (self.fold_word(word), ))
+        elif ignorecase:
             sql = 'SELECT paraphrase FROM mdx WHERE lower(entry) = ?'
-            cursor = conn.execute(sql, (word.lower(), ))
+            cursor = conn.execute(sql, (self.fold_word(word), ))
         else:
             sql = 'SELECT paraphrase FROM mdx WHERE entry = ?'
             cursor = conn.execute(sql, (word, ))
@@ -91,10 +168,34 @@ class DBDict(object):
             record.append(value)
         return record
 
+    def mdx_lookup_many(self, conn, words, ignorecase=True):
+        """records of each word, in the order of words"""
+        if ignorecase:
+            column = 'entry_fold' if self._key_fold else 'lower(entry)'
+            keys = [self.fold_word(word) for word in words]
+        else:
+            column = 'entry'
+            keys = list(words)
+        unique_keys = list(dict.fromkeys(keys))
+        found = {}
+        for i in range(0, len(unique_keys), self._max_variables):
+            chunk = unique_keys[i:i + self._max_variables]
+            sql = 'SELECT %s AS word_key, paraphrase FROM mdx WHERE %s IN (%s)' % (
+                column, column, ','.join('?' * len(chunk)))
+            for row in conn.execute(sql, chunk):
+                value = row['paraphrase']
+                if self._meta['zip']:
+                    value = zlib.decompress(value).decode(self._meta['encoding'])
+                found.setdefault(row['word_key'], []).append(value)
+        return [list(found.get(key, [])) for key in keys]
+
     def mdd_lookup(self, conn, word, ignorecase=True):
         if not self._is_mdd:
             return []
-        if ignorecase:
+        if ignorecase and self._key_fold:
+            sql = 'SELECT file FROM mdd WHERE entry_fold = ?'
+            cursor = conn.execute(sql, (fold_key(word, self._key_fold), ))
+        elif ignorecase:
             sql = 'SELECT file FROM mdd WHERE lower(entry) = ?'
             cursor = conn.execute(sql, (word.lower(), ))
         else:
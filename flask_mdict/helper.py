@@ -1,13 +1,19 @@
 import re
 import uuid
+import hashlib
 import os.path
 import sqlite3
 import logging
+import threading
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from . import Config
+from . import Config, css
+from .cache import DiskCache
 from .dbdict_query import DBDict
-from .mdict_query2 import IndexBuilder2
+from .mdict_query2 import IndexBuilder2, build_index
+from .suggest import KeyIndex
+from .utils import fix_html
 
 
 logger = logging.getLogger(__name__)
@@ -51,6 +57,188 @@ def custom_sort_key(name):
     return len(dict_file_order)
 
 
+def get_mdict_uuid(fname):
+    return str(uuid.uuid3(uuid.NAMESPACE_URL, fname.replace("\\", "/"))).upper()
+
+
+def get_mdict_index_dir(index_dir, dict_uuid):
+    if not index_dir:
+        return None
+    mdict_index_dir = os.path.join(index_dir, dict_uuid)
+    if not os.path.exists(mdict_index_dir):
+        os.makedirs(mdict_index_dir)
+    return mdict_index_dir
+
+
+def build_indexes(jobs, workers=1, job_done=None, job_failed=None):
+    """
+    build index dbs, jobs are arguments of mdict_query2.build_index.
+    every job writes its own db, so the result does not depend on workers.
+    with job_failed, a failed job is reported by job_failed(job, err) and
+    the other jobs go on, without it the error is raised.
+    """
+    if not jobs:
+        return
+    workers = min(workers or 1, len(jobs))
+    logger.info("Build %s index db with %s worker(s)..." % (len(jobs), workers))
+
+    def failed(job, err):
+        if job_failed is None:
+            raise err
+        logger.exception("\tindex %s failed" % job[1])
+        job_failed(job, err)
+
+    if workers == 1:
+        for count, job in enumerate(jobs, 1):
+            try:
+                build_index(*job)
+            except Exception as err:
+                failed(job, err)
+                continue
+            logger.info("\tindex %s [%s/%s]" % (job[1], count, len(jobs)))
+            if job_done:
+                job_done(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(build_index, *job): job for job in jobs}
+        for count, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            try:
+                src_file = future.result()
+            except Exception as err:
+                failed(job, err)
+                continue
+            logger.info("\tindex %s [%s/%s]" % (src_file, count, len(jobs)))
+            if job_done:
+                job_done(job)
+
+
+# index build progress of dictionaries: {uuid: {"built": n, "total": n}}
+index_progress = {}
+
+
+def update_progress(job):
+    index_progress[get_mdict_uuid(job[0])]["built"] += 1
+
+
+def build_in_background(mdicts, jobs, pending):
+    """build indexes and switch each dictionary to ready once all its files are done"""
+
+    def job_failed(job, err):
+        # only the dictionary of the failed job is marked, others go on
+        mdx_file = job[0]
+        if mdx_file in pending:
+            pending.pop(mdx_file)
+            mdicts[get_mdict_uuid(mdx_file)]["error"] = "Error: %s" % (
+                str(err) or type(err).__name__
+            )
+
+    def job_done(job):
+        update_progress(job)
+        mdx_file = job[0]
+        progress = index_progress[get_mdict_uuid(mdx_file)]
+        if progress["built"] == progress["total"] and mdx_file in pending:
+            try:
+                item = init_mdict_item(*pending[mdx_file])
+            except Exception as err:
+                logger.exception("Initialize MDICT %s failed" % mdx_file)
+                job_failed(job, err)
+                return
+            del pending[mdx_file]
+            old_item = mdicts.get(item["uuid"])
+            mdicts[item["uuid"]] = item
+            if old_item:
+                close_mdict_item(old_item)
+            logger.info('MDICT "%s" {%s} is ready' % (item["title"], item["uuid"]))
+
+    try:
+        build_indexes(
+            jobs,
+            Config.MDICT_INDEX_WORKERS,
+            job_done=job_done,
+            job_failed=job_failed,
+        )
+    except Exception as err:
+        logger.exception("Build index failed")
+        for mdx_file in list(pending):
+            job_failed((mdx_file,), err)
+
+
+def close_mdict_item(item):
+    """close connection pools and file maps of a dictionary that is replaced"""
+    close = getattr(item["query"], "close", None)
+    if close:
+        close()
+
+
+def close_mdict(mdicts):
+    for item in mdicts.values():
+        close_mdict_item(item)
+
+
+def init_mdict_item(mdx_file, root, name, logo, enable, mdict_index_dir):
+    dict_uuid = get_mdict_uuid(mdx_file)
+    idx = IndexBuilder2(
+        mdx_file,
+        index_dir=mdict_index_dir,
+        pool_size=Config.MDICT_POOL_SIZE,
+        pool_timeout=Config.MDICT_POOL_TIMEOUT,
+        block_cache=Config.BLOCK_CACHE,
+        key_fold=Config.MDICT_KEY_FOLD,
+        prerender=Config.MDICT_PRERENDER,
+    )
+    if not idx._title or idx._title == "Title (No HTML code allowed)":
+        title = name
+    else:
+        title = idx._title
+        title = regex_tag.sub(" ", title)
+
+    abouts = []
+    abouts.append("<ul>")
+    abouts.append("<li>%s</li>" % os.path.basename(idx._mdx_file))
+    logger.info("\t+ %s" % os.path.basename(idx._mdx_file))
+    for mdd in idx._mdd_files:
+        abouts.append("<li>%s</li>" % os.path.basename(mdd))
+        logger.info("\t+ %s" % os.path.basename(mdd))
+    abouts.append("</ul><hr />")
+    if (
+        idx._description
+        == "<font size=5 color=red>Paste the description of this product in HTML source code format here</font>"
+    ):
+        text = ""
+    else:
+        text = fix_html(idx._description)
+    about_html = os.path.join(root, "about_%s.html" % name)
+    if not os.path.exists(about_html):
+        with open(about_html, "wt", encoding="utf-8") as f:
+            f.write(text)
+    if False:
+        text = regex_style.sub("", text)
+        text = regex_ln.sub("\n", text)
+        text = regex_tag.sub(" ", text)
+        text = [t for t in [t.strip() for t in text.split("\n")] if t]
+        abouts.append("<p>" + "<br />\n".join(text) + "</p>")
+    else:
+        abouts.append(text)
+    about = "\n".join(abouts)
+    return {
+        "title": title,
+        "uuid": dict_uuid,
+        "logo": logo,
+        "about": about,
+        "root_path": root,
+        "query": idx,
+        "type": "mdict",
+        "error": "",
+        "enable": enable,
+        "m_time": max(idx._m_times.values()),
+        "keys": KeyIndex(idx.get_sorted_keys())
+        if Config.MDICT_SUGGEST_INDEX
+        else None,
+        "ready": True,
+    }
+
+
 def init_mdict(mdict_dir, index_dir=None):
     mdicts = OrderedDict()
     db_names = {}
@@ -59,6 +247,37 @@ def init_mdict(mdict_dir, index_dir=None):
         rows = conn.execute("SELECT name, value FROM setting;")
         for row in rows:
             mdict_setting[row[0]] = row[1] == "1"
+
+    # build out of date indexes first, in parallel
+    jobs = []
+    pending = {}
+    index_progress.clear()
+    for root, dirs, files in os.walk(mdict_dir, followlinks=True):
+        for fname in files:
+            if fname.endswith(".mdx"):
+                mdx_file = os.path.join(root, fname)
+                dict_uuid = get_mdict_uuid(mdx_file)
+                mdict_index_dir = get_mdict_index_dir(index_dir, dict_uuid)
+                stale = IndexBuilder2.stale_indexes(
+                    mdx_file, mdict_index_dir, prerender=Config.MDICT_PRERENDER
+                )
+                for src_file in stale:
+                    jobs.append(
+                        (
+                            mdx_file,
+                            src_file,
+                            mdict_index_dir,
+                            Config.MDICT_KEY_FOLD,
+                            Config.MDICT_PRERENDER,
+                        )
+                    )
+                    progress = index_progress.setdefault(
+                        dict_uuid, {"built": 0, "total": 0}
+                    )
+                    progress["total"] += 1
+    if not Config.MDICT_LAZY_INIT:
+        build_indexes(jobs, Config.MDICT_INDEX_WORKERS, job_done=update_progress)
+
     for root, dirs, files in os.walk(mdict_dir, followlinks=True):
         files.sort(key=custom_sort_key)
         for fname in files:
@@ -68,13 +287,16 @@ def init_mdict(mdict_dir, index_dir=None):
                 and not fname.endswith(".mdd.db")
             ):
                 db_file = os.path.join(root, fname)
-                d = DBDict(db_file)
+                d = DBDict(
+                    db_file,
+                    pool_size=Config.MDICT_POOL_SIZE,
+                    pool_timeout=Config.MDICT_POOL_TIMEOUT,
+                    key_fold=Config.MDICT_KEY_FOLD,
+                )
                 if not d.is_ok():
                     continue
                 # mdict db
-                dict_uuid = str(
-                    uuid.uuid3(uuid.NAMESPACE_URL, db_file.replace("\\", "/"))
-                ).upper()
+                dict_uuid = get_mdict_uuid(db_file)
                 name = os.path.splitext(fname)[0]
                 enable = mdict_setting.get(dict_uuid, True)
                 logger.info(
@@ -97,10 +319,14 @@ def init_mdict(mdict_dir, index_dir=None):
                     "about": d.about(),
                     "root_path": root,
                     "query": d,
-                    "cache": {},
                     "type": "mdict_db",
                     "error": "",
                     "enable": enable,
+                    "m_time": os.path.getmtime(db_file),
+                    "keys": KeyIndex(d.get_sorted_keys())
+                    if Config.MDICT_SUGGEST_INDEX
+                    else None,
+                    "ready": True,
                 }
             elif fname.endswith(".mdx"):
                 name = os.path.splitext(fname)[0]
@@ -110,116 +336,104 @@ def init_mdict(mdict_dir, index_dir=None):
                         logo = name + ext
                         break
                 mdx_file = os.path.join(root, fname)
-                dict_uuid = str(
-                    uuid.uuid3(uuid.NAMESPACE_URL, mdx_file.replace("\\", "/"))
-                ).upper()
+                dict_uuid = get_mdict_uuid(mdx_file)
                 enable = mdict_setting.get(dict_uuid, True)
                 logger.info(
                     'Initialize MDICT "%s" {%s} [%s]...'
                     % (name, dict_uuid, "Enable" if enable else "Disable")
                 )
 
-                if index_dir:
-                    mdict_index_dir = os.path.join(index_dir, dict_uuid)
-                    if not os.path.exists(mdict_index_dir):
-                        os.makedirs(mdict_index_dir)
+                mdict_index_dir = get_mdict_index_dir(index_dir, dict_uuid)
+                init_args = (mdx_file, root, name, logo, enable, mdict_index_dir)
+                if dict_uuid in index_progress and Config.MDICT_LAZY_INIT:
+                    # serve other dictionaries while this one is indexed
+                    pending[mdx_file] = init_args
+                    mdicts[dict_uuid] = {
+                        "title": name,
+                        "uuid": dict_uuid,
+                        "logo": logo,
+                        "about": "",
+                        "root_path": root,
+                        "query": None,
+                        "type": "mdict",
+                        "error": "",
+                        "enable": enable,
+                        "m_time": None,
+                        "keys": None,
+                        "ready": False,
+                    }
                 else:
-                    mdict_index_dir = None
-                idx = IndexBuilder2(mdx_file, index_dir=mdict_index_dir)
-                if not idx._title or idx._title == "Title (No HTML code allowed)":
-                    title = name
-                else:
-                    title = idx._title
-                    title = regex_tag.sub(" ", title)
-
-                abouts = []
-                abouts.append("<ul>")
-                abouts.append("<li>%s</li>" % os.path.basename(idx._mdx_file))
-                logger.info("\t+ %s" % os.path.basename(idx._mdx_file))
-                for mdd in idx._mdd_files:
-                    abouts.append("<li>%s</li>" % os.path.basename(mdd))
-                    logger.info("\t+ %s" % os.path.basename(mdd))
-                abouts.append("</ul><hr />")
-                if (
-                    idx._description
-                    == "<font size=5 color=red>Paste the description of this product in HTML source code format here</font>"
-                ):
-                    text = ""
-                else:
-                    text = fix_html(idx._description)
-                about_html = os.path.join(root, "about_%s.html" % name)
-                if not os.path.exists(about_html):
-                    with open(about_html, "wt", encoding="utf-8") as f:
-                        f.write(text)
-                if False:
-                    text = regex_style.sub("", text)
-                    text = regex_ln.sub("\n", text)
-                    text = regex_tag.sub(" ", text)
-                    text = [t for t in [t.strip() for t in text.split("\n")] if t]
-                    abouts.append("<p>" + "<br />\n".join(text) + "</p>")
-                else:
-                    abouts.append(text)
-                about = "\n".join(abouts)
-                mdicts[dict_uuid] = {
-                    "title": title,
-                    "uuid": dict_uuid,
-                    "logo": logo,
-                    "about": about,
-                    "root_path": root,
-                    "query": idx,
-                    "cache": {},
-                    "type": "mdict",
-                    "error": "",
-                    "enable": enable,
-                }
+                    mdicts[dict_uuid] = init_mdict_item(*init_args)
 
+    if pending:
+        thread = threading.Thread(
+            target=build_in_background,
+            args=(mdicts, jobs, pending),
+            name="mdict-index",
+            daemon=True,
+        )
+        thread.start()
     logger.info("--- MDict is Ready ---")
     return mdicts, db_names
 
 
-regex_css_comment = re.compile(r"(/\*.*?\*/)", re.DOTALL)
-regex_css_tags = re.compile(r"([^}/;]+?){")
+def page_cache_key(word, all_result, fallback, host_url):
+    """
+    key of rendered /query page. it contains the state of all dictionaries,
+    so a changed or toggled dictionary never hits old pages, and word as
+    every dictionary looks it up, so only words with the same records share
+    a page.
+    """
+    states = [
+        "%s:%s:%s:%s" % (uuid, item["enable"], item["ready"], item.get("m_time"))
+        for uuid, item in Config.MDICT.items()
+    ]
+    fingerprint = hashlib.sha1("|".join(states).encode("utf-8")).hexdigest()
+    words = {lookup_word_key(item, word) for item in Config.MDICT.values()} or {word}
+    return (tuple(sorted(words)), all_result, ",".join(fallback), host_url, fingerprint)
+
+
+def lookup_word_key(item, word):
+    """word as the dictionary of item looks it up"""
+    if item["type"] == "app":
+        return word
+    return item["query"].fold_word(word)
 
 
 def fix_css(prefix_id, css_data):
-    def replace(mo):
-        tags = mo.group(1).strip()
-        if not tags or tags.startswith("@"):
-            return mo.group(0)
-        else:
-            fix_tags = []
-            for tag in tags.split(","):
-                tag = tag.strip()
-                fix_tags.append(f"{prefix_id} .mdict {tag}")
-            return "\n%s {" % ",".join(fix_tags)
-
-    data = regex_css_comment.sub("", css_data)
-    data = regex_css_tags.sub(replace, data)
-    return data
+    return css.scope_css(prefix_id, css_data)
+
+
+# DiskCache of scoped css by directory
+scoped_css_caches = {}
 
 
-regex_opened_tag = re.compile(r"<([a-z]+)(?: .*?)?>", re.DOTALL | re.IGNORECASE)
-regex_closed_tag = re.compile(r"</([a-z]+)>", re.IGNORECASE)
-
-
-def fix_html(html_data):
-    opened_tags = regex_opened_tag.findall(html_data)
-    closed_tags = regex_closed_tag.findall(html_data)
-    opened_tags = [tag.lower() for tag in opened_tags]
-    closed_tags = [tag.lower() for tag in closed_tags]
-    # remove single tag
-    for tag in ["img", "link", "input", "br", "hr", "p", "meta"]:
-        while tag in opened_tags:
-            opened_tags.remove(tag)
-        while tag in closed_tags:
-            closed_tags.remove(tag)
-    if len(opened_tags) == len(closed_tags):
-        return html_data
-    for tag in opened_tags[::-1]:
-        if tag in closed_tags:
-            closed_tags.remove(tag)
-        else:
-            html_data += "</%s>" % tag
-    for tag in closed_tags:
-        html_data = "<%s>" % tag + html_data
-    return html_data
+def scoped_css_cache(item):
+    """DiskCache of scoped css beside the index db of item, None if there is none"""
+    if item["type"] == "mdict":
+        db_name = item["query"]._mdx_db
+    elif item["type"] == "mdict_db":
+        db_name = item["query"]._db_name
+    else:
+        return None
+    path = db_name + ".css"
+    if path not in scoped_css_caches:
+        try:
+            scoped_css_caches[path] = DiskCache(path)
+        except OSError:
+            # read only directory
+            scoped_css_caches[path] = None
+    return scoped_css_caches[path]
+
+
+def scoped_css(uuid, item, css_data):
+    """utf-8 css_data scoped by fix_css, computed once for each stylesheet"""
+    disk = scoped_css_cache(item) if Config.MDICT_CACHE else None
+    key = (css.scope_version, uuid, hashlib.sha1(css_data).hexdigest())
+    data = disk.get(key) if disk else None
+    if data is None:
+        data = fix_css("#class_%s" % uuid, css_data.decode("utf-8"))
+        data = data.encode("utf-8")
+        if disk:
+            disk.set(key, data)
+    return data
@@ -4,19 +4,44 @@ import sqlite3
 import re
 import os.path
 import ast
+import zlib
+import threading
+from contextlib import contextmanager
 
-from .word_query.mdict_query import IndexBuilder
+from .word_query.mdict_query import IndexBuilder, fold_key
+from .word_query.file_map import open_mapped, close_mapped
+from .word_query.compression import decompress
+from .db_pool import ConnectionPool
+from .utils import fix_html
 
 version = '1.2'
 
+regex_strip = re.compile('[%s ]' % string.punctuation.replace('@', ''))
+
+
+def build_index(mdx_file, src_file, index_dir=None, key_fold='case', prerender=False):
+    """build one index db, module level to run in a worker process"""
+    builder = IndexBuilder2(mdx_file, index_dir=index_dir, key_fold=key_fold,
+                            prerender=prerender, build=False)
+    builder.build_index(src_file)
+    return src_file
+
 
 class IndexBuilder2(IndexBuilder):
     _mdd_files = None
     _index_dir = None
+    # host parameters of one IN (...), the limit of sqlite before 3.32
+    _max_variables = 999
+    # uncompressed bytes of rendered records in one RECORD_BLOCK row
+    _prerender_block_size = 16 * 1024
+    # records are stored rendered in the index db, see _prerender_rows
+    prerendered = False
 
     def __init__(self, fname, encoding="", passcode=None,
                  force_rebuild=False, enable_history=False,
-                 sql_index=True, check=False, index_dir=None):
+                 sql_index=True, check=False, index_dir=None, pool_size=4,
+                 block_cache=None, key_fold='case', prerender=False, build=True,
+                 pool_timeout=10):
         # from super class
         self._mdx_file = fname
         self._mdd_file = ""
@@ -27,6 +52,16 @@ class IndexBuilder2(IndexBuilder):
         self._description = ''
         self._sql_index = sql_index
         self._check = check
+        self._passcode = passcode
+        self._pools = {}
+        self._pool_size = pool_size
+        self._pool_timeout = pool_timeout
+        self._pool_lock = threading.Lock()
+        self._block_cache = block_cache
+        self._key_fold = key_fold
+        self._prerender = prerender
+        # index dbs without key_fold column of key_fold mode, read only
+        self._unfolded = set()
 
         dirname = os.path.dirname(self._mdx_file)
         basename = os.path.basename(self._mdx_file)
@@ -35,53 +70,89 @@ class IndexBuilder2(IndexBuilder):
         self._index_dir = index_dir or dirname
         self._mdx_db = self.get_index_db(self._mdx_file, self._index_dir)
 
-        self._mdd_files = []
+        self._mdd_files = self.find_mdd_files(self._mdx_file)
+        if self._mdd_files and self._mdd_files[0] == os.path.join(dirname, name + '.mdd'):
+            self._mdd_file = self._mdd_files[0]
+
+        self._m_times = {}
+        for fname in [self._mdx_file] + self._mdd_files:
+            self._m_times[fname] = os.path.getmtime(fname)
+
+        if not build:
+            return
+        for src_file in self.stale_indexes(self._mdx_file, self._index_dir, force_rebuild,
+                                           prerender):
+            self.build_index(src_file)
+        self.load_index()
+
+    @classmethod
+    def find_mdd_files(cls, mdx_file):
+        """name.mdd and name.*.mdd beside mdx file"""
+        dirname = os.path.dirname(mdx_file)
+        name, _ = os.path.splitext(os.path.basename(mdx_file))
+        mdd_files = []
         if os.path.isfile(os.path.join(dirname, name + '.mdd')):
-            self._mdd_file = os.path.join(dirname, name + '.mdd')
-            self._mdd_files.append(self._mdd_file)
+            mdd_files.append(os.path.join(dirname, name + '.mdd'))
         regex_mdd = re.compile(r'^(.+?)\..+?\.mdd$')
         for fname in os.listdir(dirname):
             m = regex_mdd.match(fname)
             if m and m.group(1) == name:
-                self._mdd_files.append(os.path.join(dirname, fname))
+                mdd_files.append(os.path.join(dirname, fname))
+        return mdd_files
 
-        if force_rebuild or self.is_update(self._mdx_file, self._index_dir):
-            self._make_mdx_index(self.get_index_db(self._mdx_file, self._index_dir))
+    @classmethod
+    def stale_indexes(cls, mdx_file, index_dir=None, force_rebuild=False, prerender=False):
+        """
+        mdx and mdd files whose index db is missing or out of date,
+        or the mdx file if its index db is not in the prerender mode asked for
+        """
+        index_dir = index_dir or os.path.dirname(mdx_file)
+        stale = [
+            src_file
+            for src_file in [mdx_file] + cls.find_mdd_files(mdx_file)
+            if force_rebuild or cls.is_update(src_file, index_dir)
+        ]
+        if mdx_file not in stale and cls.is_prerendered(mdx_file, index_dir) != prerender:
+            stale.insert(0, mdx_file)
+        return stale
+
+    def build_index(self, src_file):
+        """(re)build index db of the mdx file or one of its mdd files"""
+        db_name = self.get_index_db(src_file, self._index_dir)
+        if src_file == self._mdx_file:
+            self._make_mdx_index(db_name)
         else:
-            # read meta from index db
-            conn = sqlite3.connect(self._mdx_db)
-            # 判断有无版本号
-            cursor = conn.execute("SELECT * FROM META WHERE key = \"version\"")
-            for cc in cursor:
-                self._version = cc[1]
-            cursor = conn.execute("SELECT * FROM META WHERE key = \"encoding\"")
-            for cc in cursor:
-                self._encoding = cc[1]
-            cursor = conn.execute("SELECT * FROM META WHERE key = \"stylesheet\"")
-            for cc in cursor:
-                self._stylesheet = ast.literal_eval(cc[1])
-
-            cursor = conn.execute("SELECT * FROM META WHERE key = \"title\"")
-            for cc in cursor:
-                self._title = cc[1]
-
-            cursor = conn.execute("SELECT * FROM META WHERE key = \"description\"")
-            for cc in cursor:
-                self._description = cc[1]
-
-        if self._mdd_file and self.is_update(self._mdd_file, self._index_dir):
-            self._mdd_db = self.get_index_db(self._mdd_file, self._index_dir)
-            self._make_mdd_index(self._mdd_db)
-
-        # check mdd db
-        for mdd_file in self._mdd_files:    # parent class has initialize first item
-            if mdd_file == self._mdd_file:
-                continue
-            if force_rebuild or self.is_update(mdd_file, self._index_dir):
-                self._make_mdd_index(
-                    self.get_index_db(mdd_file, self._index_dir),
-                    mdd_file
-                )
+            self._make_mdd_index(db_name, src_file)
+
+    def load_index(self):
+        """bring index dbs up to date and read mdx meta"""
+        for src_file in [self._mdx_file] + self._mdd_files:
+            self.migrate_index(self.get_index_db(src_file, self._index_dir))
+        # read meta from index db
+        conn = sqlite3.connect(self._mdx_db)
+        # 判断有无版本号
+        cursor = conn.execute("SELECT * FROM META WHERE key = \"version\"")
+        for cc in cursor:
+            self._version = cc[1]
+        cursor = conn.execute("SELECT * FROM META WHERE key = \"encoding\"")
+        for cc in cursor:
+            self._encoding = cc[1]
+        cursor = conn.execute("SELECT * FROM META WHERE key = \"stylesheet\"")
+        for cc in cursor:
+            self._stylesheet = ast.literal_eval(cc[1])
+
+        cursor = conn.execute("SELECT * FROM META WHERE key = \"title\"")
+        for cc in cursor:
+            self._title = cc[1]
+
+        cursor = conn.execute("SELECT * FROM META WHERE key = \"description\"")
+        for cc in cursor:
+            self._description = cc[1]
+
+        cursor = conn.execute("SELECT * FROM META WHERE key = \"prerender\"")
+        for cc in cursor:
+            self.prerendered = cc[1] == '1'
+        conn.close()
 
     @classmethod
     def get_index_db(cls, mdx_file, index_dir=None):
@@ -108,29 +179,102 @@ class IndexBuilder2(IndexBuilder):
         if not row or m_time != row['m_time']:
             return True
 
-    def _make_mdx_index(self, db_name):
-        super(IndexBuilder2, self)._make_mdx_index(db_name)
-
-        pattern = '[%s ]' % string.punctuation.replace('@', '')
-        regex_strip = re.compile(pattern)
+    @classmethod
+    def is_prerendered(cls, mdx_file, index_dir=None):
+        db_name = cls.get_index_db(mdx_file, index_dir)
+        if not os.path.isfile(db_name):
+            return False
+        conn = sqlite3.connect(db_name)
+        try:
+            row = conn.execute('SELECT value FROM META WHERE key = "prerender"').fetchone()
+        finally:
+            conn.close()
+        return bool(row) and row[0] == '1'
 
+    def migrate_index(self, db_name):
+        """add or refill key_fold column of index db built by older version"""
         conn = sqlite3.connect(db_name)
-        c = conn.cursor()
-        fix_keys = []
-        for row in c.execute('SELECT * FROM MDX_INDEX').fetchall():
-            fix_key = regex_strip.sub(' ', row[0].strip())
-            if fix_key != row[0]:
-                fix_keys.append((fix_key,) + row[1:])
-        c.executemany('INSERT INTO MDX_INDEX VALUES (?,?,?,?,?,?,?,?)', fix_keys)
-        conn.commit()
-        m_time = '%s' % os.path.getmtime(self._mdx_file)
-        c.execute('INSERT INTO META VALUES (?,?)', ('m_time', m_time))
-        conn.commit()
-        conn.close()
+        try:
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(MDX_INDEX)')]
+            row = conn.execute('SELECT value FROM META WHERE key = "key_fold"').fetchone()
+            if 'key_fold' in columns and row and row[0] == self._key_fold:
+                return
+            key_fold = self._key_fold
+            try:
+                conn.create_function('fold_key', 1, lambda text: fold_key(text, key_fold))
+                if 'key_fold' not in columns:
+                    conn.execute('ALTER TABLE MDX_INDEX ADD COLUMN key_fold text')
+                conn.execute('UPDATE MDX_INDEX SET key_fold = fold_key(key_text)')
+                conn.execute('CREATE INDEX IF NOT EXISTS key_fold_index ON MDX_INDEX (key_fold)')
+                conn.execute('DELETE FROM META WHERE key = "key_fold"')
+                conn.execute('INSERT INTO META VALUES (?,?)', ('key_fold', key_fold))
+                conn.commit()
+            except sqlite3.OperationalError:
+                # read only, lookup with lower(key_text)
+                conn.rollback()
+                self._unfolded.add(db_name)
+        finally:
+            conn.close()
+
+    def _variant_key(self, key_text):
+        """key with punctuation replaced by space, None if it is the same"""
+        fix_key = regex_strip.sub(' ', key_text.strip())
+        if fix_key != key_text:
+            return fix_key
+
+    def _index_meta(self, src_file):
+        meta = [('m_time', '%s' % self._m_times[src_file])]
+        if src_file == self._mdx_file and self._prerender:
+            meta.append(('prerender', '1'))
+        return meta
+
+    def _index_rows(self, mdx, cursor):
+        rows = super(IndexBuilder2, self)._index_rows(mdx, cursor)
+        if not self._prerender:
+            return rows
+        return self._prerender_rows(rows, cursor.connection.cursor())
+
+    def _prerender_rows(self, rows, cursor):
+        """
+        index rows pointing into RECORD_BLOCK instead of the mdx file. records
+        are stored as utf-8 after decode_record and fix_html, zlib compressed
+        in blocks: file_pos is the block_id, offset is 0.
+        """
+        cursor.execute('CREATE TABLE RECORD_BLOCK (block_id integer primary key, data blob)')
+        block = []
+        block_rows = []
+        block_size = 0
+        record_block = None
+        file_pos = None
+        with open(self._mdx_file, 'rb') as fmdx:
+            for row in rows:
+                index = self._make_index(row)
+                if index['file_pos'] != file_pos:
+                    # rows are in file order, each mdx block is read once
+                    file_pos = index['file_pos']
+                    record_block = self.get_record_block(fmdx, index)
+                record = self.decode_record(self.slice_record(record_block, index))
+                record = fix_html(record).encode('utf-8')
+                block_rows.append((row[0], block_size, block_size + len(record)))
+                block.append(record)
+                block_size += len(record)
+                if block_size >= self._prerender_block_size:
+                    yield from self._flush_block(cursor, block, block_rows)
+                    block, block_rows, block_size = [], [], 0
+            if block_rows:
+                yield from self._flush_block(cursor, block, block_rows)
+
+    @staticmethod
+    def _flush_block(cursor, block, block_rows):
+        data = b''.join(block)
+        compressed = zlib.compress(data)
+        cursor.execute('INSERT INTO RECORD_BLOCK (data) VALUES (?)', (compressed, ))
+        block_id = cursor.lastrowid
+        # record_block_type 2: zlib
+        for key_text, start, end in block_rows:
+            yield key_text, block_id, len(compressed), len(data), 2, start, end, 0
 
     def _make_mdd_index(self, db_name, mdd_name=None):
-        if os.path.exists(db_name):
-            os.remove(db_name)
         old_mdd_file = self._mdd_file
         if not mdd_name:
             # first mdd, mdd_name is self._mdd_file
@@ -138,89 +282,225 @@ class IndexBuilder2(IndexBuilder):
         else:
             # second mdd
             self._mdd_file = mdd_name
-        m_time = '%s' % os.path.getmtime(self._mdd_file)
-        super(IndexBuilder2, self)._make_mdd_index(db_name)
-        self._mdd_file = old_mdd_file
+        try:
+            super(IndexBuilder2, self)._make_mdd_index(db_name)
+        finally:
+            self._mdd_file = old_mdd_file
 
-        conn = sqlite3.connect(db_name)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE META (key text, value text)''')
-        conn.commit()
-        c.execute('INSERT INTO META VALUES (?,?)', ('m_time', m_time))
-        conn.commit()
-        conn.close()
+    def get_pool(self, db_name=None):
+        """connection pool of index db, default is mdx index db"""
+        db_name = db_name or self._mdx_db
+        pool = self._pools.get(db_name)
+        if pool is None:
+            with self._pool_lock:
+                pool = self._pools.get(db_name)
+                if pool is None:
+                    # index db is only rewritten by ourself before pool is created
+                    pool = ConnectionPool(db_name, self._pool_size, immutable=True,
+                                          timeout=self._pool_timeout)
+                    self._pools[db_name] = pool
+        return pool
 
-    @staticmethod
-    def lookup_indexes(db, keyword, ignorecase=None):
+    def close(self):
+        with self._pool_lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+        close_mapped(self._mdx_file)
+        for mdd_file in self._mdd_files:
+            close_mapped(mdd_file)
+
+    def get_record_block(self, fmdx, index):
+        """decompressed record block, shared by all entries in it through cache"""
+        if self._block_cache is None or index['record_block_type'] == 0:
+            return super(IndexBuilder2, self).get_record_block(fmdx, index)
+        # m_time keeps blocks of a replaced file apart
+        key = (fmdx.name, self._m_times.get(fmdx.name), index['file_pos'])
+        block = self._block_cache.get(key)
+        if block is None:
+            block = super(IndexBuilder2, self).get_record_block(fmdx, index)
+            self._block_cache.set(key, block)
+        return block
+
+    def get_prerendered_block(self, conn, index):
+        """decompressed RECORD_BLOCK of a prerendered index db, through cache"""
+        key = (self._mdx_db, self._m_times.get(self._mdx_file), index['file_pos'])
+        block = self._block_cache.get(key) if self._block_cache is not None else None
+        if block is None:
+            sql = 'SELECT data FROM RECORD_BLOCK WHERE block_id = ?'
+            data = conn.execute(sql, (index['file_pos'], )).fetchone()[0]
+            block = decompress(index['record_block_type'] & 0xf, data, index['decompressed_size'])
+            if self._block_cache is not None:
+                self._block_cache.set(key, block)
+        return block
+
+    @contextmanager
+    def _connection(self, db_name, conn=None):
+        if conn is not None:
+            yield conn
+        else:
+            with self.get_pool(db_name).connection() as conn:
+                yield conn
+
+    def fold_word(self, keyword):
+        """key an ignorecase lookup of keyword looks for in the mdx index"""
+        if self._mdx_db in self._unfolded:
+            return keyword.lower()
+        return fold_key(keyword, self._key_fold)
+
+    def lookup_indexes(self, conn, keyword, ignorecase=None, db_name=None):
         indexes = []
-        with sqlite3.connect(db) as conn:
-            if ignorecase:
-                sql = 'SELECT * FROM MDX_INDEX WHERE lower(key_text) = ?'
-                cursor = conn.execute(sql, (keyword.lower(), ))
-            else:
-                sql = 'SELECT * FROM MDX_INDEX WHERE key_text = ?'
-                cursor = conn.execute(sql, (keyword, ))
-
-            for result in cursor:
-                index = {}
-                index['file_pos'] = result[1]
-                index['compressed_size'] = result[2]
-                index['decompressed_size'] = result[3]
-                index['record_block_type'] = result[4]
-                index['record_start'] = result[5]
-                index['record_end'] = result[6]
-                index['offset'] = result[7]
-                indexes.append(index)
+        if ignorecase and (db_name or self._mdx_db) in self._unfolded:
+            sql = 'SELECT * FROM MDX_INDEX WHERE lower(key_text) = ?'
+            cursor = conn.execute(sql, (keyword.lower(), ))
+        elif ignorecase:
+            sql = 'SELECT * FROM MDX_INDEX WHERE key_fold = ?'
+            cursor = conn.execute(sql, (fold_key(keyword, self._key_fold), ))
+        else:
+            sql = 'SELECT * FROM MDX_INDEX WHERE key_text = ?'
+            cursor = conn.execute(sql, (keyword, ))
+
+        for result in cursor:
+            indexes.append(self._make_index(result))
         return indexes
 
+    @staticmethod
+    def _make_index(result):
+        index = {}
+        index['file_pos'] = result[1]
+        index['compressed_size'] = result[2]
+        index['decompressed_size'] = result[3]
+        index['record_block_type'] = result[4]
+        index['record_start'] = result[5]
+        index['record_end'] = result[6]
+        index['offset'] = result[7]
+        return index
+
+    def lookup_indexes_many(self, conn, keywords, ignorecase=None):
+        """{keyword: indexes} of found keywords, one IN query per chunk of keywords"""
+        unfolded = self._mdx_db in self._unfolded
+        keys = {}
+        for keyword in keywords:
+            key = self.fold_word(keyword) if ignorecase else keyword
+            keys.setdefault(key, []).append(keyword)
+        if ignorecase:
+            column = 'lower(key_text)' if unfolded else 'key_fold'
+        else:
+            column = 'key_text'
+        key_list = list(keys)
+        found = {}
+        for i in range(0, len(key_list), self._max_variables):
+            chunk = key_list[i:i + self._max_variables]
+            sql = 'SELECT key_text, file_pos, compressed_size, decompressed_size, ' \
+                  'record_block_type, record_start, record_end, offset, %s ' \
+                  'FROM MDX_INDEX WHERE %s IN (%s)' % (column, column, ','.join('?' * len(chunk)))
+            for result in conn.execute(sql, chunk):
+                index = self._make_index(result)
+                for keyword in keys[result[8] if ignorecase else result[0]]:
+                    found.setdefault(keyword, []).append(index)
+        return found
+
     def mdx_lookup(self, conn, keyword, ignorecase=None):
         if not os.path.exists(self._mdx_db):
             return []
         # return super(IndexBuilder2, self).mdx_lookup(keyword, ignorecase)
         # super mdx_lookup code
         lookup_result_list = []
-        indexes = self.lookup_indexes(self._mdx_db, keyword, ignorecase)
-        with open(self._mdx_file, 'rb') as mdx_file:
-            for index in indexes:
-                lookup_result_list.append(self.get_mdx_by_index(mdx_file, index))
+        with self._connection(self._mdx_db, conn) as conn:
+            indexes = self.lookup_indexes(conn, keyword, ignorecase)
+            if self.prerendered:
+                return [self.slice_record(self.get_prerendered_block(conn, index), index)
+                        .decode('utf-8') for index in indexes]
+        if not indexes:
+            return lookup_result_list
+        mdx_file = open_mapped(self._mdx_file)
+        for index in indexes:
+            lookup_result_list.append(self.get_mdx_by_index(mdx_file, index))
         return lookup_result_list
 
+    def mdx_lookup_many(self, conn, keywords, ignorecase=None):
+        """
+        records of each keyword, in the order of keywords.
+        entries are grouped by record block, each block is decompressed once.
+        """
+        results = [[] for keyword in keywords]
+        if not os.path.exists(self._mdx_db):
+            return results
+        with self._connection(self._mdx_db, conn) as conn:
+            found = self.lookup_indexes_many(conn, keywords, ignorecase)
+            blocks = {}
+            for records, keyword in zip(results, keywords):
+                for index in found.get(keyword, []):
+                    blocks.setdefault(index['file_pos'], []).append((records, len(records), index))
+                    records.append(None)
+            if self.prerendered:
+                for entries in blocks.values():
+                    record_block = self.get_prerendered_block(conn, entries[0][2])
+                    for records, i, index in entries:
+                        records[i] = self.slice_record(record_block, index).decode('utf-8')
+                return results
+        mdx_file = open_mapped(self._mdx_file)
+        for entries in blocks.values():
+            record_block = self.get_record_block(mdx_file, entries[0][2])
+            for records, i, index in entries:
+                records[i] = self.decode_record(self.slice_record(record_block, index))
+        return results
+
     def mdd_lookup(self, conn, keyword, ignorecase=None):
         """ MDD is resource file, should always return one file """
         for mdd_file in self._mdd_files:
             mdd_db = self.get_index_db(mdd_file, self._index_dir)
             if not os.path.exists(mdd_db):
                 continue
-            indexes = self.lookup_indexes(mdd_db, keyword, ignorecase)
+            # conn is for mdx index db, mdd use its own pool
+            with self._connection(mdd_db) as mdd_conn:
+                indexes = self.lookup_indexes(mdd_conn, keyword, ignorecase, mdd_db)
             if indexes:
-                with open(mdd_file, 'rb') as mdd_fobj:
-                    return self.get_mdd_by_index(mdd_fobj, indexes[0])
+                return self.get_mdd_by_index(open_mapped(mdd_file), indexes[0])
 
     @staticmethod
-    def get_keys(db, query=''):
-        if not db:
+    def get_keys(conn, query=''):
+        if not conn:
             return []
-        with sqlite3.connect(db) as conn:
-            if query:
-                if '*' in query:
-                    query = query.replace('*', '%')
-                else:
-                    query = query + '%'
-                sql = 'SELECT key_text FROM MDX_INDEX WHERE key_text LIKE ?;'
-                cursor = conn.execute(sql, (query,))
+        if query:
+            if '*' in query:
+                query = query.replace('*', '%')
             else:
-                sql = 'SELECT key_text FROM MDX_INDEX;'
-                cursor = conn.execute(sql)
+                query = query + '%'
+            sql = 'SELECT key_text FROM MDX_INDEX WHERE key_text LIKE ?;'
+            cursor = conn.execute(sql, (query,))
+        else:
+            sql = 'SELECT key_text FROM MDX_INDEX;'
+            cursor = conn.execute(sql)
 
-            keys = [item[0] for item in cursor]
-            return keys
+        keys = [item[0] for item in cursor]
+        return keys
+
+    def get_sorted_keys(self):
+        """(key_fold, key_text) of all mdx keys, for suggestion"""
+        with self._connection(self._mdx_db) as conn:
+            if self._mdx_db in self._unfolded:
+                rows = conn.execute('SELECT key_text FROM MDX_INDEX')
+                key_fold = self._key_fold
+                for row in sorted((fold_key(row[0], key_fold), row[0]) for row in rows):
+                    yield row
+                return
+            sql = 'SELECT key_fold, key_text FROM MDX_INDEX ORDER BY key_fold, key_text'
+            for row in conn.execute(sql):
+                yield row[0], row[1]
 
     def get_mdx_keys(self, conn, query=''):
-        return self.get_keys(self._mdx_db, query)
+        if not os.path.exists(self._mdx_db):
+            return []
+        with self._connection(self._mdx_db, conn) as conn:
+            return self.get_keys(conn, query)
 
     def get_mdd_keys(self, conn, query=''):
         keys = []
         for mdd_file in self._mdd_files:
             mdd_db = self.get_index_db(mdd_file, self._index_dir)
-            keys.extend(self.get_keys(mdd_db, query))
+            if not os.path.exists(mdd_db):
+                continue
+            with self._connection(mdd_db) as mdd_conn:
+                keys.extend(self.get_keys(mdd_conn, query))
         return keys
@@ -0,0 +1,164 @@
+"""
+rewrite links of dictionary records for the /query page
+
+the record regexes run one after another as before, each only when its
+attribute is in the record. the href and src links of the assembled page are
+rewritten in one pass, urls of sound:// and entry:// links are built from a
+prefix taken once from url_for and quoted the way url_for quotes them.
+"""
+import re
+import string
+import urllib.parse
+from functools import partial
+
+from flask import url_for
+
+
+# img src
+regex_src_schema = re.compile(r'([ "]src=["\'])(/|file:///)?(?!data:)(.+?["\'])')
+# http://.../
+regex_href_end_slash = re.compile(r'([ "]href=["\'].+?)(/)(["\'])')
+# sound://
+regex_href_schema_sound = re.compile(r'([ "]href=["\'])(sound://)([^#].+?["\'])')
+# entry://
+regex_href_schema_entry = re.compile(r'([ "]href=["\'])(entry://)([^#].+?["\'])')
+# /xxx/xxx.css
+regex_href_no_schema = re.compile(
+    r'([ "]href=["\'])(?!http://|https://|sound://|entry://)([^#].+?["\'])'
+)
+
+# css
+regex_css = re.compile(r'(<link.*? )(href)(=".+?>)')
+# js
+regex_js = re.compile(r'(<script.*? )(src)(=".+?>)')
+
+# links of the page: href, then src
+regex_href = re.compile(r'( href=")(.+?)(")')
+regex_src = re.compile(r'( src=")(?!data:)(.+?)(")')
+regex_link = re.compile(r'( href=")(.+?)(")|( src=")(?!data:)(.+?)(")')
+regex_double_slash = re.compile(r"(?<!:)//")
+
+# characters quoted by url_for are found from these
+quote_chars = string.punctuation + " "
+quote_probe = string.ascii_letters + string.digits + string.punctuation + " \xe9中"
+# quote functions by url argument, None if url_for can not be followed
+_quotes = {}
+
+
+def rewrite_record(record, prefix_resource, keep_css=True, keep_js=True):
+    """resource links of a record point to prefix_resource"""
+    # remove http:// from sound:// and entry://
+    if "href=" in record and ('/"' in record or "/'" in record):
+        record = regex_href_end_slash.sub(r"\1\3", record)
+    # <img src="<add:resource/>...
+    if "src=" in record:
+        record = regex_src_schema.sub(r"\g<1>%s/\3" % prefix_resource, record)
+    # <a href="sound://<add:resource/>...
+    # record = regex_href_schema_sound.sub(r'\1\g<2>%s/\3' % prefix_resource[7:], record)
+    # <a href="<add:resource/>image.png
+    if "href=" in record:
+        record = regex_href_no_schema.sub(r"\g<1>%s/\2" % prefix_resource, record)
+    # entry://
+    # record = regex_href_schema_entry.sub(r'\1\g<2>%s\3' % prefix_entry[7:], record)
+
+    if not keep_css and "<link" in record:
+        record = regex_css.sub(r"\1data-\2\3", record)
+    if not keep_js and "<script" in record:
+        record = regex_js.sub(r"\1data-\2\3", record)
+    return record
+
+
+def _find_quote(build):
+    """
+    quote(value) giving build(value) == build("") + quote(value),
+    None if url_for quotes in a way not followed here.
+    """
+    prefix = build("")
+    safe = "".join(c for c in quote_chars if build(c) == prefix + c)
+    if build(" ") == prefix + "+":
+        quote = partial(urllib.parse.quote_plus, safe=safe)
+    else:
+        quote = partial(urllib.parse.quote, safe=safe)
+    if build(quote_probe) != prefix + quote(quote_probe):
+        return None
+    return quote
+
+
+class PageUrls(object):
+    """absolute urls of the links of a /query page"""
+
+    def __init__(self, uuid, scheme):
+        self.uuid = uuid
+        self.scheme = scheme
+        self.sound_url = self._url_of(".query_resource", "resource")
+        self.entry_url = self._url_of(".query_word_lite", "word")
+
+    def _url_of(self, endpoint, name):
+        def build(value):
+            return url_for(
+                endpoint,
+                uuid=self.uuid,
+                _external=True,
+                _scheme=self.scheme,
+                **{name: value},
+            )
+
+        key = (endpoint, name)
+        if key not in _quotes:
+            _quotes[key] = _find_quote(build)
+        quote = _quotes[key]
+        if quote is None:
+            return build
+        prefix = build("")
+        return lambda value: prefix + quote(value)
+
+    def replace(self, head, url, tail):
+        url = urllib.parse.unquote(url)
+        if url.startswith("sound://"):
+            sound_url = self.sound_url(url[8:])
+            return f' data-sound-url="{sound_url}"' + head + url + tail
+        elif url.startswith("entry://"):
+            entry_url = self.entry_url(url[8:])
+            return f' data-entry-url="{entry_url}"' + head + url + tail
+        elif url.startswith("/static/"):
+            url2 = url_for(
+                "static", filename=url[8:], _external=True, _scheme=self.scheme
+            )
+        else:
+            url2 = regex_double_slash.sub("/", url)
+        return head + url2 + tail
+
+
+def rewrite_links(html, urls):
+    """
+    href and src links of html by urls, the same as a pass over href links
+    followed by a pass over src links. the passes are kept when one could
+    change what the other matches: empty values, or a link inside another.
+    """
+
+    def replace_one(mo):
+        return urls.replace(*mo.groups())
+
+    def two_passes():
+        return regex_src.sub(replace_one, regex_href.sub(replace_one, html))
+
+    if ' href=""' in html or ' src=""' in html:
+        return two_passes()
+
+    overlap = []
+
+    def replace(mo):
+        if mo.group(1) is not None:
+            text = urls.replace(*mo.group(1, 2, 3))
+            if ' src="' in text or ' src="' in mo.group(0):
+                overlap.append(mo)
+        else:
+            text = urls.replace(*mo.group(4, 5, 6))
+            if ' href="' in mo.group(0):
+                overlap.append(mo)
+        return text
+
+    result = regex_link.sub(replace, html)
+    if overlap:
+        return two_passes()
+    return result
@@ -0,0 +1,81 @@
+import heapq
+import itertools
+from array import array
+from bisect import bisect_left
+
+
+# sorts after every code point, "prefix" + end_of_prefix ends a prefix range
+end_of_prefix = "\U0010ffff".encode("utf-8")
+
+
+def _encode(text):
+    return text.encode("utf-8", "surrogatepass")
+
+
+def _decode(data):
+    return data.decode("utf-8", "surrogatepass")
+
+
+class KeyIndex(object):
+    """
+    case folded keys of one dictionary kept in sorted order in memory,
+    a prefix is a contiguous range found by bisect.
+
+    the folds are packed as utf-8 in one buffer with their end offsets in an
+    array('Q'), like word_query.key_list.KeyList. utf-8 keeps the code point
+    order of the folds. a key is stored in a second buffer only where it
+    differs from its fold, an empty span means the fold itself.
+    """
+
+    def __init__(self, rows):
+        # rows: (key_fold, key_text) sorted by key_fold, key_text
+        folds = bytearray()
+        keys = bytearray()
+        self._fold_ends = array("Q")
+        self._key_ends = array("Q")
+        for fold, key in rows:
+            folds += _encode(fold)
+            self._fold_ends.append(len(folds))
+            if key != fold:
+                keys += _encode(key)
+            self._key_ends.append(len(keys))
+        self._folds = bytes(folds)
+        self._keys = bytes(keys)
+
+    def __len__(self):
+        return len(self._fold_ends)
+
+    def __getitem__(self, i):
+        # the utf-8 fold of key i, lets bisect search the packed folds
+        start = self._fold_ends[i - 1] if i else 0
+        return self._folds[start:self._fold_ends[i]]
+
+    def prefix_range(self, prefix):
+        prefix = _encode(prefix)
+        lo = bisect_left(self, prefix)
+        hi = bisect_left(self, prefix + end_of_prefix, lo)
+        return lo, hi
+
+    def iter_prefix(self, prefix):
+        """yield (key_fold, key_text) of keys starting with folded prefix"""
+        lo, hi = self.prefix_range(prefix)
+        folds, fold_ends = self._folds, self._fold_ends
+        keys, key_ends = self._keys, self._key_ends
+        fold_start = fold_ends[lo - 1] if lo else 0
+        key_start = key_ends[lo - 1] if lo else 0
+        for i in range(lo, hi):
+            fold = _decode(folds[fold_start:fold_ends[i]])
+            if key_ends[i] == key_start:
+                yield fold, fold
+            else:
+                yield fold, _decode(keys[key_start:key_ends[i]])
+            fold_start = fold_ends[i]
+            key_start = key_ends[i]
+
+
+def suggest(key_indexes, prefix, limit=None, offset=0):
+    """merge prefix matches of several dictionaries, drop duplicates"""
+    merged = heapq.merge(*[idx.iter_prefix(prefix) for idx in key_indexes])
+    keys = (key for key, _ in itertools.groupby(key for _, key in merged))
+    stop = offset + limit if limit and limit > 0 else None
+    return list(itertools.islice(keys, offset, stop))
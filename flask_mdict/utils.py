@@ -1,3 +1,6 @@
+import re
+from collections import Counter
+
 
 def singleton(cls):
     instances = {}
@@ -7,3 +10,41 @@ def singleton(cls):
             instances[cls] = cls(*args, **kwargs)
         return instances[cls]
     return getinstance
+
+
+regex_opened_tag = re.compile(r"<([a-z]+)(?: .*?)?>", re.DOTALL | re.IGNORECASE)
+regex_closed_tag = re.compile(r"</([a-z]+)>", re.IGNORECASE)
+
+
+# tags not counted, "p" is often left open
+void_tags = {"img", "link", "input", "br", "hr", "p", "meta"}
+
+
+def fix_html(html_data):
+    """
+    close tags left open at the end, open tags closed without opening at the
+    start, matched by count of each tag name.
+    """
+    opened_tags = regex_opened_tag.findall(html_data)
+    closed_tags = regex_closed_tag.findall(html_data)
+    opened_tags = [tag for tag in map(str.lower, opened_tags) if tag not in void_tags]
+    closed_tags = [tag for tag in map(str.lower, closed_tags) if tag not in void_tags]
+    if len(opened_tags) == len(closed_tags):
+        return html_data
+    # the last openings of a tag are the closed ones
+    closing = Counter(closed_tags)
+    suffix = []
+    for tag in reversed(opened_tags):
+        if closing[tag]:
+            closing[tag] -= 1
+        else:
+            suffix.append("</%s>" % tag)
+    # the first closings of a tag are the opened ones
+    opening = Counter(opened_tags)
+    prefix = []
+    for tag in closed_tags:
+        if opening[tag]:
+            opening[tag] -= 1
+        else:
+            prefix.append("<%s>" % tag)
+    return "".join(reversed(prefix)) + html_data + "".join(suffix)
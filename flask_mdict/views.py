@@ -1,7 +1,11 @@
 import io
 import re
+import time
+import hashlib
+import logging
 import os.path
-import urllib.parse
+import mimetypes
+from concurrent.futures import TimeoutError
 
 from flask import (
     send_file,
@@ -12,29 +16,27 @@ from flask import (
     request,
     make_response,
 )
+from werkzeug.security import safe_join
 
-from . import mdict, get_mdict, get_db, Config
-from . import helper
+from . import mdict, get_mdict, get_db, detach_db, Config
+from . import helper, rewrite
+from .suggest import suggest
+from .db_pool import PoolTimeout
+from .word_query.mdict_query import fold_key
 
 
+logger = logging.getLogger(__name__)
+
 regex_word_link = re.compile(r"^(@@@LINK=)(.+)$")
-# img src
-regex_src_schema = re.compile(r'([ "]src=["\'])(/|file:///)?(?!data:)(.+?["\'])')
-# http://.../
-regex_href_end_slash = re.compile(r'([ "]href=["\'].+?)(/)(["\'])')
-# sound://
-regex_href_schema_sound = re.compile(r'([ "]href=["\'])(sound://)([^#].+?["\'])')
-# entry://
-regex_href_schema_entry = re.compile(r'([ "]href=["\'])(entry://)([^#].+?["\'])')
-# /xxx/xxx.css
-regex_href_no_schema = re.compile(
-    r'([ "]href=["\'])(?!http://|https://|sound://|entry://)([^#].+?["\'])'
-)
 
-# css
-regex_css = re.compile(r'(<link.*? )(href)(=".+?>)')
-# js
-regex_js = re.compile(r'(<script.*? )(src)(=".+?>)')
+
+@mdict.errorhandler(PoolTimeout)
+def pool_timeout(err):
+    """all connections of a dictionary stayed busy, ask the client to retry"""
+    logger.warning("%s", err)
+    resp = make_response("Service Unavailable", 503)
+    resp.headers["Retry-After"] = "1"
+    return resp
 
 
 @mdict.route("/")
@@ -186,15 +188,42 @@ def index():
 
 @mdict.route("/search")
 def query_part():
-    part = request.args.get("part", default="", type=str)
-    contents = set()
-    for uuid, item in get_mdict().items():
-        if item["type"] == "app":
-            continue
-        if item["enable"]:
-            content = item["query"].get_mdx_keys(get_db(uuid), part)
+    part, limit, offset, items = search_args()
+    suggestion = suggest_in_memory(part, limit, offset, items)
+    if suggestion is None:
+        # wildcard, search in db
+        contents = set()
+        for item in items:
+            content = item["query"].get_mdx_keys(get_db(item["uuid"]), part)
             contents |= set(content)
-    return jsonify(suggestion=sorted(contents))
+        suggestion = page_of(contents, limit, offset)
+    return jsonify(suggestion=suggestion)
+
+
+def search_args():
+    part = request.args.get("part", default="", type=str)
+    limit = request.args.get("limit", default=Config.MDICT_SUGGEST_LIMIT, type=int)
+    offset = max(request.args.get("offset", default=0, type=int), 0)
+    items = [
+        item
+        for item in get_mdict().values()
+        if item["type"] != "app" and item["enable"] and item["ready"]
+    ]
+    return part, limit, offset, items
+
+
+def suggest_in_memory(part, limit, offset, items):
+    """suggestion from the in-memory key indexes, None if it needs the dbs"""
+    if "*" not in part and all(item["keys"] is not None for item in items):
+        key_indexes = [item["keys"] for item in items]
+        prefix = fold_key(part, Config.MDICT_KEY_FOLD)
+        return suggest(key_indexes, prefix, limit, offset)
+
+
+def page_of(contents, limit, offset):
+    contents = sorted(contents)
+    stop = offset + limit if limit > 0 else None
+    return contents[offset:stop]
 
 
 @mdict.route("/uuid_<uuid>/resource/<path:resource>", methods=["GET", "POST"])
@@ -202,17 +231,64 @@ def query_resource(uuid, resource):
     """query mdict resource file: mdd"""
     resource = resource.strip()
     item = get_mdict().get(uuid)
-    if not item:
+    if not item or not item["ready"]:
         abort(404)
+    data, path = load_resource(uuid, item, resource)
+    return resource_response(uuid, item, resource, data, path)
+
+
+# resources kept in the resource cache, css after scoping by helper.scoped_css
+cached_resource_types = ["css", "js", "png", "jpg", "woff2"]
+# bytes a resource that is not found is counted as in the cache
+missing_resource_size = 256
+
+
+def load_resource(uuid, item, resource):
+    """
+    (data, path) of resource through the resource cache, see read_resource.
+    data is None if it is not found, which is cached as b"".
+    """
+    cache = Config.RESOURCE_CACHE
+    key = (uuid, item.get("m_time"), resource)
+    data = cache.get(key)
+    if data is not None:
+        return data or None, None
 
-    # file, load from cache, local, static, mdd
-    fname = os.path.join(item["root_path"], resource)
-    # check cache
-    if resource in item:
-        data = item["cache"][resource]
-    elif os.path.exists(fname):
+    data, path = read_resource(uuid, item, resource)
+    if path is not None:
+        return None, path
+    if not data:
+        cache.set(key, b"", size=missing_resource_size)
+        return None, None
+    ext = resource.rpartition(".")[-1]
+    if ext == "css":
+        try:
+            data = helper.scoped_css(uuid, item, data)
+            item["error"] = ""
+        except Exception as err:
+            err_msg = "Error: %s - %s" % (resource, err)
+            logger.error(err_msg)
+            item["error"] = err_msg
+            return None, None
+    if ext in cached_resource_types:
+        cache.set(key, data)
+    return data, None
+
+
+def read_resource(uuid, item, resource):
+    """
+    (data, path) of resource from local disk, app static or mdd.
+    a local file other than css is sent from its path, data is None then.
+    a db connection is leased only for the mdd of a db dictionary.
+    """
+    # file, load from local, static, mdd
+    fname = safe_join(item["root_path"], resource)
+    if fname and os.path.isfile(fname):
         # mdict local disk
-        data = open(fname, "rb").read()
+        if not resource.endswith(".css"):
+            return None, os.path.abspath(fname)
+        with open(fname, "rb") as f:
+            data = f.read()
     else:
         # mdict mdd
         q = item["query"]
@@ -221,98 +297,358 @@ def query_resource(uuid, resource):
                 data = f.read()
         else:
             key = "\\%s" % "\\".join(resource.split("/"))
-            data = q.mdd_lookup(get_db(uuid), key, ignorecase=True)
+            # an mdx dictionary reads its mdd index dbs through their own pools
+            conn = None
+            if item["type"] == "mdict_db" and q.is_mdd():
+                conn = get_db(uuid)
+            data = q.mdd_lookup(conn, key, ignorecase=True)
     if not data:
         # load from flask static
         if resource in ["logo.ico", "css/reset.css", "css/mdict.css"]:
             with mdict.open_resource(os.path.join("static", resource)) as f:
                 data = f.read()
+    return data, None
 
-    if data:
-        ext = resource.rpartition(".")[-1]
-        if resource not in item and ext in ["css", "js", "png", "jpg", "woff2"]:
-            if resource.endswith(".css"):
-                try:
-                    s_data = data.decode("utf-8")
-                    s_data = helper.fix_css("#class_%s" % uuid, s_data)
-                    data = s_data.encode("utf-8")
-                    item["error"] = ""
-                except Exception as err:
-                    err_msg = "Error: %s - %s" % (resource, err.format_original_error())
-                    print(err_msg)
-                    item["error"] = err_msg
-                    abort(404)
-            if Config.MDICT_CACHE:
-                item["cache"][resource] = data  # cache css file
-
-        bio = io.BytesIO()
-        bio.write(data)
-        bio.seek(0)
-
-        resp = make_response(send_file(bio, download_name=resource))
-        resp.headers["Access-Control-Allow-Origin"] = "*"
-        return resp
-    else:
+
+# types of mdd resources that mimetypes may not know
+resource_types = {
+    "spx": "audio/ogg",
+    "ogg": "audio/ogg",
+    "woff": "font/woff",
+    "woff2": "font/woff2",
+    "ttf": "font/ttf",
+    "otf": "font/otf",
+    "svg": "image/svg+xml",
+    "js": "text/javascript",
+}
+
+
+def resource_mimetype(resource):
+    ext = resource.rpartition(".")[-1].lower()
+    return (
+        resource_types.get(ext)
+        or mimetypes.guess_type(resource)[0]
+        or "application/octet-stream"
+    )
+
+
+def resource_response(uuid, item, resource, data, path=None):
+    """
+    send resource data, or the local file at path, with Range support.
+    the ETag is made of the dictionary mtime and the resource key, the one of
+    css of its scoped content.
+    """
+    if path is None and not data:
         abort(404)
+    if path is None and resource.endswith(".css"):
+        # scoped css is told apart by its content
+        etag = data
+    else:
+        m_time = item.get("m_time")
+        if path is not None:
+            m_time = "%s:%s" % (m_time, os.path.getmtime(path))
+        etag = ("%s:%s:%s" % (uuid, m_time, resource)).encode("utf-8")
+    # BytesIO shares the buffer of data, send_file handles Range and ETag
+    resp = send_file(
+        path or io.BytesIO(data),
+        mimetype=resource_mimetype(resource),
+        download_name=resource,
+        etag=hashlib.sha1(etag).hexdigest(),
+        max_age=Config.MDICT_RESOURCE_MAX_AGE,
+        conditional=True,
+    )
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    return resp
+
+
+@mdict.route("/status")
+def status():
+    """readiness of dictionaries and index build progress"""
+    mdicts = []
+    for item in get_mdict().values():
+        progress = helper.index_progress.get(item["uuid"], {})
+        mdicts.append(
+            {
+                "uuid": item["uuid"],
+                "title": item["title"],
+                "enable": item["enable"],
+                "ready": item["ready"],
+                "error": item["error"],
+                "indexed": progress.get("built", 0),
+                "total": progress.get("total", 0),
+            }
+        )
+    return jsonify(
+        ready=all(item["ready"] for item in mdicts),
+        mdicts=mdicts,
+        block_cache=Config.BLOCK_CACHE.stats(),
+        page_cache=Config.PAGE_CACHE.stats(),
+        resource_cache=Config.RESOURCE_CACHE.stats(),
+    )
 
 
 @mdict.route("/query")
 def query_word_lite():
-    word = request.args.get("word", default="", type=str)
-    uuid = "all"
+    word, all_result, fallback, nohistory = query_args()
+    if not word:
+        return abort(404)
+    word = word.strip()
 
-    def url_replace(mo):
-        abs_url = mo.group(2)
-        abs_url = urllib.parse.unquote(abs_url)
-        if abs_url.startswith("sound://"):
-            sound_url = url_for(
-                ".query_resource",
-                uuid=uuid,
-                resource=abs_url[8:],
-                _external=True,
-                _scheme=scheme,
-            )
-            return (
-                f' data-sound-url="{sound_url}"' + mo.group(1) + abs_url + mo.group(3)
-            )
-        elif abs_url.startswith("entry://"):
-            entry_url = url_for(
-                ".query_word_lite",
-                uuid=uuid,
-                word=abs_url[8:],
-                _external=True,
-                _scheme=scheme,
-            )
-            return (
-                f' data-entry-url="{entry_url}"' + mo.group(1) + abs_url + mo.group(3)
-            )
-        elif abs_url.startswith("/static/"):
-            abs_url2 = url_for(
-                "static", filename=abs_url[8:], _external=True, _scheme=scheme
-            )
-        else:
-            abs_url2 = re.sub(r"(?<!:)//", "/", abs_url)
-        return mo.group(1) + abs_url2 + mo.group(3)
+    key, data = cached_page(word, all_result, fallback)
+    timings = {}
+    if data is None:
+        html = render_word(word, all_result, fallback, nohistory, timings=timings)
+        if not isinstance(html, str):
+            # redirect to linked entry
+            return html
+        data = cache_page(key, html, timings)
+    return page_response(data, timings)
 
-    scheme = "https"
+
+def query_args():
+    word = request.args.get("word", default="", type=str)
     all_result = request.args.get("all_result", "") == "true"
     fallback = request.args.get("fallback", "").split(",")
     nohistory = request.args.get("nohistory", "") == "true"
-    if not word:
-        return abort(404)
-    word = word.strip()
+    return word, all_result, fallback, nohistory
+
+
+def cached_page(word, all_result, fallback):
+    """(page cache key, cached page or None)"""
+    cache = Config.PAGE_CACHE
+    if not cache.enabled:
+        return None, None
+    key = helper.page_cache_key(word, all_result, fallback, request.host_url)
+    return key, cache.get(key)
+
+
+def cache_page(key, html, timings):
+    """utf-8 of html, cached unless a dictionary was left out"""
+    data = html.encode("utf-8")
+    if key is not None and all(t[2] == "ok" for t in timings.values()):
+        Config.PAGE_CACHE.set(key, data)
+    return data
+
+
+def page_response(data, timings):
+    resp = make_response(data)
+    if timings:
+        resp.headers["Server-Timing"] = server_timing(get_mdict().values(), timings)
+    resp.headers["Access-Control-Allow-Origin"] = "*"
+    resp.set_etag(hashlib.sha1(data).hexdigest())
+    return resp.make_conditional(request)
+
+
+@mdict.route("/query", methods=["POST"])
+def query_words():
+    """
+    look up many words at once, the body is a JSON list of words or
+    {"words": [...], "raw": false, "all_result": false, "fallback": []}.
+    every dictionary looks up all words with one query.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        data = {"words": data}
+    if not isinstance(data, dict):
+        abort(400)
+    words = data.get("words")
+    if not isinstance(words, list) or not all(isinstance(w, str) for w in words):
+        abort(400)
+    if len(words) > Config.MDICT_BATCH_LIMIT:
+        abort(413)
+    words = [word.strip() for word in words]
+    raw = bool(data.get("raw"))
+    all_result = bool(data.get("all_result"))
+    nohistory = bool(data.get("nohistory"))
+    fallback = data.get("fallback") or []
+    if isinstance(fallback, str):
+        fallback = fallback.split(",")
+
+    if raw:
+        records = lookup_words(words)
+        results = []
+        for i, word in enumerate(words):
+            found = [
+                {"uuid": uuid, "title": title, "records": word_records[i]}
+                for uuid, title, word_records, _ in records
+                if word_records[i]
+            ]
+            results.append({"word": word, "results": found})
+        return jsonify(results)
+
+    cache = Config.PAGE_CACHE
+    pages = {}
+    if cache.enabled:
+        for word in set(words):
+            key = helper.page_cache_key(word, all_result, fallback, request.host_url)
+            page = cache.get(key)
+            if page is not None:
+                pages[word] = page.decode("utf-8")
+    missing = [word for word in dict.fromkeys(words) if word and word not in pages]
+    records = lookup_words(missing)
+    # leave pages missing a timed out dictionary out of the cache
+    complete = all(status == "ok" for _, _, _, status in records)
+    for i, word in enumerate(missing):
+        prefetched = {uuid: word_records[i] for uuid, _, word_records, _ in records}
+        html = render_word(word, all_result, fallback, nohistory, prefetched)
+        pages[word] = html
+        if isinstance(html, str) and cache.enabled and complete:
+            key = helper.page_cache_key(word, all_result, fallback, request.host_url)
+            cache.set(key, html.encode("utf-8"))
+    results = []
+    for word in words:
+        page = pages.get(word, "")
+        if isinstance(page, str):
+            results.append({"word": word, "html": page})
+        else:
+            # a lone @@@LINK= entry, tell the client where it leads
+            results.append({"word": word, "html": "", "redirect": page.location})
+    return jsonify(results)
+
+
+def lookup_words(words):
+    """(uuid, title, records of each word, status) of every ready dictionary"""
+    calls = []
+    for item in get_mdict().values():
+        if not item["ready"]:
+            continue
+        q = item["query"]
+        if item["type"] == "app":
+            func = lambda q=q, item=item: [q(word, item) for word in words]
+        elif words:
+            conn = get_db(item["uuid"])
+            func = lambda q=q, conn=conn: q.mdx_lookup_many(conn, words, True)
+        else:
+            func = list
+        calls.append((item, func))
+    results = []
+    for (item, _), (records, _, status) in zip(calls, fan_out(calls)):
+        records = records or [[] for word in words]
+        results.append((item["uuid"], item["title"], records, status))
+    return results
+
+
+def lookup_word(items, word):
+    """{uuid: (records, seconds, status)} of word in every dictionary of items"""
+    calls = lookup_calls(items, word)
+    results = fan_out(calls)
+    return {item["uuid"]: result for (item, _), result in zip(calls, results)}
+
+
+def lookup_calls(items, word):
+    """(item, func) to look up word in every dictionary of items"""
+    calls = []
+    for item in items:
+        q = item["query"]
+        if item["type"] == "app":
+            func = lambda q=q, item=item: q(word, item)
+        else:
+            conn = get_db(item["uuid"])
+            func = lambda q=q, conn=conn: q.mdx_lookup(conn, word, True)
+        calls.append((item, func))
+    return calls
+
+
+def timed(func):
+    start = time.perf_counter()
+    return func(), time.perf_counter() - start
+
+
+def abandon(item, future):
+    """
+    give up a lookup that timed out. a lookup still waiting in the queue is
+    cancelled, one running keeps its db connection, which is taken out of
+    the app context and released when the lookup ends.
+    """
+    if future.cancel():
+        logger.warning('MDICT "%s" timed out in the queue' % item["title"])
+    else:
+        logger.warning('MDICT "%s" timed out' % item["title"])
+    lease = detach_db(item["uuid"])
+    if lease:
+        pool, conn = lease
+        # called at once when the future is cancelled or done already
+        future.add_done_callback(lambda f, pool=pool, conn=conn: pool.release(conn))
+
+
+def fan_out(calls):
+    """
+    run (item, func) calls, concurrently on Config.QUERY_EXECUTOR if any.
+    return (result, seconds, status) of each call in order. a call running
+    over MDICT_QUERY_TIMEOUT or failing gives result None, the others are
+    still returned.
+
+    db connections are leased in the request thread by the caller, a
+    call that times out before it starts is cancelled and its connection
+    released, one that is running keeps its connection until it ends.
+    """
+    executor = Config.QUERY_EXECUTOR
+    if executor is None or len(calls) < 2:
+        results = []
+        for item, func in calls:
+            result, seconds = timed(func)
+            results.append((result, seconds, "ok"))
+        return results
 
+    futures = [executor.submit(timed, func) for item, func in calls]
+    timeout = Config.MDICT_QUERY_TIMEOUT
+    deadline = time.monotonic() + timeout if timeout else None
+    results = []
+    for (item, func), future in zip(calls, futures):
+        wait = max(0, deadline - time.monotonic()) if deadline else None
+        try:
+            result, seconds = future.result(timeout=wait)
+            results.append((result, seconds, "ok"))
+        except TimeoutError:
+            abandon(item, future)
+            results.append((None, timeout, "timeout"))
+        except Exception:
+            logger.exception('MDICT "%s" lookup failed' % item["title"])
+            results.append((None, 0, "error"))
+    return results
+
+
+def server_timing(items, timings):
+    """Server-Timing header value of the lookup of each dictionary"""
+    metrics = []
+    for i, item in enumerate(items):
+        if item["uuid"] not in timings:
+            continue
+        _, seconds, status = timings[item["uuid"]]
+        desc = "%s %s" % (item["title"], status)
+        desc = desc.replace("\\", "").replace('"', "'")
+        metrics.append('dict%d;dur=%.1f;desc="%s"' % (i, seconds * 1000, desc))
+    return ", ".join(metrics)
+
+
+def render_word(
+    word, all_result, fallback, nohistory, prefetched=None, timings=None
+):
+    """
+    html of word from all dictionaries, or a redirect response for @@@LINK=.
+    prefetched: records of word by dictionary uuid, looked up in advance.
+    timings: dict filled with (records, seconds, status) by uuid of lookups.
+    """
+    uuid = "all"
+    scheme = "https"
+    urls = rewrite.PageUrls(uuid, scheme)
     html_contents = []
     found_word = False
-    items = [item for _, item in get_mdict().items()]
+    # dictionaries still being indexed are skipped
+    items = [item for item in get_mdict().values() if item["ready"]]
+    prefetched = prefetched or {}
+    # entry and word, load from mdx, db
+    looked_up = lookup_word(
+        [item for item in items if item["uuid"] not in prefetched], word
+    )
+    if timings is not None:
+        timings.update(looked_up)
     for item in items:
-        # entry and word, load from mdx, db
         cur_uuid = item["uuid"]
-        q = item["query"]
-        if item["type"] == "app":
-            records = q(word, item)
+        if cur_uuid in prefetched:
+            records = prefetched[cur_uuid]
         else:
-            records = q.mdx_lookup(get_db(cur_uuid), word, ignorecase=True)
+            records = looked_up[cur_uuid][0]
         if not records:
             continue
         html = []
@@ -349,8 +685,11 @@ def query_word_lite():
         for record in records:
             if record.startswith("@@@LINK="):
                 record_num -= 1
+        # records of a prerendered index db are balanced already
+        prerendered = getattr(item["query"], "prerendered", False)
         for record in records:
-            record = helper.fix_html(record)
+            if not prerendered:
+                record = helper.fix_html(record)
             mo = regex_word_link.match(record)
             if mo:
                 link = mo.group(2).strip()
@@ -384,25 +723,10 @@ def query_word_lite():
                             )
                         )
             else:
-                # remove http:// from sound:// and entry://
-                record = regex_href_end_slash.sub(r"\1\3", record)
-                # <img src="<add:resource/>...
-                record = regex_src_schema.sub(r"\g<1>%s/\3" % prefix_resource, record)
-                # <a href="sound://<add:resource/>...
-                # record = regex_href_schema_sound.sub(r'\1\g<2>%s/\3' % prefix_resource[7:], record)
-                # <a href="<add:resource/>image.png
-                record = regex_href_no_schema.sub(
-                    r"\g<1>%s/\2" % prefix_resource, record
+                # keep first css, keep last js
+                record = rewrite.rewrite_record(
+                    record, prefix_resource, count == 1, count >= record_num
                 )
-                # entry://
-                # record = regex_href_schema_entry.sub(r'\1\g<2>%s\3' % prefix_entry[7:], record)
-
-                # keep first css
-                if count > 1:
-                    record = regex_css.sub(r"\1data-\2\3", record)
-                # keep last js
-                if count < record_num:
-                    record = regex_js.sub(r"\1data-\2\3", record)
                 count += 1
 
             html.append(record)
@@ -415,13 +739,9 @@ def query_word_lite():
         )
         html = "\n".join(html)
         # fix url with "//"
-        # css, image
-        html = re.sub(r'( href=")(.+?)(")', url_replace, html)
-        # script
-        html = re.sub(r'( src=")(?!data:)(.+?)(")', url_replace, html)
+        # css, image, script
+        html = rewrite.rewrite_links(html, urls)
         html_contents.append(html)
         if uuid != "all" and not all_result:
             break
-    resp = make_response('<hr class="seprator" />'.join(html_contents))
-    resp.headers["Access-Control-Allow-Origin"] = "*"
-    return resp
+    return '<hr class="seprator" />'.join(html_contents)
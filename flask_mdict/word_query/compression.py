@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+Decompressors of MDict key and record blocks, by compression method
+(the low 4 bits of the block info).
+
+LZO blocks are decompressed by a compiled module when one is installed,
+python-lzo (``lzo``) or ``lzallright``, otherwise by the pure-Python decoder.
+"""
+
+import zlib
+from struct import pack
+
+from . import lzo as _pylzo
+
+try:
+    import lzo as _clzo
+except ImportError:
+    _clzo = None
+
+try:
+    from lzallright import LZOCompressor as _lzallright
+except ImportError:
+    _lzallright = None
+
+
+_decompressors = {}
+
+
+def register(method, func):
+    """use func(data, decompressed_size) to decompress blocks of method"""
+    _decompressors[method] = func
+
+
+def decompress(method, data, decompressed_size):
+    try:
+        func = _decompressors[method]
+    except KeyError:
+        raise Exception('compression method %d not supported' % method)
+    return func(data, decompressed_size)
+
+
+def _copy(data, decompressed_size):
+    return data
+
+
+def _zlib(data, decompressed_size):
+    return zlib.decompress(data)
+
+
+def _python_lzo(data, decompressed_size):
+    # python-lzo expects its own header: 0xf0 and the size in big endian
+    return _clzo.decompress(b'\xf0' + pack('>I', decompressed_size) + bytes(data))
+
+
+def _lzallright_lzo(data, decompressed_size):
+    return _lzallright.decompress(bytes(data), decompressed_size)
+
+
+def _pure_lzo(data, decompressed_size):
+    return _pylzo.decompress(data, decompressed_size)
+
+
+if _clzo is not None:
+    lzo_backend = 'python-lzo'
+    _lzo = _python_lzo
+elif _lzallright is not None:
+    lzo_backend = 'lzallright'
+    _lzo = _lzallright_lzo
+else:
+    lzo_backend = 'python'
+    _lzo = _pure_lzo
+
+register(0, _copy)
+register(1, _lzo)
+register(2, _zlib)
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Decryption of MDict blocks.
+
+RIPEMD-128 is not offered by hashlib (ripemd160 is a different digest) and
+Salsa20/8 is not offered by the common compiled cipher modules, so both stay
+pure Python. Their results are memoized instead: a block key is derived from
+the 4 byte checksum of the block, or is the key of the whole file, so the same
+few keys and keystreams come back on every lookup.
+"""
+
+from functools import lru_cache
+
+from .ripemd128 import ripemd128 as _ripemd128
+from .pureSalsa20 import Salsa20
+
+# byte with its two nibbles swapped
+_swap_nibbles = bytes(((i >> 4) | (i << 4)) & 0xff for i in range(256))
+_index_bytes = bytes(range(256))
+
+# an encrypted block prefix is at most 255 bytes long
+_keystream_size = 256
+
+
+def _repeat(pattern, size):
+    return (pattern * (size // len(pattern) + 1))[:size]
+
+
+def _xor(a, b):
+    size = len(a)
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b[:size], 'big')).to_bytes(size, 'big')
+
+
+@lru_cache(maxsize=4096)
+def _ripemd128_cached(message):
+    return _ripemd128(message)
+
+
+def ripemd128(message):
+    """memoized ripemd128 digest"""
+    return _ripemd128_cached(bytes(message))
+
+
+def fast_decrypt(data, key):
+    """
+    XOR decryption
+
+    every byte is nibble swapped and XORed with the previous ciphertext
+    byte, its index and the key. the previous byte is ciphertext, not
+    decrypted output, so all four streams are known in advance and XORed
+    at once as big integers.
+    """
+    data = bytes(data)
+    size = len(data)
+    if not size:
+        return data
+    t = int.from_bytes(data.translate(_swap_nibbles), 'big')
+    t ^= int.from_bytes(b'\x36' + data[:-1], 'big')
+    t ^= int.from_bytes(_repeat(_index_bytes, size), 'big')
+    t ^= int.from_bytes(_repeat(bytes(key), size), 'big')
+    return t.to_bytes(size, 'big')
+
+
+@lru_cache(maxsize=1024)
+def _salsa_keystream(key):
+    s20 = Salsa20(key=key, IV=b"\x00"*8, rounds=8)
+    return s20.encryptBytes(bytes(_keystream_size))
+
+
+def salsa_decrypt(ciphertext, encrypt_key):
+    """
+    salsa20 (8 rounds) decryption, the keystream of short input is memoized
+    """
+    ciphertext = bytes(ciphertext)
+    encrypt_key = bytes(encrypt_key)
+    if len(ciphertext) > _keystream_size:
+        s20 = Salsa20(key=encrypt_key, IV=b"\x00"*8, rounds=8)
+        return s20.encryptBytes(ciphertext)
+    return _xor(ciphertext, _salsa_keystream(encrypt_key))
+
+
+def decrypt_block(info, checksum, data, encrypted_key=None):
+    """
+    decrypt the data of a block, following the 8 byte info and checksum.
+    the checksum derives the key if the file has none.
+    """
+    encryption_method = (info >> 4) & 0xf
+    encryption_size = (info >> 8) & 0xff
+    if encryption_method == 0:
+        return data
+    if encrypted_key is None:
+        encrypted_key = ripemd128(checksum)
+    if encryption_method == 1:
+        return fast_decrypt(data[:encryption_size], encrypted_key) + data[encryption_size:]
+    elif encryption_method == 2:
+        return salsa_decrypt(data[:encryption_size], encrypted_key) + data[encryption_size:]
+    else:
+        raise Exception('encryption method %d not supported' % encryption_method)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only memory maps of MDX/MDD files, shared by all lookups.
+
+A record block is sliced out of the mapping as a memoryview, so reading
+a resource costs no open/seek/read and no copy before decompression.
+"""
+
+import mmap
+import threading
+
+
+class MappedFile(object):
+
+    def __init__(self, fname):
+        self.name = fname
+        with open(fname, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def __len__(self):
+        return len(self._mmap)
+
+    def read_at(self, pos, size):
+        """zero-copy slice of the file"""
+        return self._view[pos:pos + size]
+
+
+_mapped_files = {}
+_lock = threading.Lock()
+
+
+def open_mapped(fname):
+    """return the shared mapping of fname, mapping it on first use"""
+    mapped = _mapped_files.get(fname)
+    if mapped is None:
+        with _lock:
+            mapped = _mapped_files.get(fname)
+            if mapped is None:
+                mapped = _mapped_files[fname] = MappedFile(fname)
+    return mapped
+
+
+def close_mapped(fname):
+    """
+    forget the mapping of fname, the next open_mapped maps the file again.
+    lookups still running keep the old mapping alive until they finish,
+    it is unmapped when the last reference is gone.
+    """
+    with _lock:
+        _mapped_files.pop(fname, None)
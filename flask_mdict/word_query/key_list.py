@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Compact in-memory list of MDict keys.
+
+A list of (key_id, key_text) tuples costs a tuple, an int and a bytes
+object per entry, well over 100 bytes each. Here the key ids and the end
+offsets of the keys are kept in two ``array('Q')`` and the key texts are
+concatenated in one bytes buffer, 16 bytes per entry plus the text itself.
+"""
+
+from array import array
+from itertools import accumulate, chain
+from operator import itemgetter
+
+
+class KeyList(object):
+    """
+    sequence of (key_id, key_text) pairs, filled one key block at a time
+    """
+
+    def __init__(self, blocks=()):
+        self._ids = array('Q')
+        self._ends = array('Q')
+        buf = bytearray()
+        for pairs in blocks:
+            self._ids.extend(map(itemgetter(0), pairs))
+            texts = [key_text for key_id, key_text in pairs]
+            ends = accumulate(chain((len(buf),), map(len, texts)))
+            next(ends)
+            self._ends.extend(ends)
+            buf += b''.join(texts)
+        self._texts = bytes(buf)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, i):
+        key_id = self._ids[i]
+        if i < 0:
+            i += len(self._ids)
+        start = self._ends[i - 1] if i else 0
+        return key_id, self._texts[start:self._ends[i]]
+
+    def __iter__(self):
+        texts = self._texts
+        start = 0
+        for key_id, end in zip(self._ids, self._ends):
+            yield key_id, texts[start:end]
+            start = end
+
+    def keys(self):
+        """iterate over the key texts"""
+        return (key_text for key_id, key_text in self)
+
+    def nbytes(self):
+        """memory held by the arrays and the text buffer"""
+        return (len(self._texts) + self._ids.itemsize * len(self._ids)
+                + self._ends.itemsize * len(self._ends))
@@ -1,24 +1,20 @@
 # -*- coding: utf-8 -*-
 
 
-from .readmdict import MDX, MDD
-from struct import pack, unpack
-from io import BytesIO
+from .readmdict import MDict, MDX, MDD
+from .file_map import MappedFile
+from .compression import decompress
+from .crypto import decrypt_block
 import re
 import sys
 import os
 import sqlite3
 import json
 import ast
-
-# zlib compression is used for engine version >=2.0
-import zlib
-# LZO compression is used for engine version < 2.0
-try:
-    from . import lzo
-except ImportError:
-    lzo = None
-    #print("LZO compression support is not available")
+import unicodedata
+import tempfile
+from itertools import islice
+from contextlib import contextmanager
 
 # 2x3 compatible
 if sys.hexversion >= 0x03000000:
@@ -26,8 +22,37 @@ if sys.hexversion >= 0x03000000:
 
 version = '1.1'
 
+# `n` marks the start of text in style n of the stylesheet
+regex_style_tag = re.compile(b'`(\\d+)`')
+
+
+def fold_key(text, mode='case'):
+    """
+    normalized key stored in key_fold column for case insensitive lookup
+    mode 'accent' also folds accents and full width characters
+    """
+    if mode == 'accent':
+        text = ''.join(c for c in unicodedata.normalize('NFKD', text)
+                       if not unicodedata.combining(c))
+    return text.casefold()
+
 
 class IndexBuilder(object):
+    _key_fold = 'case'
+    # rows handed to sqlite per executemany while building index
+    _batch_size = 10000
+    # entry id of the first variant key, after any real entry
+    _variant_id = 1 << 40
+    # sqlite page size and page cache used while building index
+    _page_size = 8192
+    _cache_size = 64 * 1024 * 1024
+    # passcode (regcode, userid) of record blocks encrypted for a user
+    _passcode = None
+    # {file name: key of its encrypted blocks}, see _encrypted_key
+    _encrypted_keys = None
+    # (stylesheet, {number: (style_begin, style_end)} in bytes) of _style_table
+    _styles = None
+
     #todo: enable history
     def __init__(self, fname, encoding = "", passcode = None, force_rebuild = False, enable_history = False, sql_index = True, check = False):
         self._mdx_file = fname
@@ -39,6 +64,7 @@ class IndexBuilder(object):
         self._description = ''
         self._sql_index = sql_index
         self._check = check
+        self._passcode = passcode
         _filename, _file_extension = os.path.splitext(fname)
         assert(_file_extension == '.mdx')
         assert(os.path.isfile(fname))
@@ -108,177 +134,207 @@ class IndexBuilder(object):
                 self._make_mdd_index(self._mdd_db)
         pass
 
+    def _style_table(self):
+        """stylesheet with bytes keys and styles, made once per stylesheet"""
+        if self._styles is None or self._styles[0] is not self._stylesheet:
+            to_bytes = lambda s: s.encode('utf-8') if isinstance(s, unicode) else s
+            table = {}
+            for number, style in self._stylesheet.items():
+                table[to_bytes(number)] = (to_bytes(style[0]), to_bytes(style[1]))
+            self._styles = (self._stylesheet, table)
+        return self._styles[1]
+
     def _replace_stylesheet(self, txt):
-        # substitute stylesheet definition
-        txt_list = re.split(b'`\\d+`', txt)
-        txt_tag = re.findall(b'`\\d+`', txt)
-        txt_styled = txt_list[0]
-        for j, p in enumerate(txt_list[1:]):
-            style = self._stylesheet[txt_tag[j][1:-1]]
-            if p and p[-1] == b'\n':
-                txt_styled = txt_styled + style[0] + p.rstrip() + style[1] + b'\r\n'
-            else:
-                txt_styled = txt_styled + style[0] + p + style[1]
-        return txt_styled
+        # substitute stylesheet definition: the text after a tag up to the
+        # next one is wrapped in the style of the tag
+        parts = regex_style_tag.split(txt)
+        styles = self._style_table()
+        txt_styled = [parts[0]]
+        for i in range(1, len(parts), 2):
+            style = styles[parts[i]]
+            txt_styled += (style[0], parts[i + 1], style[1])
+        return b''.join(txt_styled)
+
+    @contextmanager
+    def _bulk_load(self, db_name):
+        """
+        cursor of a new index db. it is built in a temporary file with
+        journal and sync off, then renamed to db_name in one step, so
+        readers never see a half built db.
+        """
+        dirname, basename = os.path.split(db_name)
+        fd, tmp_name = tempfile.mkstemp(dir=dirname or None, prefix=basename, suffix='.tmp')
+        os.close(fd)
+        try:
+            conn = sqlite3.connect(tmp_name)
+            try:
+                conn.execute('PRAGMA page_size = %d' % self._page_size)
+                conn.execute('PRAGMA journal_mode = OFF')
+                conn.execute('PRAGMA synchronous = OFF')
+                conn.execute('PRAGMA locking_mode = EXCLUSIVE')
+                conn.execute('PRAGMA cache_size = -%d' % (self._cache_size // 1024))
+                yield conn.cursor()
+                conn.commit()
+            finally:
+                conn.close()
+            with open(tmp_name, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_name, db_name)
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+            raise
 
-    def _make_mdx_index(self, db_name):
-        if os.path.exists(db_name):
-            os.remove(db_name)
-        mdx = MDX(self._mdx_file)
-        self._mdx_db = db_name
-        returned_index = mdx.get_index(check_block = self._check)
-        index_list = returned_index['index_dict_list']
-        conn = sqlite3.connect(db_name)
-        c = conn.cursor()
-        c.execute(
+    @staticmethod
+    def _create_index_table(cursor, unique=False):
+        # clustered on key_fold, a case insensitive lookup reads
+        # one range of the table without a separate index
+        cursor.execute(
             ''' CREATE TABLE MDX_INDEX
-               (key_text text not null,
+               (key_text text not null%s,
                 file_pos integer,
                 compressed_size integer,
                 decompressed_size integer,
                 record_block_type integer,
                 record_start integer,
                 record_end integer,
-                offset integer
-                )'''
+                offset integer,
+                key_fold text,
+                entry_id integer,
+                PRIMARY KEY (key_fold, entry_id)
+                ) WITHOUT ROWID''' % (' unique' if unique else '')
         )
 
-        tuple_list = [
-            (item['key_text'],
-                     item['file_pos'],
-                     item['compressed_size'],
-                     item['decompressed_size'],
-                     item['record_block_type'],
-                     item['record_start'],
-                     item['record_end'],
-                     item['offset']
-                     )
-            for item in index_list
-            ]
-        c.executemany('INSERT INTO MDX_INDEX VALUES (?,?,?,?,?,?,?,?)',
-                      tuple_list)
-        # build the metadata table
-        meta = returned_index['meta']
-        c.execute(
-            '''CREATE TABLE META
-               (key text,
-                value text
-                )''')
-
-        #for k,v in meta:
-        #    c.execute(
-        #    'INSERT INTO META VALUES (?,?)', 
-        #    (k, v)
-        #    )
-        
-        c.executemany(
-            'INSERT INTO META VALUES (?,?)', 
-            [('encoding', meta['encoding']),
-             ('stylesheet', str(meta['stylesheet'])),
-             ('title', meta['title']),
-             ('description', meta['description']),
-             ('version', version)
-             ]
-            )
-        
-        if self._sql_index:
-            c.execute(
-                '''
-                CREATE INDEX key_index ON MDX_INDEX (key_text)
-                '''
-                )
+    def _variant_key(self, key_text):
+        """another key to index the entry by, or None"""
+        return None
+
+    def _index_meta(self, src_file):
+        """extra META rows of the index db of src_file"""
+        return []
+
+    def _index_rows(self, mdx, cursor):
+        """index rows of the mdx to insert, cursor is on the new index db"""
+        return mdx.iter_index()
 
-        conn.commit()
-        conn.close()
+    def _make_mdx_index(self, db_name):
+        mdx = MDX(self._mdx_file, passcode=self._passcode)
+        self._mdx_db = db_name
+        meta = mdx.get_meta()
         #set class member
         self._encoding = meta['encoding']
         self._stylesheet = meta['stylesheet']
         self._title = meta['title']
         self._description = meta['description']
-
+        with self._bulk_load(db_name) as c:
+            self._create_index_table(c)
+            self._insert_index(c, self._index_rows(mdx, c), self._variant_key)
+            # build the metadata table
+            c.execute(
+                '''CREATE TABLE META
+                   (key text,
+                    value text
+                    )''')
+            c.executemany(
+                'INSERT INTO META VALUES (?,?)',
+                [('encoding', meta['encoding']),
+                 ('stylesheet', str(meta['stylesheet'])),
+                 ('title', meta['title']),
+                 ('description', meta['description']),
+                 ('version', version),
+                 ('key_fold', self._key_fold)
+                 ] + self._index_meta(self._mdx_file)
+                )
+            if self._sql_index:
+                c.execute(
+                    '''
+                    CREATE INDEX key_index ON MDX_INDEX (key_text)
+                    '''
+                    )
 
     def _make_mdd_index(self, db_name):
-        if os.path.exists(db_name):
-            os.remove(db_name)
-        mdd = MDD(self._mdd_file)
+        mdd = MDD(self._mdd_file, passcode=self._passcode)
         self._mdd_db = db_name
-        returned_index = mdd.get_index(check_block = self._check)
-        index_list = returned_index['index_dict_list']
-        conn = sqlite3.connect(db_name)
-        c = conn.cursor()
-        c.execute(
-            ''' CREATE TABLE MDX_INDEX
-               (key_text text not null unique,
-                file_pos integer,
-                compressed_size integer,
-                decompressed_size integer,
-                record_block_type integer,
-                record_start integer,
-                record_end integer,
-                offset integer
-                )'''
-        )
-
-        tuple_list = [
-            (item['key_text'],
-                     item['file_pos'],
-                     item['compressed_size'],
-                     item['decompressed_size'],
-                     item['record_block_type'],
-                     item['record_start'],
-                     item['record_end'],
-                     item['offset']
-                     )
-            for item in index_list
-            ]
-        c.executemany('INSERT INTO MDX_INDEX VALUES (?,?,?,?,?,?,?,?)',
-                      tuple_list)
-        if self._sql_index:
-            c.execute(
-                '''
-                CREATE UNIQUE INDEX key_index ON MDX_INDEX (key_text)
-                '''
+        with self._bulk_load(db_name) as c:
+            # unique key_text has its own index
+            self._create_index_table(c, unique=True)
+            self._insert_index(c, mdd.iter_index())
+            c.execute('''CREATE TABLE META (key text, value text)''')
+            c.executemany(
+                'INSERT INTO META VALUES (?,?)',
+                [('key_fold', self._key_fold)] + self._index_meta(self._mdd_file)
                 )
 
-        conn.commit()
-        conn.close()
-
-    @staticmethod
-    def get_data_by_index(fmdx, index):
-        fmdx.seek(index['file_pos'])
-        record_block_compressed = fmdx.read(index['compressed_size'])
-        record_block_type = index['record_block_type']
-        decompressed_size = index['decompressed_size']
+    def _insert_index(self, cursor, index_rows, variant_key=None):
+        """
+        insert index rows from a generator in bounded batches, within one transaction.
+        variant keys get entry ids after all the entries, so a lookup lists the
+        exact keys first, in file order.
+        """
+        key_fold = self._key_fold
+
+        def rows():
+            for entry_id, row in enumerate(index_rows):
+                yield row + (fold_key(row[0], key_fold), entry_id)
+                if variant_key is not None:
+                    key = variant_key(row[0])
+                    if key is not None:
+                        yield (key,) + row[1:] + (fold_key(key, key_fold), self._variant_id + entry_id)
+
+        rows = rows()
+        while True:
+            batch = list(islice(rows, self._batch_size))
+            if not batch:
+                break
+            cursor.executemany('INSERT INTO MDX_INDEX VALUES (?,?,?,?,?,?,?,?,?,?)', batch)
+
+    def _encrypted_key(self, fname):
+        """
+        key of the encrypted blocks of an mdx or mdd file: from the passcode,
+        or the UUID of MDict 3.0 files. None derives the key of each block.
+        """
+        if self._encrypted_keys is None:
+            self._encrypted_keys = {}
+        if fname not in self._encrypted_keys:
+            self._encrypted_keys[fname] = MDict.read_encrypted_key(fname, self._passcode)
+        return self._encrypted_keys[fname]
+
+    def get_record_block(self, fmdx, index):
+        if isinstance(fmdx, MappedFile):
+            # memoryview, no copy until decompressed
+            record_block_compressed = fmdx.read_at(index['file_pos'], index['compressed_size'])
+        else:
+            fmdx.seek(index['file_pos'])
+            record_block_compressed = fmdx.read(index['compressed_size'])
         # adler32 = unpack('>I', record_block_compressed[4:8])[0]
+        info = index['record_block_type']
+        data = decrypt_block(info, record_block_compressed[4:8], record_block_compressed[8:],
+                             self._encrypted_key(fmdx.name))
+        # 0: none, 1: lzo, 2: zlib
+        return decompress(info & 0xf, data, index['decompressed_size'])
 
-        # _record_block = MDX.decode_block(record_block_compressed, decompressed_size)
-        # version 2.0
-        if record_block_type == 0:
-            _record_block = record_block_compressed[8:]
-            # lzo compression
-        elif record_block_type == 1:
-            if lzo is None:
-                print("LZO compression is not supported")
-                # decompress
-            header = b'\xf0' + pack('>I', index['decompressed_size'])
-            _record_block = lzo.decompress(record_block_compressed[8:], initSize = decompressed_size, blockSize=1308672)
-                # zlib compression
-        elif record_block_type == 2:
-            # decompress
-            _record_block = zlib.decompress(record_block_compressed[8:])
-
-        data = _record_block[index['record_start'] - index['offset']:index['record_end'] - index['offset']]
+    @staticmethod
+    def slice_record(record_block, index):
+        data = record_block[index['record_start'] - index['offset']:index['record_end'] - index['offset']]
+        if isinstance(data, memoryview):
+            data = data.tobytes()
         return data
 
-    def get_mdx_by_index(self, fmdx, index):
-        data = self.get_data_by_index(fmdx,index)
+    def get_data_by_index(self, fmdx, index):
+        _record_block = self.get_record_block(fmdx, index)
+        return self.slice_record(_record_block, index)
 
+    def decode_record(self, data):
         record  = data.decode(self._encoding, errors='ignore').strip(u'\x00').encode('utf-8')
         if self._stylesheet:
             record = self._replace_stylesheet(record)
         record = record.decode('utf-8')
         return record
 
+    def get_mdx_by_index(self, fmdx, index):
+        data = self.get_data_by_index(fmdx,index)
+        return self.decode_record(data)
+
     def get_mdd_by_index(self, fmdx, index):
         return self.get_data_by_index(fmdx,index)
 
@@ -286,11 +342,12 @@ class IndexBuilder(object):
     def lookup_indexes(db,keyword,ignorecase=None):
         indexes = []
         if ignorecase:
-            sql = 'SELECT * FROM MDX_INDEX WHERE lower(key_text) = lower("{}")'.format(keyword)
+            sql = 'SELECT * FROM MDX_INDEX WHERE key_fold = ?'
+            keyword = fold_key(keyword)
         else:
-            sql = 'SELECT * FROM MDX_INDEX WHERE key_text = "{}"'.format(keyword)
+            sql = 'SELECT * FROM MDX_INDEX WHERE key_text = ?'
         with sqlite3.connect(db) as conn:
-            cursor = conn.execute(sql)
+            cursor = conn.execute(sql, (keyword,))
             for result in cursor:
                 index = {}
                 index['file_pos'] = result[1]
@@ -17,21 +17,20 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
 # GNU General Public License for more details.
 
-from struct import pack, unpack
+from struct import pack, unpack, Struct
 from io import BytesIO
+import codecs
 import re
 import sys
 
-from .ripemd128 import ripemd128
-from .pureSalsa20 import Salsa20
+from .crypto import ripemd128, decrypt_block
+from .crypto import fast_decrypt as _fast_decrypt, salsa_decrypt as _salsa_decrypt
+from .compression import decompress
+from .key_list import KeyList
 
 # zlib compression is used for engine version >=2.0
-import zlib
 # LZO compression is used for engine version < 2.0
-try:
-    from . import lzo
-except ImportError:
-    lzo = None
+import zlib
 
 # xxhash is used for engine version >= 3.0
 try:
@@ -55,33 +54,9 @@ def _unescape_entities(text):
     return text
 
 
-def _fast_decrypt(data, key):
-    """
-    XOR decryption
-    """
-    b = bytearray(data)
-    key = bytearray(key)
-    previous = 0x36
-    for i in range(len(b)):
-        t = (b[i] >> 4 | b[i] << 4) & 0xff
-        t = t ^ previous ^ (i & 0xff) ^ key[i % len(key)]
-        previous = b[i]
-        b[i] = t
-    return bytes(b)
-
-
-def _salsa_decrypt(ciphertext, encrypt_key):
-    """
-    salsa20 (8 rounds) decryption
-    """
-    s20 = Salsa20(key=encrypt_key, IV=b"\x00"*8, rounds=8)
-    return s20.encryptBytes(ciphertext)
-
-
 def _decrypt_regcode_by_userid(reg_code, userid):
     userid_digest = ripemd128(userid)
-    s20 = Salsa20(key=userid_digest, IV=b"\x00"*8, rounds=8)
-    encrypt_key = s20.encryptBytes(reg_code)
+    encrypt_key = _salsa_decrypt(reg_code, userid_digest)
     return encrypt_key
 
 
@@ -96,24 +71,43 @@ class MDict(object):
         self._encrypted_key = None
 
         self.header = self._read_header()
+        self._encrypted_key = self._read_encrypted_key(passcode)
+
+        # position of key blocks, keys are decoded on demand
+        self._key_blocks = self._read_keys()
+        self._keys = None
+
+    @classmethod
+    def read_encrypted_key(cls, fname, passcode=None):
+        """
+        key of the encrypted blocks of fname, read from its header only.
+        None if the key of each block derives from its checksum.
+        """
+        mdict = cls.__new__(cls)
+        mdict._fname = fname
+        mdict._encoding = ''
+        mdict.header = mdict._read_header()
+        return mdict._read_encrypted_key(passcode)
 
+    def _read_encrypted_key(self, passcode):
         # decrypt regcode to get the encrypted key
         if passcode is not None:
             regcode, userid = passcode
             if isinstance(userid, unicode):
                 userid = userid.encode('utf8')
-            self._encrypted_key = _decrypt_regcode_by_userid(regcode, userid)
+            return _decrypt_regcode_by_userid(regcode, userid)
         # MDict 3.0 encryption key derives from UUID
         elif self._version >= 3.0:
             if xxhash is None:
                 raise RuntimeError('xxhash module is needed to read MDict 3.0 format')
             uuid = self.header[b'UUID']
             mid = (len(uuid) + 1) // 2
-            self._encrypted_key = xxhash.xxh64_digest(uuid[:mid]) + xxhash.xxh64_digest(uuid[mid:])
-
-        self._key_list = self._read_keys()
+            return xxhash.xxh64_digest(uuid[:mid]) + xxhash.xxh64_digest(uuid[mid:])
+        return None
 
     def __len__(self):
+        if self._num_entries is None:
+            self._num_entries = sum(1 for _ in self._iter_keys())
         return self._num_entries
 
     def __iter__(self):
@@ -123,7 +117,37 @@ class MDict(object):
         """
         Return an iterator over dictionary keys.
         """
-        return (key_value for key_id, key_value in self._key_list)
+        return (key_value for key_id, key_value in self._iter_keys())
+
+    @property
+    def _key_list(self):
+        """
+        KeyList of all (key_id, key_text), read on first use
+        """
+        if self._keys is None:
+            self._keys = KeyList(self._iter_key_blocks())
+            self._num_entries = len(self._keys)
+        return self._keys
+
+    def _iter_keys(self):
+        """
+        yield (key_id, key_text), decoding one key block at a time
+        """
+        if self._keys is not None:
+            yield from self._keys
+            return
+        for pairs in self._iter_key_blocks():
+            yield from pairs
+
+    def _iter_key_blocks(self):
+        """
+        yield the list of (key_id, key_text) of each key block
+        """
+        with open(self._fname, 'rb') as f:
+            for file_pos, compressed_size, decompressed_size in self._key_blocks:
+                f.seek(file_pos)
+                key_block = self._decode_block(f.read(compressed_size), decompressed_size)
+                yield self._split_key_block(key_block)
 
     def _read_number(self, f):
         return unpack(self._number_format, f.read(self._number_width))[0]
@@ -145,44 +169,19 @@ class MDict(object):
         # block info: compression, encryption
         info = unpack('<L', block[:4])[0]
         compression_method =  info & 0xf
-        encryption_method = (info >> 4) & 0xf
-        encryption_size = (info >> 8) & 0xff
 
         # adler checksum of the block data used as the encryption key if none given
         adler32 = unpack('>I', block[4:8])[0]
-        encrypted_key = self._encrypted_key
-        if encrypted_key is None:
-            encrypted_key = ripemd128(block[4:8])
-
-        # block data
-        data = block[8:]
-
-        # decrypt
-        if encryption_method == 0:
-            decrypted_block = data
-        elif encryption_method == 1:
-            decrypted_block = _fast_decrypt(data[:encryption_size], encrypted_key) + data[encryption_size:]
-        elif encryption_method == 2:
-            decrypted_block = _salsa_decrypt(data[:encryption_size], encrypted_key) + data[encryption_size:]
-        else:
-            raise Exception('encryption method %d not supported' % encryption_method)
+
+        # decrypt block data
+        decrypted_block = decrypt_block(info, block[4:8], block[8:], self._encrypted_key)
 
         # check adler checksum over decrypted data
         if self._version >= 3:
             assert(hex(adler32) == hex(zlib.adler32(decrypted_block) & 0xffffffff))
 
         # decompress
-        if compression_method == 0:
-            decompressed_block = decrypted_block
-        elif compression_method == 1:
-            if lzo is None:
-                raise RuntimeError("LZO compression is not supported")
-            header = b'\xf0' + pack('>I', decompressed_size)
-            decompressed_block = lzo.decompress(header + decrypted_block)
-        elif compression_method == 2:
-            decompressed_block = zlib.decompress(decrypted_block)
-        else:
-            raise Exception('compression method %d not supported' % compression_method)
+        decompressed_block = decompress(compression_method, decrypted_block, decompressed_size)
 
         # check adler checksum over decompressed data
         if self._version < 3:
@@ -251,40 +250,67 @@ class MDict(object):
 
         return key_block_info_list
 
-    def _decode_key_block(self, key_block_compressed, key_block_info_list):
-        key_list = []
-        i = 0
+    def _locate_key_blocks(self, key_block_offset, key_block_info_list):
+        """
+        (file_pos, compressed_size, decompressed_size) of key blocks stored one after another
+        """
+        key_blocks = []
+        file_pos = key_block_offset
         for compressed_size, decompressed_size in key_block_info_list:
-            key_block = self._decode_block(key_block_compressed[i:i+compressed_size], decompressed_size)
-            # extract one single key block into a key list
-            key_list += self._split_key_block(key_block)
-            i += compressed_size
-        return key_list
+            key_blocks.append((file_pos, compressed_size, decompressed_size))
+            file_pos += compressed_size
+        return key_blocks
 
     def _split_key_block(self, key_block):
-        key_list = []
+        key_block = bytes(key_block)
+        # key text ends with '\x00'
+        if self._encoding == 'UTF-16':
+            delimiter = b'\x00\x00'
+            width = 2
+        else:
+            delimiter = b'\x00'
+            width = 1
+        number_width = self._number_width
+        find = key_block.find
+        size = len(key_block)
+        key_starts = []
+        key_texts = []
         key_start_index = 0
-        while key_start_index < len(key_block):
-            # the corresponding record's offset in record block
-            key_id = unpack(self._number_format, key_block[key_start_index:key_start_index+self._number_width])[0]
-            # key text ends with '\x00'
-            if self._encoding == 'UTF-16':
-                delimiter = b'\x00\x00'
-                width = 2
-            else:
-                delimiter = b'\x00'
-                width = 1
-            i = key_start_index + self._number_width
-            while i < len(key_block):
-                if key_block[i:i+width] == delimiter:
-                    key_end_index = i
-                    break
-                i += width
-            key_text = key_block[key_start_index+self._number_width:key_end_index]\
-                .decode(self._encoding, errors='ignore').encode('utf-8').strip()
+        while key_start_index < size:
+            key_starts.append(key_start_index)
+            i = key_start_index + number_width
+            key_end_index = find(delimiter, i)
+            # utf-16 delimiter is at an even offset from the key text
+            while width == 2 and (key_end_index - i) & 1 and key_end_index != -1:
+                key_end_index = find(delimiter, key_end_index + 1)
+            if key_end_index == -1:
+                key_end_index = size
+            key_texts.append(key_block[i:key_end_index])
             key_start_index = key_end_index + width
-            key_list += [(key_id, key_text)]
-        return key_list
+        # the corresponding record's offset in record block
+        unpack_key_id = Struct(self._number_format).unpack_from
+        key_ids = [unpack_key_id(key_block, pos)[0] for pos in key_starts]
+        return list(zip(key_ids, self._decode_keys(key_texts, delimiter)))
+
+    def _decode_keys(self, key_texts, delimiter):
+        """
+        utf-8 of key texts, decoded all at once joined by the delimiter.
+        a decode error would be handled differently next to the delimiter,
+        so then each key is decoded on its own, ignoring errors.
+        """
+        encoding = self._encoding
+        # stateful codecs and byte order marks make a key depend on the previous one
+        batch = not codecs.lookup(encoding).name.startswith(('utf-7', 'iso2022', 'hz'))
+        if batch and len(delimiter) == 2:
+            batch = not any(text[:2] in (b'\xff\xfe', b'\xfe\xff') for text in key_texts)
+        if batch:
+            try:
+                keys = delimiter.join(key_texts).decode(encoding).encode('utf-8').split(b'\x00')
+            except UnicodeError:
+                keys = []
+            if len(keys) == len(key_texts):
+                return [key.strip() for key in keys]
+        return [text.decode(encoding, errors='ignore').encode('utf-8').strip() for text in key_texts]
 
     def _read_header(self):
         f = open(self._fname, 'rb')
@@ -393,21 +419,21 @@ class MDict(object):
             else:
                 break
 
-        # read key data
+        # locate key data blocks
         f.seek(self._key_data_offset)
         number = self._read_int32(f)
         total_size = self._read_number(f)
-        key_list = []
+        key_blocks = []
         for i in range(number):
             decompressed_size = self._read_int32(f)
             compressed_size = self._read_int32(f)
-            block_data = f.read(compressed_size)
-            decompressed_block_data = self._decode_block(block_data, decompressed_size)
-            key_list.extend(self._split_key_block(decompressed_block_data))
+            key_blocks.append((f.tell(), compressed_size, decompressed_size))
+            f.seek(compressed_size, 1)
 
         f.close()
-        self._num_entries = len(key_list)
-        return key_list
+        # counted when keys are read
+        self._num_entries = None
+        return key_blocks
 
     def _read_keys_v1v2(self):
         f = open(self._fname, 'rb')
@@ -447,15 +473,13 @@ class MDict(object):
         key_block_info_list = self._decode_key_block_info(key_block_info)
         assert(num_key_blocks == len(key_block_info_list))
 
-        # read key block
-        key_block_compressed = f.read(key_block_size)
-        # extract key block
-        key_list = self._decode_key_block(key_block_compressed, key_block_info_list)
+        # key blocks follow, decoded when keys are read
+        key_blocks = self._locate_key_blocks(f.tell(), key_block_info_list)
 
-        self._record_block_offset = f.tell()
+        self._record_block_offset = f.tell() + key_block_size
         f.close()
 
-        return key_list
+        return key_blocks
 
     def _read_keys_brutal(self):
         f = open(self._fname, 'rb')
@@ -491,16 +515,15 @@ class MDict(object):
         key_block_info_list = self._decode_key_block_info(key_block_info)
         key_block_size = sum(list(zip(*key_block_info_list))[0])
 
-        # read key block
-        key_block_compressed = f.read(key_block_size)
-        # extract key block
-        key_list = self._decode_key_block(key_block_compressed, key_block_info_list)
+        # key blocks follow, decoded when keys are read
+        key_blocks = self._locate_key_blocks(f.tell(), key_block_info_list)
 
-        self._record_block_offset = f.tell()
+        self._record_block_offset = f.tell() + key_block_size
         f.close()
 
-        self._num_entries = len(key_list)
-        return key_list
+        # counted when keys are read
+        self._num_entries = None
+        return key_blocks
 
     def items(self):
         """Return a generator which in turn produce tuples in the form of (filename, content)
@@ -520,6 +543,8 @@ class MDict(object):
         offset = 0
         i = 0
         size_counter = 0
+        key_list = self._key_list
+        num_keys = len(key_list)
 
         num_record_blocks = self._read_int32(f)
         num_bytes = self._read_number(f)
@@ -529,14 +554,14 @@ class MDict(object):
             record_block = self._decode_block(f.read(compressed_size), decompressed_size)
 
             # split record block according to the offset info from key block
-            while i < len(self._key_list):
-                record_start, key_text = self._key_list[i]
+            while i < num_keys:
+                record_start, key_text = key_list[i]
                 # reach the end of current record block
                 if record_start - offset >= len(record_block):
                     break
                 # record end index
-                if i < len(self._key_list)-1:
-                    record_end = self._key_list[i+1][0]
+                if i < num_keys-1:
+                    record_end = key_list[i+1][0]
                 else:
                     record_end = len(record_block) + offset
                 i += 1
@@ -551,7 +576,7 @@ class MDict(object):
 
         num_record_blocks = self._read_number(f)
         num_entries = self._read_number(f)
-        assert(num_entries == self._num_entries)
+        assert(num_entries == len(self))
         record_block_info_size = self._read_number(f)
         record_block_size = self._read_number(f)
 
@@ -569,18 +594,20 @@ class MDict(object):
         offset = 0
         i = 0
         size_counter = 0
+        key_list = self._key_list
+        num_keys = len(key_list)
         for compressed_size, decompressed_size in record_block_info_list:
             record_block = self._decode_block(f.read(compressed_size), decompressed_size)
 
             # split record block according to the offset info from key block
-            while i < len(self._key_list):
-                record_start, key_text = self._key_list[i]
+            while i < num_keys:
+                record_start, key_text = key_list[i]
                 # reach the end of current record block
                 if record_start - offset >= len(record_block):
                     break
                 # record end index
-                if i < len(self._key_list)-1:
-                    record_end = self._key_list[i+1][0]
+                if i < num_keys-1:
+                    record_end = key_list[i+1][0]
                 else:
                     record_end = len(record_block) + offset
                 i += 1
@@ -596,83 +623,21 @@ class MDict(object):
         return data
 
     def get_index(self, check_block=True):
-        if self._version >= 3:
-            return self.get_index_v3(check_block=check_block)
-        else:
-            return self.get_index_v1v2(check_block=check_block)
+        return {"index_dict_list": list(self._iter_index_dicts()), 'meta': self.get_meta()}
 
     def get_index_v1v2(self, check_block=True):
-        # 获取 mdx 文件的索引列表，格式为
-        # key_text(关键词，可以由后面的 keylist 得到)
-        # file_pos(record_block开始的位置)
-        # compressed_size(record_block压缩前的大小)
-        # decompressed_size(解压后的大小)
-        # record_block_type(record_block 的压缩类型)
-        # record_start (以下三个为从 record_block 中提取某一调记录需要的参数，可以直接保存）
-        # record_end
-        # offset
-        # 所需 metadata
-        index_dict_list = []
+        return self.get_index(check_block=check_block)
 
-        f = open(self._fname, 'rb')
-        f.seek(self._record_block_offset)
-
-        num_record_blocks = self._read_number(f)
-        num_entries = self._read_number(f)
-        assert(num_entries == self._num_entries)
-        record_block_info_size = self._read_number(f)
-        record_block_size = self._read_number(f)
-
-        # record block info section
-        record_block_info_list = []
-        size_counter = 0
-        for i in range(num_record_blocks):
-            compressed_size = self._read_number(f)
-            decompressed_size = self._read_number(f)
-            record_block_info_list += [(compressed_size, decompressed_size)]
-            size_counter += self._number_width * 2
-        assert(size_counter == record_block_info_size)
-
-        # actual record block
-        offset = 0
-        i = 0
-        size_counter = 0
-        for compressed_size, decompressed_size in record_block_info_list:
-            current_pos = f.tell()
-            record_block_compressed = f.read(compressed_size)
-            record_block_type, = unpack('<L', record_block_compressed[:4])
-
-            # split record block according to the offset info from key block
-            while i < len(self._key_list):
-                index_dict = {}
-                index_dict['file_pos'] = current_pos
-                index_dict['compressed_size'] = compressed_size
-                index_dict['decompressed_size'] = decompressed_size
-                index_dict['record_block_type'] = record_block_type
-
-                record_start, key_text = self._key_list[i]
-                index_dict['record_start'] = record_start
-                index_dict['key_text'] = key_text.decode("utf-8")
-                index_dict['offset'] = offset
+    def get_index_v3(self, check_block=False):
+        return self.get_index(check_block=check_block)
 
-                # reach the end of current record block
-                # next block
-                if record_start - offset >= decompressed_size:
-                    break
+    def _iter_index_dicts(self):
+        fields = ('key_text', 'file_pos', 'compressed_size', 'decompressed_size',
+                  'record_block_type', 'record_start', 'record_end', 'offset')
+        for row in self.iter_index():
+            yield dict(zip(fields, row))
 
-                # record end index
-                if i < len(self._key_list) - 1:
-                    record_end = self._key_list[i + 1][0]
-                else:
-                    record_end = decompressed_size + offset
-                index_dict['record_end'] = record_end
-                i += 1
-                index_dict_list.append(index_dict)
-            offset += decompressed_size
-            size_counter += compressed_size
-        assert(size_counter == record_block_size)
-
-        f.close()
+    def get_meta(self):
         # 这里比 mdd 部分稍有不同，应该还需要传递编码以及样式表信息
         meta = {}
         meta['encoding'] = self._encoding
@@ -680,65 +645,96 @@ class MDict(object):
         meta['version'] = self._version
         meta['title'] = self.header[b'Title'].decode(self._encoding)
         meta['description'] = self.header[b'Title'].decode(self._encoding)
-        return {"index_dict_list": index_dict_list, 'meta': meta}
-
-    def get_index_v3(self, check_block=False):
-        index_dict_list = []
-
-        f = open(self._fname, 'rb')
-        f.seek(self._record_block_offset)
+        return meta
 
+    def iter_index(self):
+        """
+        yield index of every entry as a tuple
+        (key_text, file_pos, compressed_size, decompressed_size,
+         record_block_type, record_start, record_end, offset)
+        keys and record blocks are read one block at a time, memory use
+        does not grow with the number of entries.
+        """
+        # key_text(关键词，可以由后面的 keylist 得到)
+        # file_pos(record_block开始的位置)
+        # compressed_size(record_block压缩前的大小)
+        # decompressed_size(解压后的大小)
+        # record_block_type(record_block 的压缩类型)
+        # record_start (以下三个为从 record_block 中提取某一调记录需要的参数，可以直接保存）
+        # record_end
+        # offset
+        keys = self._iter_keys()
+        key = next(keys, None)
         offset = 0
-        i = 0
-        size_counter = 0
-
-        num_record_blocks = self._read_int32(f)
-        num_bytes = self._read_number(f)
-        for j in range(num_record_blocks):
-            current_pos = f.tell()
-            decompressed_size = self._read_int32(f)
-            compressed_size = self._read_int32(f)
-            record_block_compressed = f.read(compressed_size)
-            record_block_type, = unpack('<L', record_block_compressed[:4])
-
+        for file_pos, compressed_size, decompressed_size, record_block_type in self._iter_record_blocks():
             # split record block according to the offset info from key block
-            while i < len(self._key_list):
-                index_dict = {}
-                index_dict['file_pos'] = current_pos
-                index_dict['compressed_size'] = compressed_size
-                index_dict['decompressed_size'] = decompressed_size
-                index_dict['record_block_type'] = record_block_type
-
-                record_start, key_text = self._key_list[i]
-                index_dict['record_start'] = record_start
-                index_dict['key_text'] = key_text.decode("utf-8")
-                index_dict['offset'] = offset
-
+            while key is not None:
+                record_start, key_text = key
                 # reach the end of current record block
                 if record_start - offset >= decompressed_size:
                     break
+                key = next(keys, None)
                 # record end index
-                if i < len(self._key_list) - 1:
-                    record_end = self._key_list[i + 1][0]
+                if key is not None:
+                    record_end = key[0]
                 else:
                     record_end = decompressed_size + offset
-
-                index_dict['record_end'] = record_end
-                i += 1
-                index_dict_list.append(index_dict)
-
+                yield (key_text.decode("utf-8"), file_pos, compressed_size, decompressed_size,
+                       record_block_type, record_start, record_end, offset)
             offset += decompressed_size
-            size_counter += compressed_size
 
-        f.close()
-        # 这里比 mdd 部分稍有不同，应该还需要传递编码以及样式表信息
-        meta = {}
-        meta['encoding'] = self._encoding
-        meta['version'] = self._version
-        meta['stylesheet'] = self._stylesheet
-        meta['title'] = self.header[b'Title'].decode(self._encoding)
-        meta['description'] = self.header[b'Title'].decode(self._encoding)
-        return {"index_dict_list": index_dict_list, 'meta': meta}
+    def _iter_record_blocks(self):
+        """
+        yield (file_pos, compressed_size, decompressed_size, record_block_type)
+        of record blocks, reading only the block type of each block
+        """
+        if self._version >= 3:
+            yield from self._iter_record_blocks_v3()
+        else:
+            yield from self._iter_record_blocks_v1v2()
+
+    def _iter_record_blocks_v1v2(self):
+        with open(self._fname, 'rb') as f:
+            f.seek(self._record_block_offset)
+
+            num_record_blocks = self._read_number(f)
+            num_entries = self._read_number(f)
+            if self._num_entries is not None:
+                assert(num_entries == self._num_entries)
+            record_block_info_size = self._read_number(f)
+            record_block_size = self._read_number(f)
+
+            # record block info section
+            record_block_info = f.read(record_block_info_size)
+            assert(len(record_block_info) == num_record_blocks * self._number_width * 2)
+            sizes = unpack('>%d%s' % (num_record_blocks * 2, self._number_format[1]),
+                           record_block_info)
+
+            # actual record block
+            size_counter = 0
+            for j in range(num_record_blocks):
+                compressed_size = sizes[j * 2]
+                decompressed_size = sizes[j * 2 + 1]
+                current_pos = f.tell()
+                record_block_type, = unpack('<L', f.read(4))
+                f.seek(current_pos + compressed_size)
+                size_counter += compressed_size
+                yield current_pos, compressed_size, decompressed_size, record_block_type
+            assert(size_counter == record_block_size)
+
+    def _iter_record_blocks_v3(self):
+        with open(self._fname, 'rb') as f:
+            f.seek(self._record_block_offset)
+
+            num_record_blocks = self._read_int32(f)
+            num_bytes = self._read_number(f)
+            for j in range(num_record_blocks):
+                current_pos = f.tell()
+                decompressed_size = self._read_int32(f)
+                compressed_size = self._read_int32(f)
+                record_block_type, = unpack('<L', f.read(4))
+                f.seek(current_pos + 8 + compressed_size)
+                yield current_pos, compressed_size, decompressed_size, record_block_type
 
 
 class MDD(MDict):
@@ -0,0 +1,170 @@
+"""
+small MDict files for tests, engine 1.2 or 2.0
+
+entries are (key, value) sorted by key, values are bytes. record blocks
+can be stored, LZO (literals only) or zlib compressed, and encrypted with
+a passcode key or the key derived from their checksum.
+"""
+import struct
+import zlib
+
+from flask_mdict.word_query.crypto import ripemd128, salsa_decrypt
+
+
+def lzo_literals(data):
+    """LZO1X stream of data as one literal run"""
+    out = bytearray()
+    if len(data) <= 238:
+        out.append(17 + len(data))
+    else:
+        out.append(0)
+        n = len(data) - 18
+        while n > 255:
+            out.append(0)
+            n -= 255
+        out.append(n)
+    out += data
+    # end of stream
+    out += b"\x11\x00\x00"
+    return bytes(out)
+
+
+def xor_encrypt(data, key):
+    """inverse of crypto.fast_decrypt"""
+    previous = 0x36
+    out = bytearray()
+    for i, p in enumerate(data):
+        t = p ^ previous ^ (i & 0xFF) ^ key[i % len(key)]
+        c = ((t >> 4) | (t << 4)) & 0xFF
+        out.append(c)
+        previous = c
+    return bytes(out)
+
+
+def make_block(data, compression=2, encryption=0, key=None, encrypted_size=16):
+    checksum = struct.pack(">I", zlib.adler32(data) & 0xFFFFFFFF)
+    if compression == 0:
+        payload = data
+    elif compression == 1:
+        payload = lzo_literals(data)
+    else:
+        payload = zlib.compress(data)
+    info = compression
+    if encryption:
+        key = key or ripemd128(checksum)
+        size = min(encrypted_size, len(payload))
+        if encryption == 1:
+            prefix = xor_encrypt(payload[:size], key)
+        else:
+            prefix = salsa_decrypt(payload[:size], key)
+        payload = prefix + payload[size:]
+        info |= (encryption << 4) | (size << 8)
+    return struct.pack("<L", info) + checksum + payload
+
+
+def regcode(key, userid):
+    """regcode of passcode (regcode, userid) giving key"""
+    return salsa_decrypt(key, ripemd128(userid.encode("utf-8")))
+
+
+def write(
+    fname,
+    entries,
+    mdd=False,
+    version=2.0,
+    compression=2,
+    keys_per_block=4,
+    records_per_block=4,
+    record_encryption=0,
+    passcode_key=None,
+    title="Test",
+):
+    width = 8 if version >= 2.0 else 4
+    number = (lambda n: struct.pack(">Q", n)) if width == 8 else (
+        lambda n: struct.pack(">I", n)
+    )
+    codec = "utf-16-le" if mdd else "utf-8"
+    terminator = b"\x00\x00" if mdd else b"\x00"
+    records = []
+    pos = 0
+    for key, value in entries:
+        if not mdd:
+            value += b"\x00"
+        records.append((key, pos, value))
+        pos += len(value)
+
+    header = (
+        '<%s GeneratedByEngineVersion="%s" RequiredEngineVersion="%s" '
+        'Encrypted="%d" Encoding="%s" Format="Html" Title="%s" '
+        'Description="test"/>\r\n\x00'
+        % (
+            "Library_Data" if mdd else "Dictionary",
+            version,
+            version,
+            1 if passcode_key else 0,
+            "" if mdd else "UTF-8",
+            title,
+        )
+    ).encode("utf-16-le")
+    out = bytearray()
+    out += struct.pack(">I", len(header)) + header
+    out += struct.pack("<I", zlib.adler32(header) & 0xFFFFFFFF)
+
+    key_blocks = []
+    key_info = bytearray()
+    for i in range(0, len(records), keys_per_block):
+        chunk = records[i : i + keys_per_block]
+        raw = b"".join(number(p) + k.encode(codec) + terminator for k, p, _ in chunk)
+        block = make_block(raw)
+        key_blocks.append(block)
+        first = chunk[0][0].encode(codec)
+        last = chunk[-1][0].encode(codec)
+        char = 2 if mdd else 1
+        if version >= 2.0:
+            key_info += number(len(chunk))
+            key_info += struct.pack(">H", len(first) // char) + first + terminator
+            key_info += struct.pack(">H", len(last) // char) + last + terminator
+        else:
+            key_info += number(len(chunk))
+            key_info += struct.pack(">B", len(first) // char) + first
+            key_info += struct.pack(">B", len(last) // char) + last
+        key_info += number(len(block)) + number(len(raw))
+    key_data = b"".join(key_blocks)
+    if version >= 2.0:
+        key_info_block = make_block(bytes(key_info))
+        head = (
+            number(len(key_blocks))
+            + number(len(records))
+            + number(len(key_info))
+            + number(len(key_info_block))
+            + number(len(key_data))
+        )
+        checksum = struct.pack(">I", zlib.adler32(head) & 0xFFFFFFFF)
+        if passcode_key:
+            head = salsa_decrypt(head, passcode_key)
+        out += head + checksum
+    else:
+        key_info_block = bytes(key_info)
+        head = (
+            number(len(key_blocks))
+            + number(len(records))
+            + number(len(key_info_block))
+            + number(len(key_data))
+        )
+        if passcode_key:
+            head = salsa_decrypt(head, passcode_key)
+        out += head
+    out += key_info_block + key_data
+
+    record_blocks = []
+    for i in range(0, len(records), records_per_block):
+        raw = b"".join(v for _, _, v in records[i : i + records_per_block])
+        block = make_block(raw, compression, record_encryption, passcode_key)
+        record_blocks.append((block, len(raw)))
+    sizes = b"".join(number(len(b)) + number(n) for b, n in record_blocks)
+    out += number(len(record_blocks)) + number(len(records))
+    out += number(len(sizes)) + number(sum(len(b) for b, _ in record_blocks))
+    out += sizes + b"".join(b for b, _ in record_blocks)
+    with open(fname, "wb") as f:
+        f.write(out)
+    return fname
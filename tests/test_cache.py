@@ -0,0 +1,110 @@
+import os
+
+from flask_mdict.cache import DiskCache, LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(10)
+    cache.set("a", b"1234")
+    cache.set("b", b"1234")
+    assert cache.get("a") == b"1234"
+    cache.set("c", b"1234")
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+    assert cache.stats()["bytes"] == 8
+    assert cache.evictions == 1
+
+
+def test_lru_byte_budget():
+    cache = LRUCache(10)
+    for key in "abcde":
+        cache.set(key, b"123")
+    assert len(cache) == 3
+    assert cache.stats()["bytes"] == 9
+    # a value over the budget is not cached and evicts nothing
+    cache.set("big", b"12345678901")
+    assert "big" not in cache
+    assert len(cache) == 3
+
+
+def test_lru_replaced_value():
+    cache = LRUCache(10)
+    cache.set("a", b"12345678")
+    cache.set("a", b"12")
+    cache.set("b", b"12345678")
+    assert cache.get("a") == b"12"
+    assert cache.stats()["bytes"] == 10
+
+
+def test_lru_counted_size():
+    cache = LRUCache(300)
+    cache.set("missing", b"", size=256)
+    cache.set("other", b"", size=256)
+    assert "missing" not in cache
+    assert cache.get("other") == b""
+
+
+def test_lru_hits_and_misses():
+    cache = LRUCache(10)
+    cache.set("a", b"1")
+    assert cache.get("a") == b"1"
+    assert cache.get("b", b"default") == b"default"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_pop_and_clear():
+    cache = LRUCache(10)
+    cache.set("a", b"12")
+    cache.set("b", b"12")
+    cache.pop("a")
+    cache.pop("missing")
+    assert "a" not in cache
+    assert cache.stats()["bytes"] == 2
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_lru_disabled():
+    cache = LRUCache(0)
+    assert not cache.enabled
+    cache.set("a", b"1")
+    assert cache.get("a") is None
+
+
+def test_disk_cache(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache"))
+    assert cache.get(("uuid", 1)) is None
+    cache.set(("uuid", 1), b"value")
+    assert cache.get(("uuid", 1)) == b"value"
+    # another process sees the same files
+    assert DiskCache(str(tmp_path / "cache")).get(("uuid", 1)) == b"value"
+
+
+def test_disk_cache_prune_removes_oldest(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    for i in range(4):
+        cache.set(i, b"1234")
+        os.utime(cache._fname(i), (i, i))
+    cache.prune()
+    assert [cache.get(i) for i in range(4)] == [None, None, b"1234", b"1234"]
+
+
+def test_disk_cache_prunes_every_interval(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10)
+    cache.prune_interval = 4
+    for i in range(4):
+        cache.set(i, b"1234")
+    assert sum(cache.get(i) is not None for i in range(4)) == 2
+
+
+def test_lru_over_disk_cache(tmp_path):
+    disk = DiskCache(str(tmp_path))
+    LRUCache(10, disk).set("a", b"12")
+    cache = LRUCache(10, disk)
+    assert cache.enabled
+    assert cache.get("a") == b"12"
+    assert cache.disk_hits == 1
+    # kept in memory after the first disk hit
+    assert "a" in cache
+    assert LRUCache(0, disk).get("a") == b"12"
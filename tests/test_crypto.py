@@ -0,0 +1,53 @@
+import random
+
+import pytest
+
+from flask_mdict.word_query.crypto import fast_decrypt
+
+
+def reference_decrypt(data, key):
+    """the byte loop fast_decrypt replaced"""
+    b = bytearray(data)
+    key = bytearray(key)
+    previous = 0x36
+    for i in range(len(b)):
+        t = (b[i] >> 4 | b[i] << 4) & 0xff
+        t = t ^ previous ^ (i & 0xff) ^ key[i % len(key)]
+        previous = b[i]
+        b[i] = t
+    return bytes(b)
+
+
+def random_bytes(rng, size):
+    return bytes(rng.getrandbits(8) for _ in range(size))
+
+
+def test_fast_decrypt_bytes():
+    # the previous byte is the encrypted one, the index is mixed in modulo 256
+    assert fast_decrypt(b"", b"k") == b""
+    assert fast_decrypt(b"\x12\x34", b"\x00") == b"\x17\x50"
+    assert fast_decrypt(b"\x00" * 257, b"\x00")[255:] == b"\xff\x00"
+
+
+def test_fast_decrypt_key_repeats():
+    data = bytes(range(40))
+    key = bytes([1, 2, 3])
+    assert fast_decrypt(data, key) == reference_decrypt(data, key)
+    assert fast_decrypt(data, key) != fast_decrypt(data, key + bytes([4]))
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 15, 16, 17, 255, 256, 257, 4096, 65537])
+def test_fast_decrypt_matches_loop(size):
+    rng = random.Random(size)
+    data = random_bytes(rng, size)
+    key = random_bytes(rng, rng.choice([1, 3, 16, 20, 33]))
+    assert fast_decrypt(data, key) == reference_decrypt(data, key)
+
+
+def test_fast_decrypt_bytearray():
+    rng = random.Random(0)
+    data = random_bytes(rng, 1000)
+    key = random_bytes(rng, 16)
+    result = fast_decrypt(bytearray(data), bytearray(key))
+    assert isinstance(result, bytes)
+    assert result == reference_decrypt(data, key)
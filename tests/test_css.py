@@ -0,0 +1,72 @@
+import pytest
+
+from flask_mdict.css import scope_css
+
+
+@pytest.mark.parametrize(
+    "css_data, scoped",
+    [
+        ("a { color: red }", "\n#P .mdict a { color: red }"),
+        ("a, b > c { x: 1 }", "\n#P .mdict a,#P .mdict b > c { x: 1 }"),
+        ("a{x:1}b{y:2}", "\n#P .mdict a {x:1}\n#P .mdict b {y:2}"),
+        # commas in brackets are part of one selector
+        (":is(a, b) {x:1}", "\n#P .mdict :is(a, b) {x:1}"),
+        (
+            'a[title="x, y {"] { content: "}" }',
+            '\n#P .mdict a[title="x, y {"] { content: "}" }',
+        ),
+        ("/* a { } */ b {x:1} /* end", "\n#P .mdict b {x:1} "),
+        ("a { x: 1 ", "\n#P .mdict a { x: 1 "),
+        ("", ""),
+    ],
+)
+def test_style_rules(css_data, scoped):
+    assert scope_css("#P", css_data) == scoped
+
+
+@pytest.mark.parametrize(
+    "css_data, scoped",
+    [
+        (
+            "@media (max-width: 600px) { a { x: 1 } b { y: 2 } }",
+            "@media (max-width: 600px) {\n#P .mdict a { x: 1 }\n#P .mdict b { y: 2 } }",
+        ),
+        (
+            "@supports (display: grid) { @media print { a {x:1} } }",
+            "@supports (display: grid) { @media print {\n#P .mdict a {x:1} } }",
+        ),
+        ("@MEDIA screen { a{x:1} }", "@MEDIA screen {\n#P .mdict a {x:1} }"),
+        (
+            "@-webkit-media screen { a{x:1} }",
+            "@-webkit-media screen {\n#P .mdict a {x:1} }",
+        ),
+    ],
+)
+def test_nested_at_rules(css_data, scoped):
+    assert scope_css("#P", css_data) == scoped
+
+
+@pytest.mark.parametrize(
+    "css_data",
+    [
+        "@font-face { font-family: x; src: url(a.woff) }",
+        "@keyframes k { from { x: 0 } to { x: 1 } }",
+        "@page { margin: 1cm }",
+        "@charset 'utf-8';",
+    ],
+)
+def test_other_at_rules_are_kept(css_data):
+    assert scope_css("#P", css_data) == css_data
+
+
+def test_statement_then_rule():
+    css_data = "@import url(a.css); a {x:1}"
+    assert scope_css("#P", css_data) == "@import url(a.css);\n#P .mdict a {x:1}"
+
+
+def test_block_with_data_url():
+    css_data = "a { background: url(data:image/png;base64,AA==) } b {x:1}"
+    assert scope_css("#P", css_data) == (
+        "\n#P .mdict a { background: url(data:image/png;base64,AA==) }"
+        "\n#P .mdict b {x:1}"
+    )
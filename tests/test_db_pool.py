@@ -0,0 +1,86 @@
+import sqlite3
+import threading
+
+import pytest
+
+from flask_mdict.db_pool import ConnectionPool, PoolTimeout
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    db_name = str(tmp_path / "index db.db")
+    with sqlite3.connect(db_name) as conn:
+        conn.execute("CREATE TABLE t (key text)")
+        conn.execute("INSERT INTO t VALUES ('a')")
+    return db_name
+
+
+def test_connections_are_reused(db_name):
+    pool = ConnectionPool(db_name, size=2)
+    with pool.connection() as conn:
+        assert conn.execute("SELECT key FROM t").fetchone()["key"] == "a"
+    with pool.connection() as conn2:
+        assert conn2 is conn
+    pool.close()
+
+
+def test_connections_are_read_only(db_name):
+    pool = ConnectionPool(db_name)
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO t VALUES ('b')")
+    pool.close()
+
+
+def test_size_bounds_open_connections(db_name):
+    pool = ConnectionPool(db_name, size=2, timeout=0.01)
+    first, second = pool.acquire(), pool.acquire()
+    assert first is not second
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    pool.release(second)
+    assert pool.acquire() is second
+    pool.close()
+
+
+def test_waits_for_a_release(db_name):
+    pool = ConnectionPool(db_name, size=1, timeout=10)
+    conn = pool.acquire()
+    timer = threading.Timer(0.05, pool.release, (conn,))
+    timer.start()
+    assert pool.acquire() is conn
+    timer.join()
+    pool.close()
+
+
+def test_timeout_is_an_operational_error(db_name):
+    # callers handling sqlite errors also handle a busy pool
+    pool = ConnectionPool(db_name, size=1, timeout=0)
+    pool.acquire()
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+
+
+def test_close(db_name):
+    pool = ConnectionPool(db_name, size=2)
+    idle, leased = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        idle.execute("SELECT 1")
+    # a leased connection is closed when it comes back
+    leased.execute("SELECT 1")
+    pool.release(leased)
+    with pytest.raises(sqlite3.ProgrammingError):
+        leased.execute("SELECT 1")
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.acquire()
+
+
+def test_failed_connect_frees_its_slot(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "missing.db"), size=1, timeout=0)
+    for _ in range(2):
+        # not PoolTimeout, the slot of the failed connection is free again
+        with pytest.raises(sqlite3.OperationalError) as info:
+            pool.acquire()
+        assert not isinstance(info.value, PoolTimeout)
@@ -0,0 +1,54 @@
+import sqlite3
+import zlib
+
+import pytest
+
+from flask_mdict.dbdict_query import DBDict
+from flask_mdict.word_query.mdict_query import fold_key
+
+
+entries = ["Apple", "Éclair", "eclair", "ÉCOLE", "banana", "Ｆｕｌｌ"]
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    db_name = str(tmp_path / "dict.db")
+    with sqlite3.connect(db_name) as conn:
+        conn.execute("CREATE TABLE meta (key text, value text)")
+        conn.execute("CREATE TABLE mdx (entry text, paraphrase blob)")
+        conn.executemany(
+            "INSERT INTO meta VALUES (?,?)", [("title", "DB"), ("zip", "1")]
+        )
+        conn.executemany(
+            "INSERT INTO mdx VALUES (?,?)",
+            [(entry, zlib.compress(entry.encode())) for entry in entries],
+        )
+    return db_name
+
+
+def sorted_keys(d):
+    try:
+        return list(d.get_sorted_keys())
+    finally:
+        d.close()
+
+
+@pytest.mark.parametrize("mode", ["case", "accent"])
+def test_sorted_keys_of_read_only_db(db_name, monkeypatch, mode):
+    migrated = sorted_keys(DBDict(db_name, key_fold=mode))
+    # entry_fold can not be written, keys are folded in python
+    monkeypatch.setattr(DBDict, "_migrate", lambda self, conn, table, key_fold: False)
+    d = DBDict(db_name, key_fold=mode)
+    assert d._key_fold is None
+    keys = sorted_keys(d)
+    assert keys == sorted((fold_key(entry, mode), entry) for entry in entries)
+    assert keys == migrated
+
+
+def test_db_without_mdd(db_name):
+    d = DBDict(db_name)
+    try:
+        assert not d.is_mdd()
+        assert not d.mdd_lookup(None, "\\pic.png")
+    finally:
+        d.close()
@@ -0,0 +1,68 @@
+import sqlite3
+import zlib
+
+import pytest
+
+from flask_mdict import Config, helper
+from flask_mdict.dbdict_query import DBDict
+
+
+entries = ["é", "e", "Straße"]
+
+
+@pytest.fixture
+def db_name(tmp_path):
+    db_name = str(tmp_path / "dict.db")
+    with sqlite3.connect(db_name) as conn:
+        conn.execute("CREATE TABLE meta (key text, value text)")
+        conn.execute("CREATE TABLE mdx (entry text, paraphrase blob)")
+        conn.executemany(
+            "INSERT INTO meta VALUES (?,?)", [("zip", "1"), ("encoding", "utf-8")]
+        )
+        conn.executemany(
+            "INSERT INTO mdx VALUES (?,?)",
+            [(entry, zlib.compress(entry.encode())) for entry in entries],
+        )
+    return db_name
+
+
+def lookup(d, word):
+    with d.get_pool().connection() as conn:
+        return d.mdx_lookup(conn, word)
+
+
+def page_key(monkeypatch, d, word, type="mdict_db"):
+    item = {"type": type, "enable": True, "ready": True, "query": d}
+    monkeypatch.setattr(Config, "MDICT", {"uuid": item}, raising=False)
+    return helper.page_cache_key(word, False, [], "http://localhost/")
+
+
+def test_page_cache_key_of_folded_db(db_name, monkeypatch):
+    d = DBDict(db_name, key_fold="accent")
+    try:
+        assert lookup(d, "E") == lookup(d, "é")
+        assert page_key(monkeypatch, d, "E") == page_key(monkeypatch, d, "é")
+        key = page_key(monkeypatch, d, "Straße")
+        assert page_key(monkeypatch, d, "STRASSE") == key
+    finally:
+        d.close()
+
+
+def test_page_cache_key_of_unfolded_db(db_name, monkeypatch):
+    # entry_fold can not be written, words are looked up with lower()
+    monkeypatch.setattr(DBDict, "_migrate", lambda self, conn, table, key_fold: False)
+    d = DBDict(db_name, key_fold="accent")
+    try:
+        assert lookup(d, "E") != lookup(d, "é")
+        assert page_key(monkeypatch, d, "E") != page_key(monkeypatch, d, "é")
+        key = page_key(monkeypatch, d, "Straße")
+        assert page_key(monkeypatch, d, "STRASSE") != key
+        assert page_key(monkeypatch, d, "É") == page_key(monkeypatch, d, "é")
+    finally:
+        d.close()
+
+
+def test_page_cache_key_of_app(monkeypatch):
+    assert page_key(monkeypatch, None, "Word", "app") != page_key(
+        monkeypatch, None, "word", "app"
+    )
@@ -0,0 +1,47 @@
+import pytest
+
+from flask_mdict.word_query.key_list import KeyList
+
+
+blocks = [
+    [(0, b"apple"), (10, b""), (25, "é".encode("utf-8"))],
+    [],
+    [(40, b"banana"), (2**64 - 1, b"last")],
+]
+pairs = [pair for block in blocks for pair in block]
+
+
+def test_pairs():
+    keys = KeyList(blocks)
+    assert len(keys) == 5
+    assert list(keys) == pairs
+    assert list(keys.keys()) == [key_text for _, key_text in pairs]
+
+
+def test_getitem():
+    keys = KeyList(blocks)
+    assert [keys[i] for i in range(len(keys))] == pairs
+    assert keys[-1] == (2**64 - 1, b"last")
+    assert keys[-5] == (0, b"apple")
+    with pytest.raises(IndexError):
+        keys[5]
+    with pytest.raises(IndexError):
+        keys[-6]
+
+
+def test_blocks_from_a_generator():
+    # as MDict reads key blocks, each block is a list
+    keys = KeyList(list(block) for block in blocks)
+    assert list(keys) == pairs
+
+
+def test_empty():
+    keys = KeyList()
+    assert len(keys) == 0
+    assert list(keys) == []
+    assert keys.nbytes() == 0
+
+
+def test_nbytes():
+    keys = KeyList(blocks)
+    assert keys.nbytes() == len(b"apple" + "é".encode("utf-8") + b"bananalast") + 16 * 5
@@ -0,0 +1,240 @@
+import random
+
+import pytest
+
+import old_lzo
+from flask_mdict.word_query import lzo
+
+
+class Stream:
+    """
+    LZO1X stream built one instruction at a time, with the output it
+    decompresses to. trail is the count of literals that follow a match.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.out = bytearray()
+        # state of the decoder: after a literal run, after trailing literals
+        self.after_run = False
+        self.after_trail = False
+
+    def _copy(self, length, dist):
+        for _ in range(length):
+            self.out.append(self.out[-dist])
+
+    def _length(self, length, bits):
+        """length field of bits, with extra zero bytes when it does not fit"""
+        if length < 1 << bits:
+            return bytes([length]), b""
+        n = length - (1 << bits) + 1
+        return b"\x00", b"\x00" * ((n - 1) // 255) + bytes([n - (n - 1) // 255 * 255])
+
+    def _trail(self, trail, literals):
+        assert len(literals) == trail and 0 <= trail <= 3
+        self.data += literals
+        self.out += literals
+        self.after_run = False
+        self.after_trail = trail > 0
+
+    def first_literals(self, literals):
+        assert not self.data and len(literals) <= 238
+        self.data.append(17 + len(literals))
+        self.data += literals
+        self.out += literals
+        self.after_run = len(literals) >= 4
+        self.after_trail = len(literals) < 4
+
+    def literals(self, literals):
+        assert not self.after_run and not self.after_trail and len(literals) >= 4
+        field, extra = self._length(len(literals) - 3, 4)
+        self.data += field + extra
+        self.data += literals
+        self.out += literals
+        self.after_run = True
+
+    def m1(self, dist, trail=0, literals=b""):
+        """2 bytes after trailing literals, 3 bytes 2049 back after a literal run"""
+        if self.after_run:
+            length, dist = 3, dist - 0x801
+        else:
+            assert self.after_trail
+            length, dist = 2, dist - 1
+        assert 0 <= dist < 1024
+        self.data += bytes([(dist & 3) << 2 | trail, dist >> 2])
+        self._copy(length, dist + (0x801 if length == 3 else 1))
+        self._trail(trail, literals)
+
+    def m2(self, length, dist, trail=0, literals=b""):
+        assert 3 <= length <= 8 and 1 <= dist <= 2048
+        dist -= 1
+        self.data += bytes([(length - 1) << 5 | (dist & 7) << 2 | trail, dist >> 3])
+        self._copy(length, dist + 1)
+        self._trail(trail, literals)
+
+    def m3(self, length, dist, trail=0, literals=b""):
+        assert length >= 3 and 1 <= dist <= 16384
+        field, extra = self._length(length - 2, 5)
+        self.data += bytes([32 | field[0]]) + extra
+        self.data += ((dist - 1) << 2 | trail).to_bytes(2, "little")
+        self._copy(length, dist)
+        self._trail(trail, literals)
+
+    def m4(self, length, dist, trail=0, literals=b""):
+        assert length >= 3 and 16385 <= dist <= 49151
+        dist -= 0x4000
+        field, extra = self._length(length - 2, 3)
+        self.data += bytes([16 | (dist >> 14 & 1) << 3 | field[0]]) + extra
+        self.data += ((dist & 0x3FFF) << 2 | trail).to_bytes(2, "little")
+        self._copy(length, dist + 0x4000)
+        self._trail(trail, literals)
+
+    def end(self):
+        self.data += b"\x11\x00\x00"
+        return bytes(self.data), bytes(self.out)
+
+
+def check(stream, size=None):
+    data, out = stream.end()
+    size = len(out) if size is None else size
+    assert lzo.decompress(data, size) == out
+    assert old_lzo.decompress(data, size) == out
+    return out
+
+
+@pytest.mark.parametrize("size", [1, 3, 4, 238])
+def test_first_literals(size):
+    s = Stream()
+    s.first_literals(bytes(range(size)))
+    check(s)
+
+
+@pytest.mark.parametrize("size", [4, 18, 19, 273, 274, 1000])
+def test_literal_run(size):
+    s = Stream()
+    s.literals(bytes(i & 0xFF for i in range(size)))
+    check(s)
+
+
+@pytest.mark.parametrize("length", range(3, 9))
+@pytest.mark.parametrize("dist", [1, 2, 7, 8, 9, 100])
+def test_m2(length, dist):
+    s = Stream()
+    s.literals(bytes(range(100)))
+    s.m2(length, dist)
+    check(s)
+
+
+@pytest.mark.parametrize("length", [3, 33, 34, 288, 289, 1000])
+@pytest.mark.parametrize("dist", [1, 3, 200, 300])
+def test_m3(length, dist):
+    s = Stream()
+    s.literals(bytes(i & 0xFF for i in range(300)))
+    s.m3(length, dist)
+    check(s)
+
+
+@pytest.mark.parametrize("length", [3, 9, 10, 300])
+@pytest.mark.parametrize("dist", [16385, 20000, 40000])
+def test_m4(length, dist):
+    rng = random.Random(dist)
+    s = Stream()
+    s.literals(bytes(rng.getrandbits(8) for _ in range(40000)))
+    s.m4(length, dist)
+    check(s)
+
+
+@pytest.mark.parametrize("dist", [1, 2, 5, 1024])
+def test_m1_after_trailing_literals(dist):
+    s = Stream()
+    s.literals(bytes(range(200)) * 6)
+    s.m2(4, 10, 2, b"ab")
+    s.m1(dist, 1, b"c")
+    s.m1(dist)
+    check(s)
+
+
+@pytest.mark.parametrize("dist", [0x801, 0x900, 0x801 + 1023])
+def test_m1_after_literal_run(dist):
+    s = Stream()
+    s.literals(bytes(i & 0xFF for i in range(4000)))
+    s.m1(dist, 3, b"xyz")
+    check(s)
+
+
+def test_first_literals_then_match():
+    # fewer than 4 first literals are trailing literals of no match
+    s = Stream()
+    s.first_literals(b"ab")
+    s.m1(2)
+    s.m2(8, 1, 1, b"c")
+    check(s)
+
+
+@pytest.mark.parametrize("trail", [1, 2, 3])
+def test_trailing_literals(trail):
+    literals = b"xyz"[:trail]
+    s = Stream()
+    s.literals(b"abcdefgh")
+    s.m2(5, 3, trail, literals)
+    s.m3(40, 7, trail, literals)
+    s.m1(4, trail, literals)
+    s.m3(3, 1)
+    s.literals(b"ijklm")
+    check(s)
+
+
+@pytest.mark.parametrize("dist", [1, 2, 3, 5])
+def test_overlapping_matches(dist):
+    s = Stream()
+    s.literals(b"abcde")
+    s.m3(500, dist)
+    s.m2(8, dist)
+    out = check(s)
+    assert out == b"abcde" + (b"abcde"[-dist:] * 600)[:508]
+
+
+def test_end_of_stream_before_size():
+    s = Stream()
+    s.literals(b"abcdefgh")
+    data, out = s.end()
+    assert lzo.decompress(data, 100) == out
+    assert old_lzo.decompress(data, 100) == out
+
+
+def test_lookbehind_overrun():
+    # a match 16 bytes back after 4 bytes of output
+    match = bytes([32 | 1]) + (15 << 2).to_bytes(2, "little")
+    data = b"\x15abcd" + match + b"\x11\x00\x00"
+    with pytest.raises(ValueError):
+        lzo.decompress(data, 100)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_streams(seed):
+    rng = random.Random(seed)
+    s = Stream()
+    s.literals(bytes(rng.getrandbits(8) for _ in range(rng.randrange(4, 300))))
+    while len(s.out) < 60000:
+        kind = rng.choice(["m1", "m2", "m3", "m4", "literals"])
+        trail = rng.randrange(4)
+        literals = bytes(rng.getrandbits(8) for _ in range(trail))
+        if kind == "literals":
+            if s.after_run or s.after_trail:
+                continue
+            s.literals(bytes(rng.getrandbits(8) for _ in range(rng.randrange(4, 600))))
+        elif kind == "m1":
+            if s.after_run and len(s.out) >= 0x801 + 1023:
+                s.m1(rng.randrange(0x801, 0x801 + 1024), trail, literals)
+            elif s.after_trail:
+                s.m1(rng.randrange(1, min(len(s.out), 1024) + 1), trail, literals)
+        elif kind == "m2":
+            dist = rng.randrange(1, min(len(s.out), 2048) + 1)
+            s.m2(rng.randrange(3, 9), dist, trail, literals)
+        elif kind == "m3":
+            dist = rng.randrange(1, min(len(s.out), 16384) + 1)
+            s.m3(rng.randrange(3, 600), dist, trail, literals)
+        elif len(s.out) > 16384:
+            dist = rng.randrange(16385, min(len(s.out), 49151) + 1)
+            s.m4(rng.randrange(3, 600), dist, trail, literals)
+    check(s)
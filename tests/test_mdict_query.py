@@ -0,0 +1,91 @@
+import random
+import re
+
+import pytest
+
+from flask_mdict.word_query.mdict_query import IndexBuilder
+
+
+def reference_replace_stylesheet(stylesheet, txt):
+    """_replace_stylesheet before the single pass rewrite"""
+    txt_list = re.split(b'`\\d+`', txt)
+    txt_tag = re.findall(b'`\\d+`', txt)
+    txt_styled = txt_list[0]
+    for j, p in enumerate(txt_list[1:]):
+        style = stylesheet[txt_tag[j][1:-1]]
+        if p and p[-1] == b'\n':
+            txt_styled = txt_styled + style[0] + p.rstrip() + style[1] + b'\r\n'
+        else:
+            txt_styled = txt_styled + style[0] + p + style[1]
+    return txt_styled
+
+
+def builder(stylesheet):
+    # only the stylesheet is needed, no mdx file is opened
+    idx = IndexBuilder.__new__(IndexBuilder)
+    idx._stylesheet = stylesheet
+    return idx
+
+
+stylesheet = {
+    str(i).encode(): (b'<span class="s%d">' % i, b'</span>') for i in range(1, 31)
+}
+stylesheet[b'7'] = (b'', b'')
+atoms = [
+    b'text ', b'\n', b'`', b'`1`', b'`7`', b'`30`', b'`12`', b'x`3', b'\r\n',
+    b'\xc3\xa9', b'',
+]
+
+
+@pytest.mark.parametrize('txt, styled', [
+    (b'plain', b'plain'),
+    (b'a`b', b'a`b'),
+    (b'`1`bold', b'<b>bold</b>'),
+    # a style ends at the next tag or the end of the record, newlines included
+    (b'`1`a\n`1`b', b'<b>a\n</b><b>b</b>'),
+    (b'pre`1`', b'pre<b></b>'),
+    (b'`1``1`a', b'<b></b><b>a</b>'),
+    (b'`2`x', b'x'),
+])
+def test_replace_stylesheet(txt, styled):
+    idx = builder({b'1': (b'<b>', b'</b>'), b'2': (b'', b'')})
+    assert idx._replace_stylesheet(txt) == styled
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_replace_stylesheet_matches_reference(seed):
+    rng = random.Random(seed)
+    idx = builder(stylesheet)
+    for _ in range(1000):
+        txt = b''.join(rng.choice(atoms) for _ in range(rng.randint(0, 20)))
+        expected = reference_replace_stylesheet(stylesheet, txt)
+        assert idx._replace_stylesheet(txt) == expected, txt
+
+
+def test_replace_stylesheet_long_record():
+    rng = random.Random(0)
+    txt = b''.join(
+        b'`%d`sense %d definition text\n' % (rng.randint(1, 30), i)
+        for i in range(1000)
+    )
+    expected = reference_replace_stylesheet(stylesheet, txt)
+    assert builder(stylesheet)._replace_stylesheet(txt) == expected
+
+
+def test_replace_stylesheet_str_stylesheet():
+    # the stylesheet of an mdx header has str numbers and styles
+    idx = builder({'1': ('<b>', '</b>'), '2': ('<i>é', '</i>')})
+    txt = b'`1`bold`2`italic'
+    assert idx._replace_stylesheet(txt) == '<b>bold</b><i>éitalic</i>'.encode()
+
+
+def test_replace_stylesheet_unknown_style():
+    with pytest.raises(KeyError):
+        builder(stylesheet)._replace_stylesheet(b'`99`text')
+
+
+def test_replace_stylesheet_changed_stylesheet():
+    idx = builder({b'1': (b'<b>', b'</b>')})
+    assert idx._replace_stylesheet(b'`1`a') == b'<b>a</b>'
+    idx._stylesheet = {b'1': (b'<i>', b'</i>')}
+    assert idx._replace_stylesheet(b'`1`a') == b'<i>a</i>'
@@ -0,0 +1,129 @@
+import pytest
+
+import mdict_writer
+from flask_mdict.mdict_query2 import IndexBuilder2
+from flask_mdict.utils import fix_html
+
+
+entries = [
+    ("apple", b"<b>apple</b> a fruit"),
+    ("banana", b"yellow"),
+    ("cherry", b"red"),
+    ("date", b"sweet"),
+    ("fig", b"soft"),
+    ("grape", b"vine"),
+]
+passcode_key = bytes(range(16))
+passcode = (mdict_writer.regcode(passcode_key, "user"), "user")
+
+
+def lookup_all(mdx_file, index_dir, **kwargs):
+    idx = IndexBuilder2(mdx_file, index_dir=str(index_dir), **kwargs)
+    try:
+        return [idx.mdx_lookup(None, key) for key, _ in entries]
+    finally:
+        idx.close()
+
+
+expected = [[value.decode()] for _, value in entries]
+
+
+@pytest.mark.parametrize("version", [1.2, 2.0])
+@pytest.mark.parametrize("encryption", [1, 2])
+def test_passcode_encrypted_records(tmp_path, version, encryption):
+    mdx_file = mdict_writer.write(
+        str(tmp_path / "enc.mdx"),
+        entries,
+        version=version,
+        record_encryption=encryption,
+        passcode_key=passcode_key,
+    )
+    # built, then loaded from the existing index db
+    assert lookup_all(mdx_file, tmp_path, passcode=passcode) == expected
+    assert lookup_all(mdx_file, tmp_path, passcode=passcode) == expected
+
+
+@pytest.mark.parametrize("encryption", [1, 2])
+def test_checksum_encrypted_records(tmp_path, encryption):
+    mdx_file = mdict_writer.write(
+        str(tmp_path / "enc.mdx"), entries, record_encryption=encryption
+    )
+    assert lookup_all(mdx_file, tmp_path) == expected
+
+
+def test_encrypted_key_by_file(tmp_path):
+    mdx_file = mdict_writer.write(
+        str(tmp_path / "enc.mdx"),
+        entries,
+        record_encryption=2,
+        passcode_key=passcode_key,
+    )
+    plain_file = mdict_writer.write(str(tmp_path / "plain.mdx"), entries)
+    idx = IndexBuilder2(mdx_file, index_dir=str(tmp_path), passcode=passcode)
+    try:
+        assert idx._encrypted_key(mdx_file) == passcode_key
+    finally:
+        idx.close()
+    idx = IndexBuilder2(plain_file, index_dir=str(tmp_path))
+    try:
+        assert idx._encrypted_key(plain_file) is None
+    finally:
+        idx.close()
+
+
+prerender_entries = [
+    ("a-b", b"dash"),
+    ("Apple", b"<b>unclosed"),
+    ("apple", b"second"),
+    ("banana", b"x</i>"),
+    ("cherry", b"red " * 100),
+    ("date", b"<div>sweet</div>"),
+]
+
+
+def lookup_words(idx, words):
+    return (
+        [idx.mdx_lookup(None, word, ignorecase=True) for word in words],
+        idx.mdx_lookup_many(None, words, ignorecase=True),
+    )
+
+
+@pytest.mark.parametrize("compression", [0, 1, 2])
+def test_prerender_same_lookups(tmp_path, monkeypatch, compression):
+    # several small RECORD_BLOCKs
+    monkeypatch.setattr(IndexBuilder2, "_prerender_block_size", 64)
+    mdx_file = mdict_writer.write(
+        str(tmp_path / "dict.mdx"), prerender_entries, compression=compression
+    )
+    words = ["APPLE", "a b", "a-b", "banana", "cherry", "date", "missing"]
+    (tmp_path / "normal").mkdir()
+    (tmp_path / "pre").mkdir()
+    idx = IndexBuilder2(mdx_file, index_dir=str(tmp_path / "normal"))
+    try:
+        assert not idx.prerendered
+        records, many = lookup_words(idx, words)
+    finally:
+        idx.close()
+    # the /query page fixes the html of records that are not prerendered
+    records = [[fix_html(record) for record in found] for found in records]
+    many = [[fix_html(record) for record in found] for found in many]
+    idx = IndexBuilder2(mdx_file, index_dir=str(tmp_path / "pre"), prerender=True)
+    try:
+        assert idx.prerendered
+        assert lookup_words(idx, words) == (records, many)
+    finally:
+        idx.close()
+    assert records[0] == ["<b>unclosed</b>", "second"]
+    assert records[-1] == []
+
+
+def test_prerender_mode_change_rebuilds(tmp_path):
+    mdx_file = mdict_writer.write(str(tmp_path / "dict.mdx"), prerender_entries)
+    for prerender in [False, True, False]:
+        idx = IndexBuilder2(mdx_file, index_dir=str(tmp_path), prerender=prerender)
+        try:
+            assert idx.prerendered == prerender
+            record = "<i>x</i>" if prerender else "x</i>"
+            assert idx.mdx_lookup(None, "banana") == [record]
+        finally:
+            idx.close()
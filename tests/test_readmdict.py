@@ -0,0 +1,128 @@
+from struct import pack, unpack
+
+import pytest
+
+from flask_mdict.word_query.readmdict import MDict
+
+
+def reference_split_key_block(self, key_block):
+    """the loop _split_key_block replaced, one byte or utf-16 pair at a time"""
+    key_list = []
+    key_start_index = 0
+    while key_start_index < len(key_block):
+        key_id = unpack(
+            self._number_format,
+            key_block[key_start_index : key_start_index + self._number_width],
+        )[0]
+        if self._encoding == "UTF-16":
+            delimiter = b"\x00\x00"
+            width = 2
+        else:
+            delimiter = b"\x00"
+            width = 1
+        i = key_start_index + self._number_width
+        while i < len(key_block):
+            if key_block[i : i + width] == delimiter:
+                key_end_index = i
+                break
+            i += width
+        key_text = (
+            key_block[key_start_index + self._number_width : key_end_index]
+            .decode(self._encoding, errors="ignore")
+            .encode("utf-8")
+            .strip()
+        )
+        key_start_index = key_end_index + width
+        key_list += [(key_id, key_text)]
+    return key_list
+
+
+def key_reader(encoding, number_width=8):
+    # only the attributes used to split key blocks, no file is read
+    mdict = MDict.__new__(MDict)
+    mdict._encoding = encoding
+    mdict._number_width = number_width
+    mdict._number_format = ">Q" if number_width == 8 else ">I"
+    return mdict
+
+
+def key_block(mdict, texts):
+    """key block of encoded key texts, each with its terminator"""
+    delimiter = b"\x00\x00" if mdict._encoding == "UTF-16" else b"\x00"
+    number_format = mdict._number_format
+    return b"".join(
+        pack(number_format, i * 10) + text + delimiter for i, text in enumerate(texts)
+    )
+
+
+def split(mdict, block):
+    keys = mdict._split_key_block(block)
+    assert keys == reference_split_key_block(mdict, block)
+    return keys
+
+
+@pytest.mark.parametrize("number_width", [4, 8])
+def test_utf8(number_width):
+    mdict = key_reader("UTF-8", number_width)
+    keys = ["apple", "", " spaced ", "café", "日本語", "emoji \U0001f600"]
+    block = key_block(mdict, [key.encode("utf-8") for key in keys])
+    assert split(mdict, block) == [
+        (i * 10, key.strip().encode("utf-8")) for i, key in enumerate(keys)
+    ]
+
+
+def test_utf8_invalid_bytes():
+    mdict = key_reader("UTF-8")
+    texts = [b"ok", b"bad \xff key", b"cut \xe6\x97", b"\x80", b"after"]
+    keys = split(mdict, key_block(mdict, texts))
+    assert [key for _, key in keys] == [b"ok", b"bad  key", b"cut", b"", b"after"]
+
+
+def test_utf16():
+    mdict = key_reader("UTF-16")
+    keys = ["apple", "", "café", "日本語", "emoji \U0001f600"]
+    block = key_block(mdict, [key.encode("utf-16-le") for key in keys])
+    assert split(mdict, block) == [
+        (i * 10, key.encode("utf-8")) for i, key in enumerate(keys)
+    ]
+
+
+def test_utf16_zero_bytes_across_code_units():
+    # "A" is 41 00 and "Ā" is 00 01, so their 00 00 is not a terminator
+    mdict = key_reader("UTF-16")
+    keys = ["AĀ", "ĀA", "AAĀĀ", "ȀĀA"]
+    block = key_block(mdict, [key.encode("utf-16-le") for key in keys])
+    assert b"\x41\x00\x00\x01" in block
+    assert [key for _, key in split(mdict, block)] == [
+        key.encode("utf-8") for key in keys
+    ]
+
+
+def test_utf16_byte_order_mark():
+    mdict = key_reader("UTF-16")
+    texts = [b"\xff\xfe" + "bom".encode("utf-16-le"), "plain".encode("utf-16-le")]
+    split(mdict, key_block(mdict, texts))
+
+
+def test_mixed_terminators():
+    # single zero bytes of utf-16 code units between terminators of 2 and 4 zero bytes
+    mdict = key_reader("UTF-16")
+    texts = [b"a\x00", b"", b"\x00\x01", b"b\x00\x00\x01", b"\x00\x01\x00\x01c\x00"]
+    keys = split(mdict, key_block(mdict, texts))
+    assert [key for _, key in keys] == [
+        b"a",
+        b"",
+        "Ā".encode("utf-8"),
+        "bĀ".encode("utf-8"),
+        "ĀĀc".encode("utf-8"),
+    ]
+
+
+@pytest.mark.parametrize("encoding", ["UTF-8", "UTF-16"])
+def test_missing_final_terminator(encoding):
+    # the previous loop never ended here, the last key runs to the end of the block
+    mdict = key_reader(encoding)
+    codec = "utf-16-le" if encoding == "UTF-16" else "utf-8"
+    block = key_block(mdict, ["first".encode(codec)]) + pack(">Q", 10)
+    block += "last".encode(codec)
+    assert mdict._split_key_block(block) == [(0, b"first"), (10, b"last")]
@@ -0,0 +1,172 @@
+import os
+import random
+import re
+import urllib.parse
+
+import pytest
+from flask import Flask, url_for
+
+from flask_mdict import mdict, rewrite
+
+
+data_dir = os.path.join(os.path.dirname(__file__), "data")
+record_separator = "<!-- record -->\n"
+
+# the record regexes and url replacement of views.render_word before they
+# moved to rewrite.py, kept as the reference of the rewritten output
+regex_src_schema = re.compile(r'([ "]src=["\'])(/|file:///)?(?!data:)(.+?["\'])')
+regex_href_end_slash = re.compile(r'([ "]href=["\'].+?)(/)(["\'])')
+regex_href_no_schema = re.compile(
+    r'([ "]href=["\'])(?!http://|https://|sound://|entry://)([^#].+?["\'])'
+)
+regex_css = re.compile(r'(<link.*? )(href)(=".+?>)')
+regex_js = re.compile(r'(<script.*? )(src)(=".+?>)')
+
+
+def reference_record(record, prefix_resource, keep_css, keep_js):
+    record = regex_href_end_slash.sub(r"\1\3", record)
+    record = regex_src_schema.sub(r"\g<1>%s/\3" % prefix_resource, record)
+    record = regex_href_no_schema.sub(r"\g<1>%s/\2" % prefix_resource, record)
+    if not keep_css:
+        record = regex_css.sub(r"\1data-\2\3", record)
+    if not keep_js:
+        record = regex_js.sub(r"\1data-\2\3", record)
+    return record
+
+
+def reference_links(html, uuid, scheme):
+    def url_replace(mo):
+        abs_url = mo.group(2)
+        abs_url = urllib.parse.unquote(abs_url)
+        if abs_url.startswith("sound://"):
+            sound_url = url_for(
+                ".query_resource",
+                uuid=uuid,
+                resource=abs_url[8:],
+                _external=True,
+                _scheme=scheme,
+            )
+            return (
+                f' data-sound-url="{sound_url}"' + mo.group(1) + abs_url + mo.group(3)
+            )
+        elif abs_url.startswith("entry://"):
+            entry_url = url_for(
+                ".query_word_lite",
+                uuid=uuid,
+                word=abs_url[8:],
+                _external=True,
+                _scheme=scheme,
+            )
+            return (
+                f' data-entry-url="{entry_url}"' + mo.group(1) + abs_url + mo.group(3)
+            )
+        elif abs_url.startswith("/static/"):
+            abs_url2 = url_for(
+                "static", filename=abs_url[8:], _external=True, _scheme=scheme
+            )
+        else:
+            abs_url2 = re.sub(r"(?<!:)//", "/", abs_url)
+        return mo.group(1) + abs_url2 + mo.group(3)
+
+    html = re.sub(r'( href=")(.+?)(")', url_replace, html)
+    html = re.sub(r'( src=")(?!data:)(.+?)(")', url_replace, html)
+    return html
+
+
+def reference_page(records, prefix_resource):
+    html = []
+    for count, record in enumerate(records, 1):
+        keep_css, keep_js = count == 1, count >= len(records)
+        html.append(reference_record(record, prefix_resource, keep_css, keep_js))
+    return reference_links("\n".join(html), "all", "https")
+
+
+def rewrite_page(records, prefix_resource):
+    urls = rewrite.PageUrls("all", "https")
+    html = []
+    for count, record in enumerate(records, 1):
+        keep_css, keep_js = count == 1, count >= len(records)
+        html.append(
+            rewrite.rewrite_record(record, prefix_resource, keep_css, keep_js)
+        )
+    return rewrite.rewrite_links("\n".join(html), urls)
+
+
+@pytest.fixture
+def request_context():
+    app = Flask(__name__)
+    app.register_blueprint(mdict, url_prefix="/")
+    with app.test_request_context("/", base_url="http://localhost:5000"):
+        yield url_for(".query_resource", uuid="DICT", resource="", _external=True)
+
+
+def read(name):
+    with open(os.path.join(data_dir, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def test_golden_page(request_context):
+    records = read("rewrite_records.html").split(record_separator)
+    expected = read("rewrite_page.html")
+    assert reference_page(records, request_context) == expected
+    assert rewrite_page(records, request_context) == expected
+
+
+resource_url = "http://localhost:5000/uuid_DICT/resource/"
+
+
+@pytest.mark.parametrize(
+    "record, page",
+    [
+        ('<img src="a b.png">', '<img src="%sa b.png">' % resource_url),
+        ('<img src="file:///c.png">', '<img src="%sc.png">' % resource_url),
+        ('<img src="data:image/png,x">', '<img src="data:image/png,x">'),
+        (
+            '<a href="sound://a b.mp3">',
+            '<a data-sound-url="https://localhost:5000/uuid_all/resource/a%20b.mp3"'
+            ' href="sound://a b.mp3">',
+        ),
+        (
+            '<a href="entry://go%20on">',
+            '<a data-entry-url="https://localhost:5000/query?uuid=all&word=go+on"'
+            ' href="entry://go on">',
+        ),
+        ('<a href="http://x.org/">', '<a href="http://x.org">'),
+        ('<a href="#top">', '<a href="#top">'),
+    ],
+)
+def test_links(request_context, record, page):
+    assert rewrite_page([record], request_context) == page
+
+
+def test_css_of_first_and_js_of_last_record(request_context):
+    records = ['<link href="a.css"><script src="a.js">'] * 3
+    pages = rewrite_page(records, request_context).split("\n")
+    css = '<link href="%sa.css">' % resource_url
+    js = '<script src="%sa.js">' % resource_url
+    # data- links are left as the record rewrote them
+    dropped_css = '<link data-href="%s/a.css">' % resource_url
+    dropped_js = '<script data-src="%s/a.js">' % resource_url
+    assert pages == [css + dropped_js, dropped_css + dropped_js, dropped_css + js]
+
+
+atoms = [
+    ' href="', ' src="', '"href="', '"src="', " href='", " src='", '"', "'",
+    "/", "//", "sound://", "entry://", "http://", "https://", "file:///",
+    "data:", "/static/", "#", " ", "\n", "a", "b.png", "é", "中", "%20", "%2F",
+    "+", "&", "?", "=", "<link ", "<script ", ">", "x y", "%C3%A9", ":", ";",
+    "<a", "<img", "src=", "href=",
+]  # fmt: skip
+
+
+def random_record(rng):
+    return "".join(rng.choice(atoms) for _ in range(rng.randint(1, 60)))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_random_pages(request_context, seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        records = [random_record(rng) for _ in range(rng.randint(1, 4))]
+        expected = reference_page(records, request_context)
+        assert rewrite_page(records, request_context) == expected, records
@@ -0,0 +1,77 @@
+import pytest
+
+from flask_mdict.suggest import KeyIndex, suggest
+
+
+def key_index(keys):
+    return KeyIndex(sorted((key.lower(), key) for key in keys))
+
+
+words = key_index(["Apple", "apple", "applet", "apply", "banana", "ape", "école"])
+
+
+def test_prefix():
+    assert list(words.iter_prefix("app")) == [
+        ("apple", "Apple"),
+        ("apple", "apple"),
+        ("applet", "applet"),
+        ("apply", "apply"),
+    ]
+    assert list(words.iter_prefix("apples")) == []
+    assert list(words.iter_prefix("c")) == []
+
+
+def test_empty_prefix():
+    assert len(list(words.iter_prefix(""))) == len(words) == 7
+
+
+def test_prefix_range():
+    assert words.prefix_range("ap") == (0, 5)
+    assert words.prefix_range("b") == (5, 6)
+    # é sorts after z
+    assert words.prefix_range("z") == (6, 6)
+
+
+def test_non_ascii():
+    index = key_index(["école", "écran", "eclair", "日本", "日本語", "\U0001f600 x"])
+    assert [key for _, key in index.iter_prefix("éc")] == ["école", "écran"]
+    assert [key for _, key in index.iter_prefix("日本")] == ["日本", "日本語"]
+    assert [key for _, key in index.iter_prefix("\U0001f600")] == ["\U0001f600 x"]
+
+
+def test_lone_surrogate():
+    index = key_index(["a\udcff", "ab"])
+    assert [key for _, key in index.iter_prefix("a")] == ["ab", "a\udcff"]
+
+
+def test_suggest_merges_and_drops_duplicates():
+    other = key_index(["apple", "Apricot", "apply"])
+    assert suggest([words, other], "ap") == [
+        "ape",
+        "Apple",
+        "apple",
+        "applet",
+        "apply",
+        "Apricot",
+    ]
+
+
+@pytest.mark.parametrize(
+    "limit, offset, keys",
+    [
+        (None, 0, ["Apple", "apple", "applet", "apply"]),
+        (2, 0, ["Apple", "apple"]),
+        (2, 1, ["apple", "applet"]),
+        (10, 3, ["apply"]),
+        (2, 10, []),
+        # no limit
+        (0, 1, ["apple", "applet", "apply"]),
+        (-1, 2, ["applet", "apply"]),
+    ],
+)
+def test_suggest_limit_and_offset(limit, offset, keys):
+    assert suggest([words], "app", limit, offset) == keys
+
+
+def test_suggest_without_indexes():
+    assert suggest([], "a") == []
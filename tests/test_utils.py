@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from flask_mdict.utils import fix_html, regex_opened_tag, regex_closed_tag
+
+
+def reference_fix_html(html_data):
+    """fix_html before the linear rewrite"""
+    opened_tags = regex_opened_tag.findall(html_data)
+    closed_tags = regex_closed_tag.findall(html_data)
+    opened_tags = [tag.lower() for tag in opened_tags]
+    closed_tags = [tag.lower() for tag in closed_tags]
+    # remove single tag
+    for tag in ["img", "link", "input", "br", "hr", "p", "meta"]:
+        while tag in opened_tags:
+            opened_tags.remove(tag)
+        while tag in closed_tags:
+            closed_tags.remove(tag)
+    if len(opened_tags) == len(closed_tags):
+        return html_data
+    for tag in opened_tags[::-1]:
+        if tag in closed_tags:
+            closed_tags.remove(tag)
+        else:
+            html_data += "</%s>" % tag
+    for tag in closed_tags:
+        html_data = "<%s>" % tag + html_data
+    return html_data
+
+
+tags = ["b", "i", "div", "span", "p", "br", "img", "B", "DIV", "a", "font", "hr"]
+forms = ["<%s>", "</%s>", '<%s class="x">', "text ", "<%s\n>", "</%s >"]
+
+
+@pytest.mark.parametrize(
+    "html_data, fixed",
+    [
+        ("<b>bold</b>", "<b>bold</b>"),
+        ("<div><span>text", "<div><span>text</span></div>"),
+        ("text</i></b>", "<b><i>text</i></b>"),
+        ("<p>one<br><img src=x>", "<p>one<br><img src=x>"),
+        ("<DIV>a</div><div>", "<DIV>a</div><div></div>"),
+        # tags are matched case insensitively, added ones are lower case
+        ("<B>x</b>", "<B>x</b>"),
+        ("x</SPAN>", "<span>x</SPAN>"),
+        ('<span class="a">x', '<span class="a">x</span>'),
+        # a misnested page is balanced by counts, not repaired
+        ("<div><b>x</div>", "<div><b>x</div></b>"),
+        ("</div></b>x", "<b><div></div></b>x"),
+        ("<br><hr><img src=x><p>x", "<br><hr><img src=x><p>x"),
+        ("", ""),
+    ],
+)
+def test_fix_html(html_data, fixed):
+    assert fix_html(html_data) == fixed
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_fix_html_matches_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(1000):
+        parts = []
+        for _ in range(rng.randint(0, 15)):
+            parts.append(rng.choice(forms).replace("%s", rng.choice(tags)))
+        html_data = "".join(parts)
+        assert fix_html(html_data) == reference_fix_html(html_data), html_data
+
+
+def test_fix_html_many_senses():
+    sense = (
+        '<div class="sense"><span class="num">%d</span><b>def</b> <i>ex</i>'
+        '<br><p>text<div class="ex"><span>e</span></div></div>'
+    )
+    html_data = "</i></span>" + "".join(sense % i for i in range(300))
+    html_data += "<div><span><b>"
+    assert fix_html(html_data) == reference_fix_html(html_data)